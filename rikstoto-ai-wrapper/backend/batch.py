@@ -0,0 +1,331 @@
+"""
+Batch generation jobs for offline evaluation.
+
+An evaluation run (see EVALUATION_REPORT.md) sends hundreds of coupons to
+every model. Instead of a client looping over /generate-all, a batch job
+takes the whole list at once and works through it in the background:
+
+    queued:    Stored, waiting to start
+    running:   Coupons are being generated, ``BATCH_CONCURRENCY`` at a time
+    completed: Every coupon has a result line
+    failed:    The job stopped on an unexpected error (see ``error``)
+    cancelled: Stopped on request; finished coupons are kept
+
+Jobs and one result line per finished coupon are stored in a SQLite file,
+so progress survives a restart: unfinished jobs are resumed at startup
+and only the coupons without a result line are generated again. Results
+are downloaded as JSONL, also while the job is still running.
+
+Model calls go through the shared generation scheduler under the job's ID,
+so a batch gets one round-robin share of each provider's slots and cannot
+starve interactive /generate and /generate-all requests.
+
+Configuration via environment variables:
+    BATCH_DB_PATH: SQLite file jobs and results are kept in (default: batch_jobs.sqlite3)
+    BATCH_CONCURRENCY: Coupons of one job generated at a time (default: 4)
+    BATCH_MAX_ITEMS: Max coupons per job (default: 1000)
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+# Result lines read per database round trip when downloading
+RESULTS_PAGE_SIZE = 200
+
+
+class BatchJobStore:
+    """Jobs and their result lines in a SQLite file.
+
+    Like the SQLite cache backend, the file is opened in WAL mode and every
+    call runs in a worker thread to keep the event loop free. The file is
+    only opened on first use, so importing the app creates nothing on disk.
+
+    Args:
+        path: SQLite database file
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        # Only used under self._lock, so the file is opened once
+        if self._connection is None:
+            self._connection = self._connect()
+        return self._connection
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=10)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS batch_jobs ("
+            " id TEXT PRIMARY KEY, status TEXT NOT NULL, spec TEXT NOT NULL,"
+            " total_items INTEGER NOT NULL, completed_items INTEGER NOT NULL DEFAULT 0,"
+            " successful INTEGER NOT NULL DEFAULT 0, failed INTEGER NOT NULL DEFAULT 0,"
+            " error TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS batch_items ("
+            " job_id TEXT NOT NULL, item_index INTEGER NOT NULL, item TEXT NOT NULL,"
+            " PRIMARY KEY (job_id, item_index))"
+        )
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS batch_results ("
+            " job_id TEXT NOT NULL, item_index INTEGER NOT NULL, line TEXT NOT NULL,"
+            " PRIMARY KEY (job_id, item_index))"
+        )
+        return db
+
+    def _create(self, job_id: str, spec: Dict[str, Any], items: List[Dict[str, Any]]) -> None:
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute(
+                    "INSERT INTO batch_jobs (id, status, spec, total_items, created_at, updated_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (job_id, QUEUED, json.dumps(spec, ensure_ascii=False), len(items), now, now)
+                )
+                self._db.executemany(
+                    "INSERT INTO batch_items (job_id, item_index, item) VALUES (?, ?, ?)",
+                    ((job_id, index, json.dumps(item, ensure_ascii=False)) for index, item in enumerate(items))
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def _item(self, job_id: str, item_index: int) -> Dict[str, Any]:
+        with self._lock:
+            row = self._db.execute("SELECT item FROM batch_items WHERE job_id = ? AND item_index = ?",
+                                   (job_id, item_index)).fetchone()
+        return json.loads(row[0])
+
+    def _record_item(self, job_id: str, item_index: int, line: Dict[str, Any],
+                     successful: int, failed: int) -> None:
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = self._db.execute(
+                    "INSERT OR IGNORE INTO batch_results (job_id, item_index, line) VALUES (?, ?, ?)",
+                    (job_id, item_index, json.dumps(line, ensure_ascii=False, default=str))
+                )
+                # Count an item once, even if it was generated again after a restart
+                if cursor.rowcount:
+                    self._db.execute(
+                        "UPDATE batch_jobs SET completed_items = completed_items + 1,"
+                        " successful = successful + ?, failed = failed + ?, updated_at = ? WHERE id = ?",
+                        (successful, failed, time.time(), job_id)
+                    )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def _set_status(self, job_id: str, status: str, error: Optional[str]) -> None:
+        with self._lock:
+            self._db.execute("UPDATE batch_jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+                             (status, error, time.time(), job_id))
+
+    def _job(self, row: tuple) -> Dict[str, Any]:
+        (job_id, status, spec, total, completed, successful, failed, error, created_at, updated_at) = row
+        return {
+            "job_id": job_id,
+            "status": status,
+            "spec": json.loads(spec),
+            "total_items": total,
+            "completed_items": completed,
+            "successful": successful,
+            "failed": failed,
+            "error": error,
+            "created_at": created_at,
+            "updated_at": updated_at
+        }
+
+    def _get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute("SELECT * FROM batch_jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._job(row) if row else None
+
+    def _list(self, limit: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._db.execute("SELECT * FROM batch_jobs ORDER BY created_at DESC LIMIT ?",
+                                    (limit,)).fetchall()
+        return [self._job(row) for row in rows]
+
+    def _done_items(self, job_id: str) -> Set[int]:
+        with self._lock:
+            rows = self._db.execute("SELECT item_index FROM batch_results WHERE job_id = ?", (job_id,)).fetchall()
+        return {row[0] for row in rows}
+
+    def _unfinished(self) -> List[str]:
+        with self._lock:
+            rows = self._db.execute("SELECT id FROM batch_jobs WHERE status IN (?, ?) ORDER BY created_at",
+                                    (QUEUED, RUNNING)).fetchall()
+        return [row[0] for row in rows]
+
+    def _results_page(self, job_id: str, after: int) -> List[tuple]:
+        with self._lock:
+            return self._db.execute(
+                "SELECT item_index, line FROM batch_results WHERE job_id = ? AND item_index > ?"
+                " ORDER BY item_index LIMIT ?",
+                (job_id, after, RESULTS_PAGE_SIZE)
+            ).fetchall()
+
+    async def create(self, job_id: str, spec: Dict[str, Any], items: List[Dict[str, Any]]) -> None:
+        """Store a queued job: ``spec`` holds the settings shared by all ``items``."""
+        await asyncio.to_thread(self._create, job_id, spec, items)
+
+    async def item(self, job_id: str, item_index: int) -> Dict[str, Any]:
+        return await asyncio.to_thread(self._item, job_id, item_index)
+
+    async def record_item(self, job_id: str, item_index: int, line: Dict[str, Any],
+                          successful: int, failed: int) -> None:
+        """Store one coupon's result line and add its model outcomes to the job's counts."""
+        await asyncio.to_thread(self._record_item, job_id, item_index, line, successful, failed)
+
+    async def set_status(self, job_id: str, status: str, error: Optional[str] = None) -> None:
+        await asyncio.to_thread(self._set_status, job_id, status, error)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._get, job_id)
+
+    async def list(self, limit: int = 50) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(self._list, limit)
+
+    async def done_items(self, job_id: str) -> Set[int]:
+        return await asyncio.to_thread(self._done_items, job_id)
+
+    async def unfinished(self) -> List[str]:
+        """IDs of jobs that were queued or running when the process stopped."""
+        return await asyncio.to_thread(self._unfinished)
+
+    async def iter_results(self, job_id: str) -> AsyncIterator[str]:
+        """Yield the job's result lines as JSONL, in item order, a page at a time."""
+        after = -1
+        while True:
+            rows = await asyncio.to_thread(self._results_page, job_id, after)
+            for item_index, line in rows:
+                yield line + "\n"
+            if len(rows) < RESULTS_PAGE_SIZE:
+                return
+            after = rows[-1][0]
+
+    async def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+# (job ID, job spec, item index, item) -> (result line, successful models, failed models)
+RunItem = Callable[[str, Dict[str, Any], int, Dict[str, Any]], Awaitable[Tuple[Dict[str, Any], int, int]]]
+
+
+class BatchRunner:
+    """Runs stored batch jobs in background tasks.
+
+    Args:
+        store: Where jobs and results are kept
+        run_item: Coroutine function generating one coupon of a job; called
+            with (job ID, job spec, item index, item) and returning
+            (result line, successful models, failed models)
+        concurrency: Coupons of one job generated at a time
+        max_items: Max coupons accepted per job
+    """
+
+    def __init__(self, store: BatchJobStore, run_item: RunItem, concurrency: int = 4, max_items: int = 1000):
+        self.store = store
+        self.run_item = run_item
+        self.concurrency = concurrency
+        self.max_items = max_items
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    @classmethod
+    def from_env(cls, run_item: RunItem) -> "BatchRunner":
+        return cls(
+            BatchJobStore(os.getenv("BATCH_DB_PATH", "batch_jobs.sqlite3")),
+            run_item,
+            concurrency=int(os.getenv("BATCH_CONCURRENCY", "4")),
+            max_items=int(os.getenv("BATCH_MAX_ITEMS", "1000"))
+        )
+
+    def start(self, job_id: str) -> None:
+        """Run a stored job in the background."""
+        if job_id not in self._tasks:
+            task = asyncio.ensure_future(self._run(job_id))
+            self._tasks[job_id] = task
+            task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+
+    async def resume(self) -> List[str]:
+        """Restart jobs left unfinished by a previous process; returns their IDs."""
+        job_ids = await self.store.unfinished()
+        for job_id in job_ids:
+            self.start(job_id)
+        return job_ids
+
+    async def cancel(self, job_id: str) -> bool:
+        """Stop a queued or running job; returns False if it already finished."""
+        job = await self.store.get(job_id)
+        if job is None or job["status"] not in (QUEUED, RUNNING):
+            return False
+        task = self._tasks.get(job_id)
+        if task:
+            task.cancel()
+        await self.store.set_status(job_id, CANCELLED)
+        return True
+
+    async def _run(self, job_id: str) -> None:
+        job = await self.store.get(job_id)
+        if job is None:
+            return
+        spec = job["spec"]
+        done = await self.store.done_items(job_id)
+        pending = iter([index for index in range(job["total_items"]) if index not in done])
+        await self.store.set_status(job_id, RUNNING)
+
+        async def worker() -> None:
+            # Workers share one iterator, so each item is taken exactly once
+            for index in pending:
+                item = await self.store.item(job_id, index)
+                line, successful, failed = await self.run_item(job_id, spec, index, item)
+                await self.store.record_item(job_id, index, line, successful, failed)
+
+        workers = [asyncio.ensure_future(worker()) for _ in range(max(1, self.concurrency))]
+        try:
+            await asyncio.gather(*workers)
+        except asyncio.CancelledError:
+            for task in workers:
+                task.cancel()
+            raise
+        except Exception as e:
+            for task in workers:
+                task.cancel()
+            await self.store.set_status(job_id, FAILED, str(e))
+            return
+        await self.store.set_status(job_id, COMPLETED)
+
+    async def close(self) -> None:
+        """Stop running jobs (they stay ``running`` and resume on the next start)."""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.store.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"running_jobs": list(self._tasks), "concurrency": self.concurrency, "max_items": self.max_items}
@@ -0,0 +1 @@
+"""Benchmarks for the Rikstoto AI backend. Run from the backend directory with ``python -m benchmarks.<name>``."""
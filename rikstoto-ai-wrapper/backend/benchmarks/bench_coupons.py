@@ -0,0 +1,114 @@
+"""
+Test coupon generation throughput.
+
+Generates seeded coupons for each product with each generator and
+reports coupons per second (best of ``--repeat`` runs):
+
+    per-request:  build_test_json, the generator behind /api/generate-json
+    bulk:         coupons.generate_coupons, behind /api/generate-json/bulk
+    ndjson-gzip:  coupons.iter_ndjson with gzip, behind /api/generate-json/export
+
+Each row also has a checksum of the generated coupons (without the
+wall-clock bet timestamp), so a change meant to be a pure speed-up can
+show it produces the same coupons for the same seeds; per-request race
+dates count from today, so compare runs from the same day. ``--output`` saves
+the results as JSON; ``--baseline`` compares with a saved run, reports
+changed checksums and exits non-zero when throughput fell by more than
+``--tolerance``.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_coupons --count 2000 --output before.json
+    python -m benchmarks.bench_coupons --count 2000 --baseline before.json
+"""
+
+import argparse
+import hashlib
+import json
+import sys
+import time
+from datetime import date
+from typing import Any, Callable, Dict, List
+
+from coupons import PRODUCT_RACES, generate_coupons, iter_ndjson
+from main import JsonGeneratorRequest, build_test_json
+
+GENERATORS = ("per-request", "bulk", "ndjson-gzip")
+BASE_DATE = date(2026, 1, 1)
+
+
+def run_generator(name: str, product: str, count: int, seed: int) -> Callable[[], List[Any]]:
+    """A function generating ``count`` coupons with generator ``name``."""
+    if name == "per-request":
+        requests = [JsonGeneratorRequest(product=product, seed=seed + i) for i in range(count)]
+        return lambda: [build_test_json(request) for request in requests]
+    if name == "bulk":
+        return lambda: generate_coupons(count, seed, product=product, base_date=BASE_DATE)
+    return lambda: list(iter_ndjson(count, seed, compress=True, product=product, base_date=BASE_DATE))
+
+
+def checksum(output: List[Any]) -> str:
+    """Short digest of generated coupons, ignoring the bet timestamp."""
+    digest = hashlib.sha256()
+    for item in output:
+        if isinstance(item, bytes):
+            digest.update(item)
+            continue
+        item["betDetails"].pop("timestamp", None)
+        digest.update(json.dumps(item, sort_keys=True, ensure_ascii=False).encode())
+    return digest.hexdigest()[:12]
+
+
+def main(args: argparse.Namespace) -> int:
+    print(f"{args.count} coupons per run, best of {args.repeat}")
+    print(f"{'generator':<12} {'product':<10} {'coupons/s':>10} {'ms/coupon':>10} {'checksum':>13}")
+    results: List[Dict[str, Any]] = []
+    for name in args.generators:
+        for product in args.products:
+            generate = run_generator(name, product, args.count, args.seed)
+            best, output = float("inf"), []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                output = generate()
+                best = min(best, time.perf_counter() - started)
+            row = {"generator": name, "product": product, "coupons_per_s": round(args.count / best),
+                   "ms_per_coupon": round(best / args.count * 1000, 4), "checksum": checksum(output)}
+            results.append(row)
+            print(f"{name:<12} {product:<10} {row['coupons_per_s']:>10} {row['ms_per_coupon']:>10.3f} "
+                  f"{row['checksum']:>13}", flush=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+        print(f"Saved results to {args.output}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            previous = {(row["generator"], row["product"]): row for row in json.load(f)["results"]}
+        regressions = []
+        for row in results:
+            before = previous.get((row["generator"], row["product"]))
+            if before is None:
+                continue
+            change = row["coupons_per_s"] / before["coupons_per_s"] - 1
+            print(f"{row['generator']:<12} {row['product']:<10} {before['coupons_per_s']:>7} -> "
+                  f"{row['coupons_per_s']:>7} coupons/s ({change:+.0%})"
+                  + ("" if row["checksum"] == before["checksum"] else "  [coupons changed]"))
+            if change < -args.tolerance:
+                regressions.append(row)
+        if regressions:
+            print(f"{len(regressions)} regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+            return 1
+        print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--generators", nargs="+", choices=GENERATORS, default=list(GENERATORS))
+    parser.add_argument("--products", nargs="+", choices=list(PRODUCT_RACES), default=["V75", "V5", "DD"])
+    parser.add_argument("--count", type=int, default=1000, help="Coupons per run")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per generator and product")
+    parser.add_argument("--seed", type=int, default=42, help="Seed (per-request: seed + i for coupon i)")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--baseline", help="Compare with results saved by an earlier --output")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slowdown (default: 0.2)")
+    sys.exit(main(parser.parse_args()))
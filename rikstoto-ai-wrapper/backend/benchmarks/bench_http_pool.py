@@ -0,0 +1,91 @@
+"""
+Pooled vs unpooled upstream HTTP calls.
+
+Sends the same POST sequence to a local stub server twice: once with a
+new HTTP client per call (the old provider path) and once through the
+shared ``HTTPClientPool``. Reports p50/p99 latency and how many TCP
+connections the server accepted for each path.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_http_pool --requests 500 --concurrency 8
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Awaitable, Callable, Dict, List
+
+import httpx
+
+from benchmarks.stub_server import start_stub_server
+from clients import HTTPClientPool
+
+PAYLOAD = {"messages": [{"role": "user", "content": "Analyser denne bongen"}], "max_tokens": 50}
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of samples."""
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+async def unpooled_post(url: str, **kwargs) -> httpx.Response:
+    """One client (and connection) per call, like the original provider functions."""
+    async with httpx.AsyncClient() as client:
+        return await client.post(url, **kwargs)
+
+
+async def run(post: Callable[..., Awaitable[httpx.Response]], url: str, total: int, concurrency: int) -> List[float]:
+    """Issue ``total`` POSTs with at most ``concurrency`` in flight and return latencies in seconds."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one() -> float:
+        async with semaphore:
+            start = time.perf_counter()
+            response = await post(url, json=PAYLOAD, timeout=30)
+            response.raise_for_status()
+            return time.perf_counter() - start
+
+    return await asyncio.gather(*[one() for _ in range(total)])
+
+
+async def bench(name: str, post: Callable[..., Awaitable[httpx.Response]], args: argparse.Namespace) -> Dict[str, float]:
+    server = start_stub_server(delay=args.delay)
+    try:
+        started = time.perf_counter()
+        latencies = await run(post, f"{server.url}/v1/chat/completions", args.requests, args.concurrency)
+        elapsed = time.perf_counter() - started
+        return {
+            "path": name,
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "mean_ms": statistics.mean(latencies) * 1000,
+            "req_per_s": len(latencies) / elapsed,
+            "connections": server.connections_opened
+        }
+    finally:
+        server.shutdown()
+
+
+async def main(args: argparse.Namespace) -> None:
+    pool = HTTPClientPool()
+    results = [
+        await bench("unpooled", unpooled_post, args),
+        await bench("pooled", pool.post, args)
+    ]
+    await pool.close()
+
+    print(f"{'path':<10} {'p50 ms':>8} {'p99 ms':>8} {'mean ms':>8} {'req/s':>8} {'conns':>6}")
+    for r in results:
+        print(f"{r['path']:<10} {r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f} {r['mean_ms']:>8.2f} "
+              f"{r['req_per_s']:>8.0f} {r['connections']:>6}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500, help="Requests per path")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent in-flight requests")
+    parser.add_argument("--delay", type=float, default=0.0, help="Stub server delay per response (s)")
+    asyncio.run(main(parser.parse_args()))
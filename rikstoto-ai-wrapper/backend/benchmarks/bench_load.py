@@ -0,0 +1,293 @@
+"""
+Load test of the backend against the local fake LLM server.
+
+Starts the stub upstream (benchmarks.stub_server) in-process and the
+backend as a uvicorn subprocess whose providers all point at it - no real
+API keys are passed on - then drives each scenario at each concurrency
+level:
+
+    generate:      POST /generate with gpt-4o (response cache off)
+    generate-all:  POST /generate-all with all six models (response cache off)
+    stream:        POST /generate/stream with gpt-4o, read to the end
+    prepare-json:  POST /prepare-json with a generated V75 coupon
+
+Every run records throughput, p50/p99 latency and failed requests, plus
+the peak resident memory and thread count of the backend process (via
+psutil if installed, otherwise /proc). ``--output`` saves the results as
+JSON; ``--baseline`` compares a run with a saved one and exits non-zero
+when latency, throughput or memory regressed by more than ``--tolerance``.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_load --concurrency 1 8 32 --requests 200 --delay 0.2 --output before.json
+    python -m benchmarks.bench_load --concurrency 1 8 32 --requests 200 --delay 0.2 --baseline before.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Tuple
+
+import httpx
+
+from benchmarks.bench_http_pool import percentile
+from benchmarks.stub_server import backend_env, start_stub_server
+
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    psutil = None
+    PSUTIL_AVAILABLE = False
+
+SCENARIOS = ("generate", "generate-all", "stream", "prepare-json")
+
+ALL_MODELS = ["gpt-4o", "gpt-4o-mini", "o3-mini", "mistral-large", "claude-3-5-sonnet", "gemini-1-5-flash"]
+
+SYSTEM_PROMPT = "Analyser denne bongen og forklar resultatet kort:\n{{json}}"
+
+# Provider credentials that must not reach the benchmarked backend; empty values
+# also keep load_dotenv from filling them in from a local .env file
+SCRUBBED_ENV = ("ANTHROPIC_API_KEY", "ANTHROPIC_BASE_URL", "GOOGLE_API_KEY", "HUGGINGFACE_TOKEN",
+                "INFERENCE_ENDPOINT_URL", "LANGSMITH_API_KEY")
+
+
+def process_usage(pid: int) -> Tuple[float, int]:
+    """Resident memory in MB and thread count of a process."""
+    if PSUTIL_AVAILABLE:
+        process = psutil.Process(pid)
+        return process.memory_info().rss / 1024 / 1024, process.num_threads()
+    rss_mb, threads = 0.0, 0
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                rss_mb = int(line.split()[1]) / 1024
+            elif line.startswith("Threads:"):
+                threads = int(line.split()[1])
+    return rss_mb, threads
+
+
+class UsageSampler:
+    """Samples a process's memory and threads in a background thread and keeps the peaks."""
+
+    def __init__(self, pid: int, interval: float = 0.05):
+        self.pid = pid
+        self.interval = interval
+        self.peak_rss_mb = 0.0
+        self.peak_threads = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            rss_mb, threads = process_usage(self.pid)
+            self.peak_rss_mb = max(self.peak_rss_mb, rss_mb)
+            self.peak_threads = max(self.peak_threads, threads)
+            self._stop.wait(self.interval)
+
+    def __enter__(self) -> "UsageSampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def start_backend(stub_url: str, port: int, workdir: str) -> subprocess.Popen:
+    """Start the backend with uvicorn, every provider pointed at the stub."""
+    env = {**os.environ, **{name: "" for name in SCRUBBED_ENV}, **backend_env(stub_url)}
+    env.update({
+        "LANGSMITH_TRACING": "false",
+        "HEDGING_ENABLED": "false",
+        "CACHE_BACKEND": "memory",
+        "LOG_LEVEL": "WARNING",
+        "BATCH_DB_PATH": os.path.join(workdir, "batch_jobs.sqlite3"),
+    })
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=backend_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+async def wait_ready(client: httpx.AsyncClient, process: subprocess.Popen, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Backend exited with code {process.returncode}")
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("Backend did not become ready")
+
+
+def scenario_request(name: str, coupon: str, index: int) -> Tuple[str, Dict[str, Any]]:
+    """Path and body of request ``index`` of a scenario (bodies differ to avoid coalescing)."""
+    prompt = f"{SYSTEM_PROMPT}\n#{index}"
+    if name == "generate":
+        return "/generate", {"model_name": "gpt-4o", "system_prompt": prompt, "json_data": coupon, "use_cache": False}
+    if name == "stream":
+        return "/generate/stream", {"model_name": "gpt-4o", "system_prompt": prompt, "json_data": coupon,
+                                    "use_cache": False}
+    if name == "generate-all":
+        return "/generate-all", {"models": [{"name": model, "system_prompt": prompt} for model in ALL_MODELS],
+                                 "json_data": coupon, "use_cache": False}
+    return "/prepare-json", {"json_data": coupon}
+
+
+def request_failed(name: str, response: httpx.Response) -> bool:
+    if response.status_code != 200:
+        return True
+    if name == "generate-all":
+        return response.json()["failed"] > 0
+    if name == "stream":
+        return "event: error" in response.text
+    return False
+
+
+async def run_scenario(client: httpx.AsyncClient, name: str, coupon: str, total: int,
+                       concurrency: int) -> Tuple[List[float], int, float]:
+    """Send ``total`` requests with ``concurrency`` in flight; returns (latencies, failures, elapsed)."""
+    semaphore = asyncio.Semaphore(concurrency)
+    failures = 0
+
+    async def one(index: int) -> float:
+        nonlocal failures
+        path, body = scenario_request(name, coupon, index)
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await client.post(path, json=body)
+                if request_failed(name, response):
+                    failures += 1
+            except httpx.HTTPError:
+                failures += 1
+            return time.perf_counter() - start
+
+    started = time.perf_counter()
+    latencies = await asyncio.gather(*[one(index) for index in range(total)])
+    return list(latencies), failures, time.perf_counter() - started
+
+
+async def bench(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    stub = start_stub_server(delay=args.delay, jitter=args.jitter, error_rate=args.error_rate,
+                             throttle_rate=args.throttle_rate, chunks=args.chunks, chunk_delay=args.chunk_delay,
+                             seed=args.seed)
+    workdir = tempfile.mkdtemp(prefix="bench_load_")
+    process = start_backend(stub.url, args.port, workdir)
+    results = []
+    try:
+        limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", timeout=120, limits=limits) as client:
+            await wait_ready(client, process)
+            generated = await client.post("/api/generate-json", json={"product": "V75", "seed": args.seed or 1})
+            coupon = json.dumps(generated.json(), ensure_ascii=False)
+            for name in args.scenarios:
+                await run_scenario(client, name, coupon, args.warmup, 1)
+                for concurrency in args.concurrency:
+                    requests_before = stub.requests
+                    with UsageSampler(process.pid) as usage:
+                        latencies, failures, elapsed = await run_scenario(client, name, coupon, args.requests,
+                                                                          concurrency)
+                    results.append({
+                        "scenario": name,
+                        "concurrency": concurrency,
+                        "requests": len(latencies),
+                        "failed": failures,
+                        "req_per_s": round(len(latencies) / elapsed, 2),
+                        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+                        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+                        "upstream_calls": stub.requests - requests_before,
+                        "peak_rss_mb": round(usage.peak_rss_mb, 1),
+                        "peak_threads": usage.peak_threads
+                    })
+                    print_row(results[-1])
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+        stub.shutdown()
+    return results
+
+
+COLUMNS = (("scenario", "<13"), ("concurrency", ">5"), ("requests", ">6"), ("failed", ">6"), ("req_per_s", ">9"),
+           ("p50_ms", ">9"), ("p99_ms", ">9"), ("upstream_calls", ">8"), ("peak_rss_mb", ">8"), ("peak_threads", ">7"))
+HEADERS = ("scenario", "conc", "reqs", "failed", "req/s", "p50 ms", "p99 ms", "upstream", "RSS MB", "threads")
+
+
+def print_header() -> None:
+    print(" ".join(f"{header:{spec}}" for header, (_, spec) in zip(HEADERS, COLUMNS)))
+
+
+def print_row(row: Dict[str, Any]) -> None:
+    print(" ".join(f"{row[key]:{spec}}" for key, spec in COLUMNS), flush=True)
+
+
+# (metric, direction): +1 if higher is worse, -1 if lower is worse
+COMPARED_METRICS = (("p50_ms", 1), ("p99_ms", 1), ("req_per_s", -1), ("peak_rss_mb", 1), ("peak_threads", 1))
+
+
+def compare(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]],
+            tolerance: float) -> List[str]:
+    """Regressions of ``results`` against ``baseline`` beyond ``tolerance`` (a fraction)."""
+    previous = {(row["scenario"], row["concurrency"]): row for row in baseline}
+    regressions = []
+    for row in results:
+        before = previous.get((row["scenario"], row["concurrency"]))
+        if before is None:
+            continue
+        for metric, direction in COMPARED_METRICS:
+            old, new = before[metric], row[metric]
+            if old and (new - old) * direction / old > tolerance:
+                regressions.append(f"{row['scenario']} @ {row['concurrency']}: {metric} {old} -> {new} "
+                                   f"({(new - old) / old:+.0%})")
+    return regressions
+
+
+def main(args: argparse.Namespace) -> int:
+    print(f"Stub delay {args.delay}s (+{args.jitter}s jitter), errors {args.error_rate:.0%}, "
+          f"429s {args.throttle_rate:.0%}; {args.requests} requests per run")
+    print_header()
+    results = asyncio.run(bench(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+        print(f"Saved results to {args.output}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f)["results"], args.tolerance)
+        if regressions:
+            print(f"Regressions against {args.baseline} (tolerance {args.tolerance:.0%}):")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS), help="Scenarios to run")
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 32], help="Concurrency levels")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per scenario and concurrency level")
+    parser.add_argument("--warmup", type=int, default=5, help="Unmeasured requests before each scenario")
+    parser.add_argument("--port", type=int, default=8099, help="Port for the backend under test")
+    parser.add_argument("--delay", type=float, default=0.2, help="Stub delay per upstream response (s)")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Extra random stub delay up to this (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of upstream calls failing with 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Share of upstream calls failing with 429")
+    parser.add_argument("--chunks", type=int, default=8, help="Deltas per streamed answer")
+    parser.add_argument("--chunk-delay", type=float, default=0.02, help="Delay between streamed deltas (s)")
+    parser.add_argument("--seed", type=int, default=42, help="Seed for stub delays/failures and the coupon")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--baseline", help="Compare with results saved by an earlier --output")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression (default: 0.2)")
+    sys.exit(main(parser.parse_args()))
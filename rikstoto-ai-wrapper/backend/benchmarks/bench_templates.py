@@ -0,0 +1,65 @@
+"""
+Compiled prompt templates vs double ``str.replace``.
+
+Renders the gpt-4o system prompt from MODEL_DEFAULTS with coupon JSON
+payloads of increasing size, once with the old
+``prompt.replace("{{json}}", ...).replace("{json}", ...)`` and once with a
+compiled template. Reports microseconds per render and the speedup.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_templates --sizes 2 20 200 --repeat 2000
+"""
+
+import argparse
+import json
+import timeit
+from typing import Any, Dict
+
+from main import MODEL_DEFAULTS
+from templates import compile_template
+
+
+def coupon_payload(races: int) -> str:
+    """Compact coupon JSON with ``races`` races of 12 horses each."""
+    coupon: Dict[str, Any] = {
+        "betType": "V75",
+        "raceResults": [
+            {
+                "race": race,
+                "winner": 1 + race % 12,
+                "horses": [
+                    {"startNumber": n, "name": f"Hest {n}", "percentageBet": round(100 / 12, 2),
+                     "odds": 2.5 + n, "amountBet": 1000 * n, "betResult": n == 1}
+                    for n in range(1, 13)
+                ]
+            }
+            for race in range(1, races + 1)
+        ]
+    }
+    return json.dumps(coupon, separators=(',', ':'))
+
+
+def double_replace(prompt: str, json_str: str) -> str:
+    return prompt.replace("{{json}}", json_str).replace("{json}", json_str)
+
+
+def main(args: argparse.Namespace) -> None:
+    prompt = MODEL_DEFAULTS["gpt-4o"]["system_prompt"]
+    print(f"Template: gpt-4o system prompt ({len(prompt)} chars)")
+    print(f"{'races':>6} {'json KB':>8} {'replace us':>11} {'compiled us':>12} {'speedup':>8}")
+    for races in args.sizes:
+        json_str = coupon_payload(races)
+        assert double_replace(prompt, json_str) == compile_template(prompt).render(json=json_str)
+        replace_time = min(timeit.repeat(lambda: double_replace(prompt, json_str),
+                                         number=args.repeat, repeat=5)) / args.repeat
+        compiled_time = min(timeit.repeat(lambda: compile_template(prompt).render(json=json_str),
+                                          number=args.repeat, repeat=5)) / args.repeat
+        print(f"{races:>6} {len(json_str) / 1024:>8.1f} {replace_time * 1e6:>11.2f} "
+              f"{compiled_time * 1e6:>12.2f} {replace_time / compiled_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[2, 20, 200], help="Races per coupon payload")
+    parser.add_argument("--repeat", type=int, default=2000, help="Renders per timing run")
+    main(parser.parse_args())
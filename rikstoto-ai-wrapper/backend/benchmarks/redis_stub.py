@@ -0,0 +1,157 @@
+"""
+Local Redis stand-in for cache tests and benchmarks.
+
+Speaks enough of the Redis protocol (RESP2) for ``RedisCache``: HELLO,
+PING, GET, SET with EX/PX, DEL, EXISTS, PTTL, DBSIZE, FLUSHDB, SCAN and
+CLIENT (SETINFO and friends are acknowledged). HELLO 3 is refused with
+NOPROTO, as a RESP2-only server would.
+Keys live in memory and expire lazily on access. Runs on asyncio, either
+in-process (``start_redis_stub``) or standalone so several uvicorn
+workers can share it:
+
+    python -m benchmarks.redis_stub --port 6390
+    CACHE_BACKEND=redis CACHE_REDIS_URL=redis://127.0.0.1:6390/0 uvicorn main:app --workers 4
+"""
+
+import argparse
+import asyncio
+import fnmatch
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+class RedisStub:
+    """In-memory key store behind a minimal RESP2 server."""
+
+    def __init__(self):
+        self._data: Dict[bytes, Tuple[bytes, Optional[float]]] = {}
+        self.commands = 0
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    def _live(self, key: bytes) -> Optional[bytes]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    def execute(self, args: List[bytes]) -> bytes:
+        """Run one command and return its RESP-encoded reply."""
+        self.commands += 1
+        command = args[0].upper()
+        if command == b"PING":
+            return b"+PONG\r\n"
+        if command == b"HELLO":
+            if len(args) > 1 and args[1] != b"2":
+                return b"-NOPROTO unsupported protocol version\r\n"
+            return (b"*6\r\n" + bulk(b"server") + bulk(b"redis") + bulk(b"version") + bulk(b"7.2.0")
+                    + bulk(b"proto") + integer(2))
+        if command == b"CLIENT":
+            return b"+OK\r\n"
+        if command == b"GET":
+            return bulk(self._live(args[1]))
+        if command == b"SET":
+            expires_at = None
+            options = [a.upper() for a in args[3:]]
+            for i, option in enumerate(options):
+                if option == b"EX":
+                    expires_at = time.monotonic() + float(args[4 + i])
+                elif option == b"PX":
+                    expires_at = time.monotonic() + float(args[4 + i]) / 1000
+            self._data[args[1]] = (args[2], expires_at)
+            return b"+OK\r\n"
+        if command == b"DEL":
+            removed = sum(1 for key in args[1:] if self._live(key) is not None and self._data.pop(key))
+            return integer(removed)
+        if command == b"EXISTS":
+            return integer(sum(1 for key in args[1:] if self._live(key) is not None))
+        if command == b"PTTL":
+            if self._live(args[1]) is None:
+                return integer(-2)
+            expires_at = self._data[args[1]][1]
+            return integer(-1 if expires_at is None else int((expires_at - time.monotonic()) * 1000))
+        if command == b"DBSIZE":
+            return integer(sum(1 for key in list(self._data) if self._live(key) is not None))
+        if command == b"FLUSHDB":
+            self._data.clear()
+            return b"+OK\r\n"
+        if command == b"SCAN":
+            # Single pass: return every match with cursor 0
+            pattern = b"*"
+            for i, arg in enumerate(args[2:]):
+                if arg.upper() == b"MATCH":
+                    pattern = args[3 + i]
+            keys = [key for key in list(self._data)
+                    if self._live(key) is not None and fnmatch.fnmatchcase(key.decode(), pattern.decode())]
+            return b"*2\r\n" + bulk(b"0") + array(keys)
+        return b"-ERR unknown command '" + command + b"'\r\n"
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                args = await read_command(reader)
+                if args is None:
+                    break
+                writer.write(self.execute(args))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.sockets[0].getsockname()[:2]
+        return f"redis://{host}:{port}/0"
+
+
+def bulk(value: Optional[bytes]) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+def integer(value: int) -> bytes:
+    return b":%d\r\n" % value
+
+
+def array(values: List[bytes]) -> bytes:
+    return b"*%d\r\n" % len(values) + b"".join(bulk(v) for v in values)
+
+
+async def read_command(reader: asyncio.StreamReader) -> Optional[List[bytes]]:
+    """Read one RESP array of bulk strings (or an inline command)."""
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b"*"):
+        return line.split()
+    args = []
+    for _ in range(int(line[1:])):
+        length = int((await reader.readline())[1:])
+        args.append((await reader.readexactly(length + 2))[:-2])
+    return args
+
+
+async def start_redis_stub(host: str = "127.0.0.1", port: int = 0) -> RedisStub:
+    """Start a Redis stand-in on the running loop (port 0 picks a free port)."""
+    stub = RedisStub()
+    stub.server = await asyncio.start_server(stub.handle, host, port)
+    return stub
+
+
+async def main(args: argparse.Namespace) -> None:
+    stub = await start_redis_stub(args.host, args.port)
+    print(f"Redis stub listening on {stub.url}")
+    async with stub.server:
+        await stub.server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,271 @@
+"""
+Local stub upstream (fake LLM) for benchmarks and load tests.
+
+Answers POSTs in the wire format of each provider the backend calls, so
+the whole backend can run against it with no real API keys:
+
+    /openai/deployments/<name>/chat/completions   Azure OpenAI (gpt-4o, gpt-4o-mini, o3-mini)
+    /v1/chat/completions                          Mistral on Azure AI (OpenAI-compatible)
+    /v1/messages, /serving-endpoints/...          Anthropic / Claude via Databricks
+    ...:generateContent, /gemini...               Gemini via API Management
+    anything else                                 Small chat-completion body
+
+Requests with ``"stream": true`` get server-sent events in the provider's
+format (OpenAI chunks or Anthropic events), ``chunks`` deltas spaced
+``chunk_delay`` apart. Every response waits ``delay`` plus up to
+``jitter`` seconds first; ``error_rate`` of requests fail with 500 and
+``throttle_rate`` with 429 and a Retry-After header. The server counts
+the TCP connections clients open and the requests it answered.
+
+In-process (``start_stub_server``) or standalone, to point a running
+backend at it:
+
+    python -m benchmarks.stub_server --port 8090 --delay 0.5 --jitter 0.5 --error-rate 0.02
+    AZURE_OPENAI_ENDPOINT=http://127.0.0.1:8090 AZURE_MISTRAL_ENDPOINT=http://127.0.0.1:8090 ... uvicorn main:app
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+RESPONSE_BODY = json.dumps({
+    "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "Stub svar."}}]
+}).encode()
+
+# Answer sent by the provider formats: about 60 tokens of Norwegian analysis text
+REPLY_TEXT = ("Bongen din hadde 5 av 7 rette. Favoritten i løp 3 vant som ventet, "
+              "mens outsideren i løp 6 overrasket. Neste gang kan du vurdere flere hester i de åpne løpene.")
+
+
+def reply_chunks(text: str, chunks: int) -> List[str]:
+    """Split ``text`` into ``chunks`` roughly equal deltas on word boundaries."""
+    words = text.split(" ")
+    size = max(1, -(-len(words) // max(1, chunks)))
+    parts = [" ".join(words[i:i + size]) for i in range(0, len(words), size)]
+    return [part + " " if i < len(parts) - 1 else part for i, part in enumerate(parts)]
+
+
+def provider_for_path(path: str) -> str:
+    """Which provider's wire format a request path expects."""
+    if "/openai/deployments/" in path:
+        return "azure_openai"
+    if path.startswith("/v1/chat/completions"):
+        return "mistral"
+    if path.startswith("/v1/messages") or path.startswith("/serving-endpoints"):
+        return "claude"
+    if "generateContent" in path or path.startswith("/gemini"):
+        return "gemini"
+    return "default"
+
+
+def completion_body(provider: str, text: str) -> Dict[str, Any]:
+    """Non-streaming response body in the provider's format."""
+    usage = {"prompt_tokens": 1000, "completion_tokens": 60, "total_tokens": 1060}
+    if provider == "claude":
+        return {"id": "msg_stub", "type": "message", "role": "assistant", "model": "claude-3-5-sonnet",
+                "content": [{"type": "text", "text": text}], "stop_reason": "end_turn",
+                "usage": {"input_tokens": 1000, "output_tokens": 60}}
+    if provider == "gemini":
+        return {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}]}
+    return {"id": "chatcmpl-stub", "object": "chat.completion", "created": int(time.time()), "model": "stub",
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": text}}],
+            "usage": usage}
+
+
+def stream_events(provider: str, deltas: Iterable[str]) -> Iterable[bytes]:
+    """Server-sent event frames in the provider's streaming format."""
+    if provider == "claude":
+        yield b'event: message_start\ndata: {"type":"message_start","message":{"id":"msg_stub","type":"message",' \
+              b'"role":"assistant","model":"claude-3-5-sonnet","content":[],"stop_reason":null,' \
+              b'"usage":{"input_tokens":1000,"output_tokens":1}}}\n\n'
+        yield b'event: content_block_start\ndata: {"type":"content_block_start","index":0,' \
+              b'"content_block":{"type":"text","text":""}}\n\n'
+        for delta in deltas:
+            event = {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": delta}}
+            yield f"event: content_block_delta\ndata: {json.dumps(event)}\n\n".encode()
+        yield b'event: content_block_stop\ndata: {"type":"content_block_stop","index":0}\n\n'
+        yield b'event: message_delta\ndata: {"type":"message_delta","delta":{"stop_reason":"end_turn"},' \
+              b'"usage":{"output_tokens":60}}\n\n'
+        yield b'event: message_stop\ndata: {"type":"message_stop"}\n\n'
+        return
+    if provider == "gemini":
+        for delta in deltas:
+            yield f"data: {json.dumps(completion_body('gemini', delta))}\n\n".encode()
+        return
+    # OpenAI chunks; Azure starts with a content-filter chunk without choices
+    base = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()), "model": "stub"}
+    yield f"data: {json.dumps({**base, 'choices': []})}\n\n".encode()
+    for delta in deltas:
+        chunk = {**base, "choices": [{"index": 0, "delta": {"content": delta}, "finish_reason": None}]}
+        yield f"data: {json.dumps(chunk)}\n\n".encode()
+    yield f"data: {json.dumps({**base, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]})}\n\n".encode()
+    yield b"data: [DONE]\n\n"
+
+
+class StubServer(ThreadingHTTPServer):
+    """Threaded fake LLM server that counts accepted connections and requests.
+
+    Args:
+        address: (host, port) to listen on; port 0 picks a free one
+        delay: Seconds every response waits before answering
+        jitter: Extra random delay, uniform between 0 and ``jitter`` seconds
+        error_rate: Share of requests answered with 500
+        throttle_rate: Share of requests answered with 429 and Retry-After
+        chunks: Deltas per streamed answer
+        chunk_delay: Seconds between streamed deltas
+        seed: Seed for the delay and failure draws (for reproducible runs)
+    """
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address: Tuple[str, int], delay: float = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, throttle_rate: float = 0.0, chunks: int = 8,
+                 chunk_delay: float = 0.0, seed: Optional[int] = None):
+        self.delay = delay
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.chunks = chunks
+        self.chunk_delay = chunk_delay
+        self.connections_opened = 0
+        self.requests = 0
+        self.failures = 0
+        self._random = random.Random(seed)
+        self._count_lock = threading.Lock()
+        super().__init__(address, StubHandler)
+
+    def get_request(self):
+        request = super().get_request()
+        with self._count_lock:
+            self.connections_opened += 1
+        return request
+
+    def draw(self) -> Tuple[float, Optional[int]]:
+        """Delay for the next response and the failure status to send (None to succeed)."""
+        with self._count_lock:
+            self.requests += 1
+            delay = self.delay + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+            roll = self._random.random()
+            status = 500 if roll < self.error_rate else 429 if roll < self.error_rate + self.throttle_rate else None
+            if status:
+                self.failures += 1
+        return delay, status
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Keep-alive handler answering in the wire format of the requested provider."""
+
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without this, Nagle plus
+    # delayed ACKs add ~40 ms to every response on a kept-alive connection
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length)
+        delay, status = self.server.draw()
+        if delay:
+            time.sleep(delay)
+        if status:
+            self.send_json(status, {"error": {"code": str(status), "message": "Stub failure"}},
+                           {"retry-after-ms": "500", "Retry-After": "1"} if status == 429 else {})
+            return
+        provider = provider_for_path(self.path)
+        if provider == "default":
+            self.send_body(200, RESPONSE_BODY)
+            return
+        try:
+            request = json.loads(raw) if raw else {}
+        except ValueError:
+            request = {}
+        streaming = request.get("stream") or "streamGenerateContent" in self.path
+        if streaming:
+            self.send_stream(stream_events(provider, reply_chunks(REPLY_TEXT, self.server.chunks)))
+        else:
+            self.send_json(200, completion_body(provider, REPLY_TEXT))
+
+    def send_body(self, status: int, body: bytes, headers: Optional[Dict[str, str]] = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+        self.send_body(status, json.dumps(payload, ensure_ascii=False).encode(), headers)
+
+    def send_stream(self, frames: Iterable[bytes]) -> None:
+        """Send server-sent events with chunked transfer encoding, keeping the connection."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for index, frame in enumerate(frames):
+            if index and self.server.chunk_delay:
+                time.sleep(self.server.chunk_delay)
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(frame), frame))
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(delay: float = 0.0, port: int = 0, **options: Any) -> StubServer:
+    """Start a stub server on a local port (a free one by default) in a background thread.
+
+    ``options`` are passed to StubServer (jitter, error_rate, throttle_rate,
+    chunks, chunk_delay, seed).
+    """
+    server = StubServer(("127.0.0.1", port), delay=delay, **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def backend_env(url: str) -> Dict[str, str]:
+    """Environment that points every provider of the backend at a stub server at ``url``."""
+    return {
+        "AZURE_OPENAI_ENDPOINT": url,
+        "AZURE_OPENAI_API_KEY": "stub",
+        "AZURE_MISTRAL_ENDPOINT": url,
+        "AZURE_MISTRAL_API_KEY": "stub",
+        "AZURE_DATABRICKS_CLAUDE_ENDPOINT": f"{url}/serving-endpoints/claude/invocations",
+        "AZURE_DATABRICKS_API_KEY": "stub",
+        "AZURE_APIM_GEMINI_ENDPOINT": f"{url}/gemini/models/gemini-1.5-flash:generateContent",
+        "AZURE_APIM_GEMINI_KEY": "stub",
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8090, help="Port to listen on")
+    parser.add_argument("--delay", type=float, default=0.0, help="Base delay per response (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random delay up to this (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument("--chunks", type=int, default=8, help="Deltas per streamed answer")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="Delay between streamed deltas (s)")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for delays and failures")
+    args = parser.parse_args()
+    server = StubServer(("127.0.0.1", args.port), delay=args.delay, jitter=args.jitter, error_rate=args.error_rate,
+                        throttle_rate=args.throttle_rate, chunks=args.chunks, chunk_delay=args.chunk_delay,
+                        seed=args.seed)
+    print(f"Fake LLM server on {server.url}")
+    for name, value in backend_env(server.url).items():
+        print(f"  {name}={value}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
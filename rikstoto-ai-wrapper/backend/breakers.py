@@ -0,0 +1,311 @@
+"""
+Per-provider circuit breakers and adaptive concurrency limits.
+
+When a provider degrades (Mistral timing out, the Gemini APIM endpoint
+returning errors), every generation sent to it waits for the failure. A
+circuit breaker per provider watches the recent error rate and the share
+of slow calls:
+
+    closed:    Calls go through; outcomes are recorded in a sliding window
+    open:      Too many recent calls failed or were slow - calls fail fast
+               without going upstream until ``open_seconds`` have passed
+    half-open: A few probe calls are let through; if they succeed the
+               breaker closes, if one fails it opens again
+
+Only calls that point at the provider count as failures: 5xx responses,
+timeouts, connection errors and 429s that outlasted their retries.
+Configuration errors and 4xx responses caused by the request (unknown
+model, failed auth, a Hugging Face model still loading) are neutral.
+
+Alongside the breaker, an AIMD limiter adapts how many calls may be in
+flight to the provider: the limit grows by one for every ``limit``
+fast successes (additive increase) and is halved on a failure or slow
+call (multiplicative decrease), between ``min_limit`` and ``max_limit``.
+The scheduler uses it as the provider's concurrency cap.
+
+Configuration via environment variables:
+    BREAKER_WINDOW: Recent calls considered per provider (default: 20)
+    BREAKER_MIN_CALLS: Calls needed before the breaker can open (default: 5)
+    BREAKER_FAILURE_RATE: Failure share that opens the breaker (default: 0.5)
+    BREAKER_SLOW_CALL_FRACTION: Calls using more than this share of their model's
+        timeout budget count as slow (default: 0.75)
+    BREAKER_SLOW_CALL_RATE: Slow share that opens the breaker (default: 0.8)
+    BREAKER_OPEN_SECONDS: How long an open breaker fails fast (default: 30)
+    BREAKER_HALF_OPEN_PROBES: Trial calls allowed when half-open (default: 1)
+    ADAPTIVE_LIMIT_MIN: Lowest adaptive concurrency limit (default: 1)
+    ADAPTIVE_LIMIT_MAX: Highest adaptive concurrency limit for providers without an entry in
+        SCHEDULER_PROVIDER_LIMITS (default: SCHEDULER_PROVIDER_LIMIT or 16)
+"""
+
+import os
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+from scheduler import parse_provider_limits
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def upstream_status(error: BaseException) -> Optional[int]:
+    """HTTP status code carried by an SDK or httpx error, if any."""
+    return getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+
+
+def is_neutral_error(error: BaseException) -> bool:
+    """Whether a failed call says nothing about the provider's health.
+
+    4xx responses other than 429 (bad request, auth, unknown model or
+    deployment) are caused by the request or our configuration, so they
+    neither trip the breaker nor lower the adaptive limit.
+    """
+    status = upstream_status(error)
+    return status is not None and 400 <= status < 500 and status != 429
+
+
+def error_summary(error: BaseException) -> str:
+    """Exception class and upstream status code, for ``last_error``.
+
+    The message itself is left out, since it may echo upstream URLs or
+    response bodies.
+    """
+    status = upstream_status(error)
+    return f"{type(error).__name__} (HTTP {status})" if status else type(error).__name__
+
+
+class CircuitBreaker:
+    """Error-rate and latency driven circuit breaker for one provider.
+
+    Args:
+        window: Number of recent calls the rates are computed over
+        min_calls: Calls in the window before the breaker may open
+        failure_rate: Failure share at which the breaker opens
+        slow_call_rate: Slow share at which the breaker opens
+        open_seconds: Time an open breaker fails fast before probing
+        half_open_probes: Concurrent probe calls allowed while half-open
+        clock: Time source (for tests)
+    """
+
+    def __init__(self, window: int = 20, min_calls: int = 5, failure_rate: float = 0.5,
+                 slow_call_rate: float = 0.8, open_seconds: float = 30.0, half_open_probes: int = 1,
+                 clock: Callable[[], float] = time.monotonic):
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self._clock = clock
+        # (failed, slow) per recent call
+        self._outcomes: Deque[Tuple[bool, bool]] = deque(maxlen=window)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        self.last_error: Optional[str] = None
+        # Metrics
+        self.times_opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and self._clock() - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._probes = 0
+        return self._state
+
+    def retry_after(self) -> float:
+        """Seconds until an open breaker lets a probe through (0 when not open)."""
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.open_seconds - (self._clock() - self._opened_at))
+
+    def allow(self) -> bool:
+        """Whether a call may go upstream now; False means fail fast.
+
+        Every allowed call must be followed by ``record`` or ``release``.
+        """
+        state = self.state
+        if state == CLOSED:
+            return True
+        if state == HALF_OPEN and self._probes < self.half_open_probes:
+            self._probes += 1
+            return True
+        self.rejected += 1
+        return False
+
+    def release(self) -> None:
+        """Give back a probe permit for a call that ended without an outcome (e.g. cancelled)."""
+        if self._state == HALF_OPEN and self._probes:
+            self._probes -= 1
+
+    def record(self, success: bool, slow: bool, error: Optional[str] = None) -> None:
+        """Record the outcome of an allowed call."""
+        if not success:
+            self.last_error = error
+        if self._state == HALF_OPEN:
+            self._probes = max(0, self._probes - 1)
+            if success and not slow:
+                self._state = CLOSED
+                self._outcomes.clear()
+            else:
+                self._open()
+            return
+        self._outcomes.append((not success, slow))
+        if self._state == CLOSED and len(self._outcomes) >= self.min_calls:
+            failures = sum(1 for failed, _ in self._outcomes if failed)
+            slow_calls = sum(1 for _, was_slow in self._outcomes if was_slow)
+            if (failures / len(self._outcomes) >= self.failure_rate
+                    or slow_calls / len(self._outcomes) >= self.slow_call_rate):
+                self._open()
+
+    def _open(self) -> None:
+        self._state = OPEN
+        self._opened_at = self._clock()
+        self.times_opened += 1
+
+    def stats(self) -> Dict[str, Any]:
+        calls = len(self._outcomes)
+        return {
+            "state": self.state,
+            "retry_after_seconds": round(self.retry_after(), 1),
+            "recent_calls": calls,
+            "error_rate": round(sum(1 for f, _ in self._outcomes if f) / calls, 3) if calls else 0.0,
+            "slow_rate": round(sum(1 for _, s in self._outcomes if s) / calls, 3) if calls else 0.0,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+            "last_error": self.last_error
+        }
+
+
+class AIMDLimiter:
+    """Additive-increase, multiplicative-decrease concurrency limit.
+
+    Args:
+        initial: Starting limit
+        min_limit: Lowest limit
+        max_limit: Highest limit
+        backoff: Factor the limit is multiplied by on a failure or slow call
+    """
+
+    def __init__(self, initial: int, min_limit: int = 1, max_limit: int = 16, backoff: float = 0.5):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self._limit = float(max(min_limit, min(initial, max_limit)))
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def record(self, success: bool, slow: bool) -> bool:
+        """Adjust the limit for one outcome; returns True if the integer limit changed."""
+        before = self.limit
+        if success and not slow:
+            # +1 per ``limit`` successes, i.e. roughly +1 per round of calls
+            self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+        else:
+            self._limit = max(self.min_limit, self._limit * self.backoff)
+        return self.limit != before
+
+
+class ProviderGuards:
+    """Circuit breaker and adaptive limit for every provider.
+
+    Args:
+        breaker_factory: Builds a breaker for a provider seen for the first time
+        limiter_factory: Builds an AIMD limiter for a provider seen for the first time
+            (called with the provider name)
+        on_limit_change: Called with (provider, new limit) when an adaptive limit changes
+    """
+
+    def __init__(self, breaker_factory: Callable[[], CircuitBreaker],
+                 limiter_factory: Callable[[str], AIMDLimiter],
+                 on_limit_change: Optional[Callable[[str, int], None]] = None):
+        self._breaker_factory = breaker_factory
+        self._limiter_factory = limiter_factory
+        self._on_limit_change = on_limit_change
+        self.slow_call_fraction = float(os.getenv("BREAKER_SLOW_CALL_FRACTION", "0.75"))
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._limiters: Dict[str, AIMDLimiter] = {}
+
+    @classmethod
+    def from_env(cls, on_limit_change: Optional[Callable[[str, int], None]] = None) -> "ProviderGuards":
+        default_max = int(os.getenv("ADAPTIVE_LIMIT_MAX", os.getenv("SCHEDULER_PROVIDER_LIMIT", "16")))
+        # The adaptive limit can reach each provider's configured scheduler cap
+        provider_limits = parse_provider_limits(os.getenv("SCHEDULER_PROVIDER_LIMITS", ""))
+        min_limit = int(os.getenv("ADAPTIVE_LIMIT_MIN", "1"))
+
+        def limiter_factory(provider: str) -> AIMDLimiter:
+            max_limit = provider_limits.get(provider, default_max)
+            return AIMDLimiter(initial=max_limit, min_limit=min_limit, max_limit=max_limit)
+
+        return cls(
+            breaker_factory=lambda: CircuitBreaker(
+                window=int(os.getenv("BREAKER_WINDOW", "20")),
+                min_calls=int(os.getenv("BREAKER_MIN_CALLS", "5")),
+                failure_rate=float(os.getenv("BREAKER_FAILURE_RATE", "0.5")),
+                slow_call_rate=float(os.getenv("BREAKER_SLOW_CALL_RATE", "0.8")),
+                open_seconds=float(os.getenv("BREAKER_OPEN_SECONDS", "30")),
+                half_open_probes=int(os.getenv("BREAKER_HALF_OPEN_PROBES", "1"))
+            ),
+            limiter_factory=limiter_factory,
+            on_limit_change=on_limit_change
+        )
+
+    def breaker(self, provider: str) -> CircuitBreaker:
+        breaker = self._breakers.get(provider)
+        if breaker is None:
+            breaker = self._breakers[provider] = self._breaker_factory()
+        return breaker
+
+    def limiter(self, provider: str) -> AIMDLimiter:
+        limiter = self._limiters.get(provider)
+        if limiter is None:
+            limiter = self._limiters[provider] = self._limiter_factory(provider)
+        return limiter
+
+    def allow(self, provider: str) -> bool:
+        return self.breaker(provider).allow()
+
+    def release(self, provider: str) -> None:
+        self.breaker(provider).release()
+
+    def record(self, provider: str, success: bool, seconds: float, budget: float,
+               error: Optional[str] = None) -> None:
+        """Feed one call's outcome to the provider's breaker and adaptive limit.
+
+        Args:
+            provider: Provider the call went to
+            success: Whether the call returned a usable answer
+            seconds: Time the call took upstream
+            budget: The model's timeout budget; calls using most of it count as slow
+            error: Sanitized error of a failed call (see ``error_summary``)
+        """
+        slow = seconds >= budget * self.slow_call_fraction
+        self.breaker(provider).record(success, slow, error)
+        limiter = self.limiter(provider)
+        if limiter.record(success, slow) and self._on_limit_change:
+            self._on_limit_change(provider, limiter.limit)
+
+    def cancelled(self, provider: str, seconds: float, budget: float) -> None:
+        """Account for an allowed call that was cancelled before it finished.
+
+        A call cancelled after using most of its budget (a deadline or
+        timeout hit it) counts as a slow failure; otherwise the probe
+        permit is just given back.
+        """
+        if seconds >= budget * self.slow_call_fraction:
+            self.record(provider, False, seconds, budget, "Timed out")
+        else:
+            self.release(provider)
+
+    def is_open(self, provider: str) -> bool:
+        return provider in self._breakers and self._breakers[provider].state == OPEN
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Breaker state and adaptive limit per provider seen so far."""
+        return {
+            provider: {**breaker.stats(), "concurrency_limit": self.limiter(provider).limit}
+            for provider, breaker in self._breakers.items()
+        }
@@ -0,0 +1,475 @@
+"""
+Cache backends for the Rikstoto AI backend.
+
+Prepared JSON sessions (/prepare-json) and /generate responses are stored
+through a ``CacheBackend``. Three implementations are available:
+
+    memory: Per-process LRU cache with entry and byte budgets (default)
+    sqlite: On-disk SQLite file, shared by every worker on the same host
+            and kept across restarts
+    redis:  Any Redis-protocol server (Redis, Valkey, KeyDB), shared by
+            workers on every host behind the load balancer
+
+Memory cache: the least recently used entry is evicted when either budget
+is exceeded, and entries expire a fixed time after they were stored.
+Because every entry has the same TTL, expiry order equals store order, so
+expired entries are dropped from the front of a store-ordered index in
+O(1) amortized time on each access instead of scanning the whole cache.
+
+Configuration via environment variables:
+    CACHE_BACKEND: memory, sqlite or redis (default: memory)
+    CACHE_SQLITE_PATH: SQLite file for the sqlite backend (default: cache.sqlite3)
+    CACHE_REDIS_URL: Server URL for the redis backend (default: redis://localhost:6379/0)
+    RESPONSE_CACHE_MAX_ENTRIES: Max cached responses (default: 1000)
+    RESPONSE_CACHE_MAX_BYTES: Max total size of cached responses (default: 67108864)
+    RESPONSE_CACHE_TTL_SECONDS: Seconds a response stays fresh (default: 1800)
+    SESSION_CACHE_MAX_ENTRIES / _MAX_BYTES / _TTL_SECONDS: Same for sessions
+
+With the redis backend, entry and byte budgets are left to the server's
+``maxmemory`` and ``maxmemory-policy allkeys-lru`` settings; TTLs are
+enforced per key.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from request_log import log_event
+
+try:
+    import redis.asyncio as aioredis
+    REDIS_AVAILABLE = True
+except ImportError:
+    aioredis = None
+    REDIS_AVAILABLE = False
+
+
+def json_size(value: Any) -> int:
+    """Approximate the memory cost of a value by its JSON-encoded size in bytes."""
+    return len(json.dumps(value, ensure_ascii=False, default=str).encode("utf-8"))
+
+
+class CacheBackend(ABC):
+    """Interface shared by all cache backends.
+
+    Values must be JSON-serializable. ``get`` returns ``(value, age_seconds)``
+    for a fresh entry or None; backends count hits and misses themselves.
+
+    Args:
+        namespace: Key prefix separating caches that share one store
+        ttl_seconds: Seconds a value stays fresh after it is stored
+    """
+
+    name = "base"
+
+    def __init__(self, namespace: str, ttl_seconds: float):
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: Any) -> None:
+        ...
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        ...
+
+    @abstractmethod
+    async def clear(self) -> None:
+        ...
+
+    def _fail(self, operation: str, error: Exception) -> None:
+        """Count and log a failed cache operation (the caller carries on without the cache)."""
+        self.errors += 1
+        log_event("cache_error", logging.WARNING, backend=self.name, namespace=self.namespace,
+                  operation=operation, error=f"{type(error).__name__}: {error}")
+
+    async def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for this worker, plus backend-specific usage."""
+        lookups = self.hits + self.misses
+        return {
+            "backend": self.name,
+            "namespace": self.namespace,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "errors": self.errors
+        }
+
+    async def close(self) -> None:
+        """Release connections or files held by the backend."""
+
+
+class _CacheEntry:
+    """A cached value with its size and store time."""
+
+    __slots__ = ("value", "size", "stored_at")
+
+    def __init__(self, value: Any, size: int, stored_at: float):
+        self.value = value
+        self.size = size
+        self.stored_at = stored_at
+
+
+class LRUTTLCache(CacheBackend):
+    """In-memory LRU cache with a TTL and entry and byte budgets.
+
+    Args:
+        namespace: Name reported in stats
+        max_entries: Max number of cached values
+        max_bytes: Max total size of cached values, as measured by ``sizeof``
+        ttl_seconds: Seconds a value stays fresh after it is stored
+        sizeof: Function returning the size of a value in bytes
+        clock: Monotonic clock, overridable for testing
+    """
+
+    name = "memory"
+
+    def __init__(self, namespace: str = "responses", max_entries: int = 1000,
+                 max_bytes: int = 64 * 1024 * 1024, ttl_seconds: float = 1800,
+                 sizeof: Callable[[Any], int] = json_size, clock: Callable[[], float] = time.monotonic):
+        super().__init__(namespace, ttl_seconds)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._clock = clock
+        # Recency order (LRU first) and store order (oldest first)
+        self._lru: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self._by_age: "OrderedDict[str, None]" = OrderedDict()
+        self._bytes = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.rejected = 0
+
+    def _remove(self, key: str) -> None:
+        entry = self._lru.pop(key)
+        self._by_age.pop(key, None)
+        self._bytes -= entry.size
+
+    def _expire(self, now: float) -> None:
+        """Drop expired entries from the front of the store-ordered index."""
+        cutoff = now - self.ttl_seconds
+        while self._by_age:
+            key = next(iter(self._by_age))
+            if self._lru[key].stored_at > cutoff:
+                break
+            self._remove(key)
+            self.expirations += 1
+
+    async def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        now = self._clock()
+        self._expire(now)
+        entry = self._lru.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._lru.move_to_end(key)
+        self.hits += 1
+        return entry.value, now - entry.stored_at
+
+    async def set(self, key: str, value: Any) -> None:
+        """Store a value, evicting least recently used entries to stay in budget.
+
+        Values larger than the whole byte budget are not cached.
+        """
+        now = self._clock()
+        self._expire(now)
+        size = self._sizeof(value)
+        if key in self._lru:
+            self._remove(key)
+        if size > self.max_bytes:
+            self.rejected += 1
+            return
+        self._lru[key] = _CacheEntry(value, size, now)
+        self._by_age[key] = None
+        self._bytes += size
+        while len(self._lru) > self.max_entries or self._bytes > self.max_bytes:
+            self._remove(next(iter(self._lru)))
+            self.evictions += 1
+
+    async def delete(self, key: str) -> None:
+        if key in self._lru:
+            self._remove(key)
+
+    async def clear(self) -> None:
+        """Drop every entry (counters are kept)."""
+        self._lru.clear()
+        self._by_age.clear()
+        self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._lru)
+
+    async def stats(self) -> Dict[str, Any]:
+        """Entry and byte usage against budget, plus hit/miss/eviction counters."""
+        self._expire(self._clock())
+        return {
+            **await super().stats(),
+            "entries": len(self._lru),
+            "max_entries": self.max_entries,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "rejected": self.rejected
+        }
+
+
+class SQLiteCache(CacheBackend):
+    """On-disk cache in a SQLite file, shared by all workers on one host.
+
+    Uses WAL mode so readers in other workers don't block on writers. Every
+    call runs in a worker thread to keep the event loop free. Budgets are
+    enforced on write by dropping expired rows, then least recently used ones.
+
+    Args:
+        path: SQLite database file
+        namespace: Key prefix separating caches that share the file
+        max_entries: Max rows in this namespace
+        max_bytes: Max total value size in this namespace
+        ttl_seconds: Seconds a value stays fresh after it is stored
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str, namespace: str, max_entries: int = 1000,
+                 max_bytes: int = 64 * 1024 * 1024, ttl_seconds: float = 1800):
+        super().__init__(namespace, ttl_seconds)
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+            " size INTEGER NOT NULL, stored_at REAL NOT NULL, accessed_at REAL NOT NULL,"
+            " PRIMARY KEY (namespace, key))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS cache_stored_at ON cache (namespace, stored_at)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (namespace, accessed_at)")
+
+    def _get(self, key: str) -> Optional[Tuple[Any, float]]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, stored_at FROM cache WHERE namespace = ? AND key = ? AND stored_at > ?",
+                (self.namespace, key, now - self.ttl_seconds)
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE cache SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                             (now, self.namespace, key))
+        try:
+            return json.loads(row[0]), now - row[1]
+        except ValueError:
+            # Unreadable row: drop it so the next lookup is a plain miss
+            self._delete(key)
+            raise
+
+    def _set(self, key: str, value: Any) -> None:
+        now = time.time()
+        encoded = json.dumps(value, ensure_ascii=False, default=str)
+        size = len(encoded.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO cache (namespace, key, value, size, stored_at, accessed_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (self.namespace, key, encoded, size, now, now)
+                )
+                self._db.execute("DELETE FROM cache WHERE namespace = ? AND stored_at <= ?",
+                                 (self.namespace, now - self.ttl_seconds))
+                entries, total = self._db.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache WHERE namespace = ?",
+                    (self.namespace,)
+                ).fetchone()
+                # Evict least recently used rows until back under both budgets
+                if entries > self.max_entries or total > self.max_bytes:
+                    oldest = iter(self._db.execute(
+                        "SELECT key, size FROM cache WHERE namespace = ? ORDER BY accessed_at",
+                        (self.namespace,)
+                    ).fetchall())
+                while entries > self.max_entries or total > self.max_bytes:
+                    old_key, old_size = next(oldest)
+                    self._db.execute("DELETE FROM cache WHERE namespace = ? AND key = ?",
+                                     (self.namespace, old_key))
+                    entries -= 1
+                    total -= old_size
+                    self.evictions += 1
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def _delete(self, key: str) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (self.namespace, key))
+
+    def _clear(self) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM cache WHERE namespace = ?", (self.namespace,))
+
+    def _usage(self) -> Tuple[int, int]:
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache WHERE namespace = ? AND stored_at > ?",
+                (self.namespace, time.time() - self.ttl_seconds)
+            ).fetchone()
+
+    async def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        try:
+            result = await asyncio.to_thread(self._get, key)
+        except (sqlite3.Error, ValueError) as e:
+            self._fail("decode" if isinstance(e, ValueError) else "read", e)
+            result = None
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    async def set(self, key: str, value: Any) -> None:
+        try:
+            await asyncio.to_thread(self._set, key, value)
+        except sqlite3.Error as e:
+            self._fail("write", e)
+
+    async def delete(self, key: str) -> None:
+        await asyncio.to_thread(self._delete, key)
+
+    async def clear(self) -> None:
+        await asyncio.to_thread(self._clear)
+
+    async def stats(self) -> Dict[str, Any]:
+        entries, total = await asyncio.to_thread(self._usage)
+        return {
+            **await super().stats(),
+            "path": self.path,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions
+        }
+
+    async def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+class RedisCache(CacheBackend):
+    """Cache on a Redis-protocol server, shared by every worker and host.
+
+    Keys are stored as ``rikstoto:<namespace>:<key>`` with a per-key expiry.
+    Connection failures are logged and treated as misses so generation
+    keeps working without the cache.
+
+    Args:
+        client: A ``redis.asyncio.Redis`` client (or compatible stand-in)
+        namespace: Key prefix separating caches that share one server
+        ttl_seconds: Seconds a value stays fresh after it is stored
+    """
+
+    name = "redis"
+
+    def __init__(self, client: Any, namespace: str, ttl_seconds: float = 1800):
+        super().__init__(namespace, ttl_seconds)
+        self._client = client
+        self._prefix = f"rikstoto:{namespace}:"
+
+    @classmethod
+    def from_url(cls, url: str, namespace: str, ttl_seconds: float = 1800) -> "RedisCache":
+        if not REDIS_AVAILABLE:
+            raise RuntimeError("CACHE_BACKEND=redis requires the redis package (pip install redis)")
+        # RESP2 covers every command used here and works with older servers
+        # and stand-ins; redis-py 6+ would otherwise negotiate RESP3 via HELLO
+        return cls(aioredis.Redis.from_url(url, socket_timeout=2, socket_connect_timeout=2, protocol=2),
+                   namespace, ttl_seconds)
+
+    async def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        try:
+            raw = await self._client.get(self._prefix + key)
+        except Exception as e:
+            self._fail("read", e)
+            raw = None
+        if raw is None:
+            self.misses += 1
+            return None
+        try:
+            entry = json.loads(raw)
+            value, age = entry["value"], time.time() - float(entry["stored_at"])
+        except (ValueError, TypeError, KeyError) as e:
+            # Corrupt, foreign or older-format value: drop it and treat as a miss
+            self._fail("decode", e)
+            self.misses += 1
+            try:
+                await self._client.delete(self._prefix + key)
+            except Exception:
+                pass
+            return None
+        self.hits += 1
+        return value, age
+
+    async def set(self, key: str, value: Any) -> None:
+        encoded = json.dumps({"value": value, "stored_at": time.time()}, ensure_ascii=False, default=str)
+        try:
+            await self._client.set(self._prefix + key, encoded, px=int(self.ttl_seconds * 1000))
+        except Exception as e:
+            self._fail("write", e)
+
+    async def delete(self, key: str) -> None:
+        await self._client.delete(self._prefix + key)
+
+    async def clear(self) -> None:
+        keys = [key async for key in self._client.scan_iter(match=self._prefix + "*")]
+        if keys:
+            await self._client.delete(*keys)
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+
+def cache_from_env(namespace: str, env_prefix: str, default_ttl_seconds: float = 1800) -> CacheBackend:
+    """Build the configured cache backend for one namespace.
+
+    Args:
+        namespace: Cache name, e.g. "responses" or "sessions"
+        env_prefix: Prefix of the budget variables, e.g. "RESPONSE_CACHE"
+        default_ttl_seconds: TTL when ``<env_prefix>_TTL_SECONDS`` is not set
+    """
+    backend = os.getenv("CACHE_BACKEND", "memory").lower()
+    max_entries = int(os.getenv(f"{env_prefix}_MAX_ENTRIES", "1000"))
+    max_bytes = int(os.getenv(f"{env_prefix}_MAX_BYTES", str(64 * 1024 * 1024)))
+    ttl_seconds = float(os.getenv(f"{env_prefix}_TTL_SECONDS", str(default_ttl_seconds)))
+
+    if backend == "sqlite":
+        return SQLiteCache(os.getenv("CACHE_SQLITE_PATH", "cache.sqlite3"), namespace,
+                           max_entries=max_entries, max_bytes=max_bytes, ttl_seconds=ttl_seconds)
+    if backend == "redis":
+        return RedisCache.from_url(os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0"),
+                                   namespace, ttl_seconds=ttl_seconds)
+    if backend != "memory":
+        raise ValueError(f"Unknown CACHE_BACKEND: {backend} (expected memory, sqlite or redis)")
+    return LRUTTLCache(namespace, max_entries=max_entries, max_bytes=max_bytes, ttl_seconds=ttl_seconds)
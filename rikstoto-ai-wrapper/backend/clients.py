@@ -0,0 +1,336 @@
+"""
+Shared provider clients for the Rikstoto AI backend.
+
+Provider SDK clients are expensive to build: every new client opens its own
+HTTP connection pool, so creating one per request means a fresh TCP + TLS
+handshake to Azure for every generation. This module keeps one long-lived
+client per deployment and timeout class, created at startup and shared by
+all endpoints.
+
+The plain HTTP providers (Mistral, Claude via Databricks, Gemini via APIM
+and Hugging Face) get the same treatment through one pooled HTTP client
+per upstream host.
+
+All clients are asyncio-native (httpx.AsyncClient underneath; SDK clients
+use the SDK's DefaultAsyncHttpxClient), so a single
+uvicorn worker can keep hundreds of generations in flight without blocking
+the event loop or adding threads.
+
+Pool sizes can be tuned with environment variables:
+    AZURE_OPENAI_POOL_MAX_CONNECTIONS: Max open connections per client (default: 100)
+    AZURE_OPENAI_POOL_MAX_KEEPALIVE: Max idle keep-alive connections per client (default: 20)
+    AZURE_OPENAI_POOL_KEEPALIVE_EXPIRY: Seconds an idle connection is kept (default: 60)
+    UPSTREAM_POOL_MAXSIZE: Max open connections per upstream host (default: 100)
+    UPSTREAM_POOL_MAX_KEEPALIVE: Max idle keep-alive connections per upstream host (default: 10)
+    UPSTREAM_POOL_KEEPALIVE_EXPIRY: Seconds an idle upstream connection is kept (default: 60)
+    UPSTREAM_POOL_RETRIES: Retries for connection errors and 502 responses (default: 2)
+    UPSTREAM_POOL_BACKOFF: Backoff factor between retries in seconds (default: 0.3)
+"""
+
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import anthropic
+import httpx
+from openai import AsyncAzureOpenAI, DefaultAsyncHttpxClient
+
+from hedging import time_remaining
+
+# Timeout classes - O3 models reason before answering and need longer timeouts
+TIMEOUT_CLASSES = {
+    "reasoning": 120,
+    "standard": 60,
+}
+
+AZURE_OPENAI_MODELS = ["gpt-4o", "gpt-4o-mini", "o3-mini"]
+
+ANTHROPIC_MODEL = "claude-3-5-sonnet-20241022"
+
+# Gateway errors worth retrying. 504 is not: the gateway gave up waiting on
+# the model, so a retry would send (and bill) the same completion again.
+# 503 is left to the caller since Hugging Face uses it for "model is loading".
+RETRY_STATUS_CODES = (502,)
+
+
+def timeout_class_for(model_name: str) -> str:
+    """Return the timeout class for a model name ("reasoning" for o3 models)."""
+    return "reasoning" if "o3" in model_name else "standard"
+
+
+def azure_deployment_for(model_name: str) -> Optional[str]:
+    """Map a model name to its Azure OpenAI deployment name.
+
+    Args:
+        model_name: The model to use (gpt-4o, gpt-4o-mini, o3-mini)
+
+    Returns:
+        Deployment name from environment, or the generic fallback deployment
+    """
+    deployment_map = {
+        "gpt-4o": os.getenv("AZURE_OPENAI_GPT4O_DEPLOYMENT", "gpt-4o"),
+        "gpt-4o-mini": os.getenv("AZURE_OPENAI_GPT4O_MINI_DEPLOYMENT", "gpt-4o-mini"),
+        "o3-mini": os.getenv("AZURE_OPENAI_O3_MINI_DEPLOYMENT", "o3-mini")
+    }
+    return deployment_map.get(model_name, os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"))
+
+
+def pool_limits() -> httpx.Limits:
+    """Build HTTP pool limits for provider SDK clients from environment configuration."""
+    return httpx.Limits(
+        max_connections=int(os.getenv("AZURE_OPENAI_POOL_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.getenv("AZURE_OPENAI_POOL_MAX_KEEPALIVE", "20")),
+        keepalive_expiry=float(os.getenv("AZURE_OPENAI_POOL_KEEPALIVE_EXPIRY", "60"))
+    )
+
+
+def httpx_pool_stats(http_client: httpx.AsyncClient) -> Dict[str, int]:
+    """Count open and idle connections in an httpx client's connection pool.
+
+    httpx does not expose pool statistics publicly, so this reads the
+    underlying httpcore pool defensively and reports zeros if the
+    internals are not available.
+    """
+    pool = getattr(getattr(http_client, "_transport", None), "_pool", None)
+    connections = list(getattr(pool, "connections", []) or [])
+    open_connections = [c for c in connections if not c.is_closed()]
+    return {
+        "open": len(open_connections),
+        "idle": sum(1 for c in open_connections if c.is_idle()),
+    }
+
+
+class _ClientEntry:
+    """A pooled provider client plus its usage counters."""
+
+    def __init__(self, client: Any, http_client: httpx.AsyncClient, provider: str,
+                 deployment: str, timeout_class: str):
+        self.client = client
+        self.http_client = http_client
+        self.provider = provider
+        self.deployment = deployment
+        self.timeout_class = timeout_class
+        self.in_flight = 0
+        self.requests = 0
+
+
+class ProviderClientRegistry:
+    """Registry of long-lived async provider SDK clients.
+
+    Azure OpenAI clients are keyed by (deployment, timeout class); the direct
+    Anthropic fallback gets a single client. Every client reuses a keep-alive
+    HTTP connection pool across requests.
+
+    Args:
+        wrapper: Optional callable applied once to each new Azure OpenAI client
+            (e.g. LangSmith's wrap_openai)
+    """
+
+    def __init__(self, wrapper: Optional[Callable[[Any], Any]] = None):
+        self._wrapper = wrapper
+        self._entries: Dict[Tuple[str, str, str], _ClientEntry] = {}
+
+    def _build_azure(self, deployment: str, timeout_class: str) -> _ClientEntry:
+        timeout_seconds = TIMEOUT_CLASSES[timeout_class]
+        # The SDK's own httpx client class, so it matches the httpx the SDK was built against
+        http_client = DefaultAsyncHttpxClient(limits=pool_limits(), timeout=timeout_seconds)
+        client = AsyncAzureOpenAI(
+            api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+            api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2025-01-01-preview"),
+            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+            timeout=timeout_seconds,
+            http_client=http_client,
+            # 429s and transient errors are retried by the caller, paced per deployment
+            max_retries=0
+        )
+        if self._wrapper:
+            client = self._wrapper(client)
+        return _ClientEntry(client, http_client, "azure_openai", deployment, timeout_class)
+
+    def _build_anthropic(self, deployment: str, timeout_class: str) -> _ClientEntry:
+        timeout_seconds = TIMEOUT_CLASSES[timeout_class]
+        http_client = anthropic.DefaultAsyncHttpxClient(limits=pool_limits(), timeout=timeout_seconds)
+        client = anthropic.AsyncAnthropic(
+            api_key=os.getenv("ANTHROPIC_API_KEY"),
+            timeout=timeout_seconds,
+            http_client=http_client
+        )
+        return _ClientEntry(client, http_client, "anthropic", deployment, timeout_class)
+
+    def _entry(self, provider: str, deployment: str, timeout_class: str) -> _ClientEntry:
+        key = (provider, deployment, timeout_class)
+        entry = self._entries.get(key)
+        if entry is None:
+            # No await between lookup and insert, so this is race-free on the event loop
+            build = self._build_azure if provider == "azure_openai" else self._build_anthropic
+            entry = build(deployment, timeout_class)
+            self._entries[key] = entry
+        return entry
+
+    def warm(self, model_names: List[str]) -> None:
+        """Create clients for the given models up front (called at startup)."""
+        if os.getenv("AZURE_OPENAI_ENDPOINT"):
+            for model_name in model_names:
+                self._entry("azure_openai", azure_deployment_for(model_name), timeout_class_for(model_name))
+        if os.getenv("ANTHROPIC_API_KEY"):
+            self._entry("anthropic", ANTHROPIC_MODEL, "standard")
+
+    @asynccontextmanager
+    async def _borrow(self, entry: _ClientEntry) -> AsyncIterator[Tuple[Any, str]]:
+        entry.in_flight += 1
+        entry.requests += 1
+        try:
+            yield entry.client, entry.deployment
+        finally:
+            entry.in_flight -= 1
+
+    def azure(self, model_name: str, deployment: Optional[str] = None):
+        """Borrow the shared Azure OpenAI client for a model.
+
+        Usage:
+            async with provider_clients.azure("gpt-4o") as (client, deployment):
+                ...
+
+        The request is counted as in flight until the context exits.
+        ``deployment`` overrides the model's configured deployment (e.g. a
+        secondary deployment for hedged requests).
+        """
+        entry = self._entry("azure_openai", deployment or azure_deployment_for(model_name),
+                            timeout_class_for(model_name))
+        return self._borrow(entry)
+
+    def anthropic(self):
+        """Borrow the shared direct Anthropic client (Databricks fallback)."""
+        return self._borrow(self._entry("anthropic", ANTHROPIC_MODEL, "standard"))
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Report pool usage for every client in the registry."""
+        return [
+            {
+                "provider": entry.provider,
+                "deployment": entry.deployment,
+                "timeout_class": entry.timeout_class,
+                "in_flight": entry.in_flight,
+                "requests": entry.requests,
+                **httpx_pool_stats(entry.http_client)
+            }
+            for entry in list(self._entries.values())
+        ]
+
+    async def close(self) -> None:
+        """Close all pooled HTTP connections (called at shutdown)."""
+        entries = list(self._entries.values())
+        self._entries.clear()
+        for entry in entries:
+            await entry.http_client.aclose()
+
+
+class HTTPClientPool:
+    """One pooled httpx.AsyncClient per upstream host.
+
+    Clients keep connections alive between calls and retry transient
+    connection failures and bad gateway responses (502) with exponential backoff.
+    """
+
+    def __init__(self):
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._requests: Dict[str, int] = {}
+        self._connections_opened: Dict[str, int] = {}
+        self._in_flight: Dict[str, int] = {}
+        self.retries = int(os.getenv("UPSTREAM_POOL_RETRIES", "2"))
+        self.backoff = float(os.getenv("UPSTREAM_POOL_BACKOFF", "0.3"))
+
+    @staticmethod
+    def _host_key(url: str) -> str:
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}"
+
+    def _build(self) -> httpx.AsyncClient:
+        limits = httpx.Limits(
+            max_connections=int(os.getenv("UPSTREAM_POOL_MAXSIZE", "100")),
+            max_keepalive_connections=int(os.getenv("UPSTREAM_POOL_MAX_KEEPALIVE", "10")),
+            keepalive_expiry=float(os.getenv("UPSTREAM_POOL_KEEPALIVE_EXPIRY", "60"))
+        )
+        # Transport-level retries cover connection failures; status retries are below
+        transport = httpx.AsyncHTTPTransport(limits=limits, retries=self.retries)
+        return httpx.AsyncClient(transport=transport)
+
+    def client(self, url: str) -> httpx.AsyncClient:
+        """Return the shared client for the host of ``url``."""
+        key = self._host_key(url)
+        client = self._clients.get(key)
+        if client is None:
+            client = self._build()
+            self._clients[key] = client
+        return client
+
+    async def post(self, url: str, **kwargs: Any) -> httpx.Response:
+        """POST through the pooled client for the host of ``url``.
+
+        Retries 502 responses with exponential backoff and returns the last
+        response if they keep failing, or as soon as another attempt would
+        not fit in the current generation's deadline.
+        """
+        key = self._host_key(url)
+        client = self.client(url)
+
+        async def trace(event_name: str, info: Dict[str, Any]) -> None:
+            if event_name == "connection.connect_tcp.complete":
+                self._connections_opened[key] = self._connections_opened.get(key, 0) + 1
+
+        timeout = kwargs.get("timeout")
+        attempt_timeout = timeout if isinstance(timeout, (int, float)) else 0
+
+        self._in_flight[key] = self._in_flight.get(key, 0) + 1
+        try:
+            for attempt in range(self.retries + 1):
+                self._requests[key] = self._requests.get(key, 0) + 1
+                response = await client.post(url, extensions={"trace": trace}, **kwargs)
+                if response.status_code not in RETRY_STATUS_CODES or attempt == self.retries:
+                    return response
+                delay = self.backoff * (2 ** attempt)
+                remaining = time_remaining()
+                if remaining is not None and delay + attempt_timeout > remaining:
+                    return response
+                await asyncio.sleep(delay)
+            return response
+        finally:
+            self._in_flight[key] -= 1
+
+    @asynccontextmanager
+    async def stream(self, url: str, **kwargs: Any) -> AsyncIterator[httpx.Response]:
+        """Open a streaming POST through the pooled client for the host of ``url``.
+
+        The response body is read incrementally (e.g. with ``aiter_lines``)
+        and the connection goes back to the pool when the block exits.
+        """
+        key = self._host_key(url)
+        self._in_flight[key] = self._in_flight.get(key, 0) + 1
+        self._requests[key] = self._requests.get(key, 0) + 1
+        try:
+            async with self.client(url).stream("POST", url, **kwargs) as response:
+                yield response
+        finally:
+            self._in_flight[key] -= 1
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Report connections opened, open, idle and in-flight per upstream host."""
+        return [
+            {
+                "host": key,
+                "requests": self._requests.get(key, 0),
+                "in_flight": self._in_flight.get(key, 0),
+                "connections_opened": self._connections_opened.get(key, 0),
+                **httpx_pool_stats(client)
+            }
+            for key, client in list(self._clients.items())
+        ]
+
+    async def close(self) -> None:
+        """Close every pooled client."""
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            await client.aclose()
@@ -0,0 +1,299 @@
+"""
+Token-budget-aware JSON compaction for the Rikstoto AI backend.
+
+Coupon JSON from /api/generate-json carries full results for 8-15 horses
+in each of up to 7 races, and much of it (bet IDs, timestamps, amountBet
+for unmarked horses, fields derivable from others) is never used by the
+prompts. Before a coupon is spliced into a prompt it is reduced by a
+pipeline of stages, grouped into levels:
+
+    full:     Unchanged
+    standard: Drop bookkeeping metadata and unused detail on unmarked horses
+    compact:  Also drop race fields derivable from the horse results, and
+              keep only position/odds/percentageBet for unmarked, unplaced horses
+    minimal:  Also collapse unmarked, unplaced horses into a per-race summary
+
+The base level is chosen per product and defaults to full, so prompts are
+only compacted when they go over budget. Each model has a token budget for
+the JSON; if the base level is over budget, the next level is used, and
+so on. Levels are serialized and token-counted on first use and kept, so
+picking one for a model needs no re-parsing and a request only pays for
+the levels and tokenizers it actually uses.
+
+Configuration via environment variables:
+    COMPACTION_LEVEL: Default base level (default: full)
+    COMPACTION_PRODUCT_LEVELS: Per-product base levels, e.g. "V75=standard,DD=full"
+    COMPACTION_TOKEN_BUDGETS: Per-model JSON token budgets, e.g. "o3-mini=3000,gpt-4o=12000"
+    COMPACTION_DEFAULT_BUDGET: Budget for models without one (default: 12000)
+"""
+
+import json
+import os
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from envconfig import parse_pairs
+from tokens import ENCODINGS, count_tokens, encoding_for
+
+COMPACTION_LEVELS = ("full", "standard", "compact", "minimal")
+
+# JSON token budgets per model; reasoning and "fast" models get less context
+MODEL_TOKEN_BUDGETS = {
+    "gpt-4o": 12000,
+    "gpt-4o-mini": 12000,
+    "o3-mini": 3000,
+    "mistral-large": 6000,
+    "claude-3-5-sonnet": 12000,
+    "gemini-1-5-flash": 6000,
+}
+
+# Bookkeeping fields no prompt uses
+METADATA_FIELDS = {
+    "betDetails": ("betId", "timestamp", "currency"),
+    "stalltipsInfo": ("generatedBy", "description"),
+    "poolInfo": ("currentPool", "bettingStatus"),
+}
+
+# Horse fields only worth sending for marked or placed horses
+DETAIL_HORSE_FIELDS = ("amountBet", "driver", "trainer", "publicRanking", "earnings",
+                       "age", "gender", "winPercentage", "placePercentage")
+
+# Race fields that can be derived from the horse results
+DERIVED_RACE_FIELDS = ("name", "totalStarters", "bettingDistribution", "winnerName", "winnerOdds")
+
+# Fields kept for unmarked, unplaced horses at the "compact" level
+ESSENTIAL_HORSE_FIELDS = ("horse", "position", "odds", "percentageBet")
+
+
+def token_budget(model_name: str) -> int:
+    """JSON token budget for a model (COMPACTION_TOKEN_BUDGETS overrides the defaults)."""
+    overrides = parse_pairs(os.getenv("COMPACTION_TOKEN_BUDGETS", ""))
+    if model_name in overrides:
+        return int(overrides[model_name])
+    return MODEL_TOKEN_BUDGETS.get(model_name, int(os.getenv("COMPACTION_DEFAULT_BUDGET", "12000")))
+
+
+def base_level(product: Optional[str]) -> str:
+    """Starting compaction level for a product."""
+    level = parse_pairs(os.getenv("COMPACTION_PRODUCT_LEVELS", "")).get(
+        product or "", os.getenv("COMPACTION_LEVEL", "full")
+    )
+    return level if level in COMPACTION_LEVELS else "full"
+
+
+def _is_marked(horse: Dict[str, Any], marked_numbers: List[int]) -> bool:
+    return horse.get("marked") in (True, "true") or horse.get("horse") in marked_numbers
+
+
+def _is_notable(horse: Dict[str, Any], marked_numbers: List[int]) -> bool:
+    """Marked horses and the top three finishers keep their details."""
+    position = horse.get("position")
+    return _is_marked(horse, marked_numbers) or (isinstance(position, int) and position <= 3)
+
+
+def _races(coupon: Dict[str, Any]) -> List[Dict[str, Any]]:
+    races = coupon.get("raceResults")
+    return races if isinstance(races, list) else []
+
+
+def _marked_numbers(coupon: Dict[str, Any], race: Dict[str, Any]) -> List[int]:
+    markings = coupon.get("markings")
+    if isinstance(markings, dict):
+        return markings.get(str(race.get("race")), []) or []
+    return []
+
+
+def _map_races(coupon: Dict[str, Any],
+               reduce: Callable[[Dict[str, Any], List[int]], Dict[str, Any]]) -> Dict[str, Any]:
+    """Return a copy of the coupon with ``reduce(race, marked_numbers)`` applied to every race."""
+    races = []
+    for race in _races(coupon):
+        if isinstance(race, dict) and isinstance(race.get("results"), list):
+            race = reduce(race, _marked_numbers(coupon, race))
+        races.append(race)
+    return {**coupon, "raceResults": races} if "raceResults" in coupon else coupon
+
+
+def drop_metadata(coupon: Dict[str, Any]) -> Dict[str, Any]:
+    """Drop bet IDs, timestamps and other bookkeeping fields."""
+    reduced = dict(coupon)
+    for section, fields in METADATA_FIELDS.items():
+        if isinstance(reduced.get(section), dict):
+            reduced[section] = {k: v for k, v in reduced[section].items() if k not in fields}
+    return reduced
+
+
+def trim_unmarked_horses(coupon: Dict[str, Any]) -> Dict[str, Any]:
+    """Drop amountBet, driver, trainer and stats for unmarked, unplaced horses."""
+    def reduce(race, marked):
+        results = [
+            horse if not isinstance(horse, dict) or _is_notable(horse, marked)
+            else {k: v for k, v in horse.items() if k not in DETAIL_HORSE_FIELDS}
+            for horse in race["results"]
+        ]
+        return {**race, "results": results}
+    return _map_races(coupon, reduce)
+
+
+def drop_derived_race_fields(coupon: Dict[str, Any]) -> Dict[str, Any]:
+    """Drop race fields derivable from the results and keep only essentials for other horses."""
+    def reduce(race, marked):
+        results = [
+            horse if not isinstance(horse, dict) or _is_notable(horse, marked)
+            else {k: v for k, v in horse.items() if k in ESSENTIAL_HORSE_FIELDS}
+            for horse in race["results"]
+        ]
+        return {**{k: v for k, v in race.items() if k not in DERIVED_RACE_FIELDS}, "results": results}
+    return _map_races(coupon, reduce)
+
+
+def summarize_unmarked_horses(coupon: Dict[str, Any]) -> Dict[str, Any]:
+    """Replace unmarked, unplaced horses with a count, odds range and total share of the pool."""
+    def reduce(race, marked):
+        notable = [h for h in race["results"] if not isinstance(h, dict) or _is_notable(h, marked)]
+        others = [h for h in race["results"] if isinstance(h, dict) and not _is_notable(h, marked)]
+        reduced = {**race, "results": notable}
+        odds = [h["odds"] for h in others if isinstance(h.get("odds"), (int, float))]
+        if others:
+            reduced["otherHorses"] = {
+                "count": len(others),
+                "oddsRange": [min(odds), max(odds)] if odds else None,
+                "percentageBet": round(sum(h.get("percentageBet", 0) or 0 for h in others), 1)
+            }
+        return reduced
+    return _map_races(coupon, reduce)
+
+
+# Stages each level adds on top of the previous one
+LEVEL_STAGES: Dict[str, List[Callable[[Dict[str, Any]], Dict[str, Any]]]] = {
+    "full": [],
+    "standard": [drop_metadata, trim_unmarked_horses],
+    "compact": [drop_derived_race_fields],
+    "minimal": [summarize_unmarked_horses],
+}
+
+
+def compact_json(json_obj: Any) -> str:
+    """Compact JSON serialization used in prompts."""
+    return json.dumps(json_obj, separators=(',', ':'))
+
+
+class PreparedJSON:
+    """JSON data serialized at every compaction level from its base level up.
+
+    Levels are serialized and token counts computed on first use, so a
+    request that only needs the base level with one model's tokenizer pays
+    for nothing else. ``count_all`` fills in the rest (for /prepare-json).
+
+    Args:
+        variants: {level: (compact JSON string, {encoding: estimated tokens})}
+        digest: Canonical digest of the original JSON
+        tokens_full: {encoding: estimated tokens} of the uncompacted JSON
+        full: Uncompacted JSON string, if not among the variants
+        pending: Iterator of further (level, compact JSON string) pairs
+    """
+
+    def __init__(self, variants: Dict[str, Tuple[str, Dict[str, int]]], digest: str,
+                 tokens_full: Dict[str, int], full: Optional[str] = None,
+                 pending: Optional[Iterator[Tuple[str, str]]] = None):
+        self.variants = variants
+        self.digest = digest
+        self.tokens_full = tokens_full
+        self._full = full if full is not None else variants.get("full", (None,))[0]
+        self._pending = pending
+
+    @classmethod
+    def from_json(cls, json_obj: Any, digest: str, level: Optional[str] = None) -> "PreparedJSON":
+        """Set up the compaction pipeline for every level from the base level up."""
+        full = compact_json(json_obj)
+        if not isinstance(json_obj, dict):
+            # Only coupon objects are compacted
+            return cls({"full": (full, {})}, digest, {})
+        start = level if level in COMPACTION_LEVELS else base_level(json_obj.get("product"))
+
+        def compacted() -> Iterator[Tuple[str, str]]:
+            reduced = json_obj
+            for name in COMPACTION_LEVELS:
+                for stage in LEVEL_STAGES[name]:
+                    reduced = stage(reduced)
+                if COMPACTION_LEVELS.index(name) >= COMPACTION_LEVELS.index(start):
+                    yield name, full if name == "full" else compact_json(reduced)
+
+        return cls({}, digest, {}, full=full, pending=compacted())
+
+    def levels(self) -> Iterator[str]:
+        """Available levels, least compacted first, serializing each on demand."""
+        index = 0
+        while True:
+            names = list(self.variants)
+            if index < len(names):
+                yield names[index]
+                index += 1
+                continue
+            item = next(self._pending, None) if self._pending is not None else None
+            if item is None:
+                self._pending = None
+                return
+            name, text = item
+            self.variants[name] = (text, {})
+
+    def tokens(self, level: str, model_name: Optional[str] = None, encoding: Optional[str] = None) -> int:
+        """Estimated tokens of a level with a model's tokenizer, counted once per encoding."""
+        text, counts = self.variants[level]
+        encoding = encoding or encoding_for(model_name)
+        if encoding not in counts:
+            counts[encoding] = count_tokens(text, encoding=encoding)
+        return counts[encoding]
+
+    def select(self, model_name: str) -> Tuple[str, str, int]:
+        """Pick the least compacted level that fits the model's token budget.
+
+        Returns:
+            Tuple of (level, compact JSON string, estimated tokens); the most
+            compacted level if none fits
+        """
+        budget = token_budget(model_name)
+        level = None
+        for level in self.levels():
+            tokens = self.tokens(level, model_name)
+            if tokens <= budget:
+                return level, self.variants[level][0], tokens
+        return level, self.variants[level][0], self.tokens(level, model_name)
+
+    def full_tokens(self, model_name: str) -> int:
+        """Estimated tokens of the uncompacted JSON for a model."""
+        encoding = encoding_for(model_name)
+        if encoding not in self.tokens_full and self._full is not None:
+            self.tokens_full[encoding] = count_tokens(self._full, encoding=encoding)
+        return self.tokens_full.get(encoding, 0)
+
+    def report(self, model_name: str) -> Dict[str, Any]:
+        """Tokens before and after compaction for a model."""
+        level, _, tokens = self.select(model_name)
+        return {"level": level, "tokens_before": self.full_tokens(model_name), "tokens_after": tokens,
+                "token_budget": token_budget(model_name)}
+
+    def count_all(self) -> "PreparedJSON":
+        """Serialize every level and count it with every tokenizer (blocking; run off the event loop)."""
+        for level in self.levels():
+            for encoding in ENCODINGS:
+                self.tokens(level, encoding=encoding)
+        if self._full is not None:
+            for encoding in ENCODINGS:
+                if encoding not in self.tokens_full:
+                    self.tokens_full[encoding] = count_tokens(self._full, encoding=encoding)
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        # Sessions store every level
+        list(self.levels())
+        return {"variants": {k: list(v) for k, v in self.variants.items()},
+                "digest": self.digest, "tokens_full": self.tokens_full}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "PreparedJSON":
+        variants = {}
+        for level, (text, counts) in data["variants"].items():
+            # Sessions cached before per-encoding counts are recounted on use
+            variants[level] = (text, counts if isinstance(counts, dict) else {})
+        tokens_full = data["tokens_full"] if isinstance(data["tokens_full"], dict) else {}
+        return cls(variants, data["digest"], tokens_full)
@@ -0,0 +1,574 @@
+"""
+Synthetic coupon generation for the Rikstoto AI backend.
+
+/api/generate-json builds one coupon per request with nested loops and a
+``random`` call per field, which is far too slow for evaluation datasets
+or load tests of 100k coupons. ``generate_coupons`` produces many coupons
+per call: every random field of a block of coupons (odds, bet
+percentages, finishing positions, markings, winners, prizes) is sampled
+at once as a NumPy array, and the arrays are only turned into the
+familiar JSON structure at the end.
+
+The output has the same schema and scenario semantics as
+/api/generate-json:
+
+    favorites: 2-4 of the four most-bet horses are marked and the favourite wins
+    upsets:    2-4 of the six highest-numbered horses are marked and a
+               horse from the lower half of the betting wins
+    mixed, random: 2-5 random horses are marked and a random horse wins
+    custom:    As mixed, but the first ``desired_correct`` races are hits
+
+Results are reproducible: coupons are drawn in blocks of ``CHUNK_SIZE``
+from a generator seeded with (seed, block number), so coupon ``i`` depends
+only on the seed, its index and the options, not on how many coupons are
+requested. The bet timestamp and race dates count from ``base_date``
+(today by default); pass it explicitly to reproduce a dataset on a
+later day.
+
+``iter_ndjson`` encodes a dataset as NDJSON (optionally gzipped) a block at
+a time for streaming exports; run this module to write one to stdout:
+
+    python coupons.py --count 1000000 --seed 42 --gzip > coupons.ndjson.gz
+"""
+
+import json
+import zlib
+from datetime import date
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# Norwegian Horse Racing Data Pools - Updated 2024/2025
+NORWEGIAN_HORSE_NAMES = (
+    # Popular current horses
+    "Tangen Haap", "Looking Superb", "Wilda", "Sweetlikecandybar", "Disco Volante",
+    "Bolt Brodde", "Clodrique", "Flash Forward", "Victory Lane", "Thunder Strike",
+    "Troll Solen", "Myr Faksen", "Grisle Odin G.L.", "Lionel", "Gullrussen",
+    "Alm Svarten", "Philip Lyn", "Voje Pumbaa", "Moe Odin", "Sjur Foten",
+    "Odd Herakles", "Alm Norfinn", "Valle Grim", "Lykkje Svarten", "Tekno Odin",
+    "Finnskog Torden", "Stjerne Faks", "Bånseth", "Rafolo", "Tyrifaksen",
+    
+    # Classic Norwegian names
+    "Northern Star", "Quick Silver", "Midnight Express", "Storm Chaser", "Dark Shadow",
+    "Lucky Seven", "Speed Demon", "Final Rush", "Viking Storm", "Ice Queen",
+    "Red Lightning", "Blue Diamond", "Green Flash", "Yellow Fever", "Orange Crush",
+    "Purple Rain", "Black Beauty", "White Knight", "Golden Arrow", "Silver Bullet",
+    
+    # International horses racing in Norway
+    "Power Drive", "Easy Rider", "Slow Motion", "Last Chance", "First Class",
+    "Royal Fortune", "Diamond King", "Emerald Queen", "Ruby Red", "Sapphire Blue",
+    "Pearl White", "Crystal Clear", "Alpha Centauri", "Beta Minor", "Gamma Ray",
+    "Delta Force", "Epsilon Plus", "Zeta Jones", "Eta Carinae", "Theta Wave",
+    
+    # Fantasy/creative names
+    "Iota Star", "Quantum Leap", "Sonic Boom", "Light Speed", "Warp Drive",
+    "Hyper Space", "Stellar Wind", "Cosmic Ray", "Solar Flare", "Speed King",
+    "Zulu Warrior", "Powerful Dream", "Night Runner", "Sky Walker", "Moon Shadow",
+    "Star Gazer", "Wind Rider", "Fire Storm", "Ice Breaker", "Mountain King",
+    "Valley Queen", "River Dance", "Ocean Wave", "Desert Storm", "Arctic Fox",
+    
+    # Norse mythology themed
+    "Nordic Prince", "Viking Queen", "Thor's Hammer", "Odin's Raven", "Freya's Gift",
+    "Loki's Trick", "Balder's Light", "Heimdall's Watch", "Frigg's Blessing", "Tyr's Sword",
+    "Fenris Wolf", "Midgard Serpent", "Valhalla Glory", "Asgard Prince", "Bifrost Runner",
+    "Ragnarok Storm", "Yggdrasil Power", "Mjolnir Force", "Sleipnir Speed", "Gungnir Strike"
+)
+
+NORWEGIAN_DRIVERS = (
+    # Top current Norwegian drivers 2024/2025
+    "Eirik Høitomt", "Magnus Teien Gundersen", "Åsbjørn Tengsareid", "Frode Hamre",
+    "Vidar Hop", "Tom Erik Solberg", "Adrian Solberg Akselsen", "Per Oleg Midtfjeld",
+    "Ole Johan Østre", "Dag-Sveinung Dalen", "Jan Eilert Kvam", "Lars Anvar Kolle",
+    "Geir Nordbotten", "Kristian Malmin", "Gunnar Austevoll", "Erlend Rennesvik",
+    
+    # Additional active drivers
+    "Lars O. Romtveit", "Kai Johansen", "Hans Chr. Holm", "Johan Kringeland",
+    "Jomar Blekkan", "Cato Antonsen", "Tobias Kilen", "Geir Mikkelsen",
+    "Ove Wassberg", "Thor Borg", "Øystein Austevoll", "Anders Lundstrøm Wolden",
+    
+    # International drivers racing in Norway
+    "Ulf Ohlsson", "Bjørn Goop", "Magnus A Djuse", "Erik Adielsson",
+    "Jorma Kontio", "Örjan Kihlström", "Peter Untersteiner", "Carl Johan Jepson"
+)
+
+NORWEGIAN_TRAINERS = (
+    # Top Norwegian trainers 2024/2025
+    "Frode Hamre", "Erlend Rennesvik", "Geir Vegard Gundersen", "Jan Martinsen",
+    "Lutfi Kolgjini", "Tom Andersen", "Roger Walmann", "Dag-Sveinung Dalen",
+    "Øystein Tjomsland", "Are Hyldmo", "Trond Anderssen", "Cecilie Andersson",
+    "Kristine Kvasnes", "Per Ludvig Nilsen", "Lars O. Romtveit", "Gunnar Austevoll",
+    
+    # Swedish trainers with horses in Norway
+    "Stefan Melander", "Daniel Redén", "Robert Bergh", "Joakim Løvgren",
+    "Björn Goop", "Timo Nurmos", "Jerry Riordan", "Roger Malmqvist"
+)
+
+# Updated Norwegian tracks 2024/2025
+NORWEGIAN_TRACKS = (
+    "Bjerke",           # Oslo - National arena
+    "Klosterskogen",    # Drammen area
+    "Jarlsberg",        # Tønsberg
+    "Momarken",         # Mysen
+    "Forus",            # Stavanger - Oldest still active
+    "Bergen Travpark",  # Bergen
+    "Biri",             # Gjøvik area
+    "Sørlandet",        # Kristiansand
+    "Harstad",          # Harstad
+    "Bodø",             # Bodø
+    "Varig Orkla Arena", # Orkdal
+    "Voss",             # Voss
+    "Nossum",           # Løten
+    "Rissa",            # Rissa
+    "Lofoten Travpark", # Lofoten
+    "Olsborgmoen",      # Nord-Odal
+)
+
+RACE_DISTANCES = (1609, 2100, 2140, 2600, 2609, 3100)
+START_METHODS = ("A", "V")  # A = Auto, V = Volt
+
+# Races per product; Stalltips is a V75 shared coupon
+PRODUCT_RACES = {"V75": 7, "V64": 6, "V5": 5, "DD": 2, "Stalltips": 7}
+
+# Products sold as a Stalltips share (one shared coupon at a price level)
+STALLTIPS_PRODUCTS = ("V75", "V64", "V5", "Stalltips")
+STALLTIPS_PRICES = (98, 196, 294, 392, 490)
+STALLTIPS_STRATEGIES = ("Favoritt-fokus", "Balansert mix", "Outsider-jakt", "Sikker strategi")
+STALLTIPS_CONFIDENCE = ("Høy", "Medium", "Moderat")
+START_MINUTES = ("00", "15", "30", "45")
+GENDERS = ("H", "V", "G")
+
+# Prize tiers per number of races: (key, correct races, share of the prize
+# pool, min winners, max winners, only paid out when every race is correct)
+PRIZE_TIERS = {
+    7: (("sevenCorrect", 7, 0.4, 1, 5, True), ("sixCorrect", 6, 0.3, 5, 50, False),
+        ("fiveCorrect", 5, 0.3, 100, 1000, False)),
+    6: (("sixCorrect", 6, 0.5, 1, 10, False), ("fiveCorrect", 5, 0.3, 20, 200, False),
+        ("fourCorrect", 4, 0.2, 500, 5000, False)),
+    5: (("fiveCorrect", 5, 0.5, 5, 50, True), ("fourCorrect", 4, 0.3, 50, 500, False),
+        ("threeCorrect", 3, 0.2, 500, 5000, False)),
+    2: (("twoCorrect", 2, 1.0, 10, 100, True),),
+}
+
+MIN_HORSES = 8
+MAX_HORSES = 15
+# Coupons drawn per generator; part of the seeding, so changing it changes every dataset
+CHUNK_SIZE = 256
+# Fastest gzip level: keeps pace with generation and still shrinks coupons about 5x
+GZIP_LEVEL = 1
+
+
+
+def _bet_band(slot: int, starters: int) -> Tuple[float, float]:
+    """Bet percentage range of the horse at public ranking ``slot`` (0 = favourite)."""
+    if slot == 0:
+        return (25, 45)
+    if slot == 1:
+        return (15, 25)
+    if slot == 2:
+        return (8, 15)
+    if slot < starters // 2:
+        return (3, 8)
+    return (0.1, 3)
+
+
+# Index tables per field size (number of starters), built once so races
+# are assembled by lookup instead of recomputing ranges for every race
+FIELD_SIZES = range(MIN_HORSES, MAX_HORSES + 1)
+# Bet percentage range of each public ranking slot
+BET_BANDS = {n: tuple(_bet_band(slot, n) for slot in range(n)) for n in FIELD_SIZES}
+# Horses a scenario may mark; scenarios not listed mark any horse
+MARK_CANDIDATES = {
+    "favorites": {n: range(1, min(5, n + 1)) for n in FIELD_SIZES},
+    "upsets": {n: range(max(1, n - 5), n + 1) for n in FIELD_SIZES},
+    None: {n: range(1, n + 1) for n in FIELD_SIZES},
+}
+# How many horses a scenario marks per race (inclusive)
+MARK_COUNTS = {"favorites": (2, 4), "upsets": (2, 4), None: (2, 5)}
+# Possible winners of an upset: the lower half of the betting
+UPSET_WINNERS = {n: range(n // 2, n + 1) for n in FIELD_SIZES}
+
+# BET_BANDS as an array indexed by [starters, slot, low/high] for the bulk generator
+_BET_BAND_ARRAY = np.zeros((MAX_HORSES + 1, MAX_HORSES, 2))
+for _n in FIELD_SIZES:
+    _BET_BAND_ARRAY[_n, :_n] = BET_BANDS[_n]
+
+
+class _Chunk:
+    """All random draws for one block of ``CHUNK_SIZE`` coupons.
+
+    Every array is drawn in a fixed order whatever the options, so the
+    options only change how draws are used, never which draws a coupon gets.
+    """
+
+    def __init__(self, seed: int, index: int, races: int, scenario: str):
+        rng = np.random.default_rng([seed, index])
+        n, shape, slots = CHUNK_SIZE, (CHUNK_SIZE, races), np.arange(MAX_HORSES)
+
+        # Coupon level
+        self.track = rng.integers(0, len(NORWEGIAN_TRACKS), n)
+        self.day_offset = rng.integers(1, 31, n)
+        self.start_hour = rng.integers(17, 21, n)
+        self.start_minute = rng.integers(0, len(START_MINUTES), n)
+        self.strategy = rng.integers(0, len(STALLTIPS_STRATEGIES), n)
+        self.confidence = rng.integers(0, len(STALLTIPS_CONFIDENCE), n)
+        self.price = rng.integers(0, len(STALLTIPS_PRICES), n)
+        self.bet_number = rng.integers(100000, 1000000, n)
+        self.bet_second = rng.integers(0, 86400, n)
+        self.total_pool = rng.integers(500000, 15000001, n)
+        jackpot = rng.integers(0, 5000001, n)
+        self.jackpot = np.where(rng.random(n) > 0.7, jackpot, 0)
+        # Horse names without replacement: the lowest random keys pick them
+        name_count = min(len(NORWEGIAN_HORSE_NAMES), races * 12)
+        self.names = _HORSE_NAMES[np.argsort(rng.random((n, len(NORWEGIAN_HORSE_NAMES))), axis=1)[:, :name_count]]
+
+        # Race level
+        self.starters = rng.integers(MIN_HORSES, MAX_HORSES + 1, shape)
+        self.distance = rng.integers(0, len(RACE_DISTANCES), shape)
+        self.start_method = rng.integers(0, len(START_METHODS), shape)
+        self.race_pool = rng.integers(100000, 2000001, shape)
+        valid = slots < self.starters[..., None]
+
+        # Finishing positions: a random permutation of 1..starters per race
+        keys = np.where(valid, rng.random(shape + (MAX_HORSES,)), 2.0)
+        self.positions = np.argsort(keys, axis=-1) + 1
+
+        # Markings: pick k of the scenario's candidate horses by lowest random key
+        if scenario == "favorites":
+            first, candidates, marks = np.ones(shape, int), np.full(shape, 4), rng.integers(2, 5, shape)
+        elif scenario == "upsets":
+            first, candidates, marks = self.starters - 5, np.full(shape, 6), rng.integers(2, 5, shape)
+        else:
+            first, candidates, marks = np.ones(shape, int), self.starters, rng.integers(2, 6, shape)
+        keys = np.where(slots < candidates[..., None], rng.random(shape + (MAX_HORSES,)), 2.0)
+        chosen = np.argsort(np.argsort(keys, axis=-1), axis=-1) < marks[..., None]
+        candidate = slots + 1 - first[..., None]
+        in_range = (candidate >= 0) & (candidate < candidates[..., None]) & valid
+        picked = np.take_along_axis(chosen, np.clip(candidate, 0, MAX_HORSES - 1), axis=-1)
+        self.marked = in_range & picked
+
+        # Bet percentages fall with public ranking, then are normalised to 100
+        bands = _BET_BAND_ARRAY[self.starters]
+        share = bands[..., 0] + rng.random(shape + (MAX_HORSES,)) * (bands[..., 1] - bands[..., 0])
+        share = np.where(valid, share, 0.0)
+        self.bet_pct = share / share.sum(axis=-1, keepdims=True) * 100
+        safe_pct = np.where(valid, self.bet_pct, 1.0)
+        self.odds = np.minimum(np.round(95 / safe_pct, 1), 999.0)
+        self.pct_rounded = np.round(self.bet_pct, 1)
+        self.amount_bet = (self.race_pool[..., None] * self.bet_pct / 100).astype(np.int64)
+        # Public ranking by rounded share, ties in horse order (as a stable sort does)
+        self.by_bets = np.argsort(np.where(valid, -self.pct_rounded, np.inf), axis=-1, kind="stable")
+
+        # Horse details; only marked horses show them, so only those are kept
+        horses = shape + (MAX_HORSES,)
+        self.driver = _DRIVERS[rng.integers(0, len(NORWEGIAN_DRIVERS), horses)]
+        trainer = rng.integers(0, len(NORWEGIAN_TRAINERS), horses)
+        form = rng.integers(1, 10, horses + (5,))
+        win_pct = rng.integers(10, 41, horses)
+        place_pct = rng.integers(30, 81, horses)
+        earnings = rng.integers(100000, 2000001, horses)
+        age = rng.integers(3, 11, horses)
+        gender = rng.integers(0, len(GENDERS), horses)
+        picked = self.marked.nonzero()
+        form = form[picked] - 1
+        self.details = [
+            {"trainer": t, "form": f, "winPercentage": w, "placePercentage": p,
+             "earnings": e, "age": a, "gender": g}
+            for t, f, w, p, e, a, g in zip(
+                _TRAINERS[trainer[picked]].tolist(),
+                _FORMS[form[:, 0], form[:, 1], form[:, 2], form[:, 3], form[:, 4]].tolist(),
+                win_pct[picked].tolist(), place_pct[picked].tolist(), earnings[picked].tolist(),
+                age[picked].tolist(), _GENDERS[gender[picked]].tolist())
+        ]
+        # Position of each horse's details in self.details (-1 when unmarked)
+        self.detail_index = np.full(horses, -1)
+        self.detail_index[picked] = np.arange(len(self.details))
+
+        # Winners
+        draw = rng.random(shape)
+        if scenario == "favorites":
+            self.winner = self.by_bets[..., 0] + 1
+        elif scenario == "upsets":
+            low = self.starters // 2
+            self.winner = low + (draw * (self.starters - low + 1)).astype(int)
+        else:
+            self.winner = 1 + (draw * self.starters).astype(int)
+        self.hit = np.take_along_axis(self.marked, (self.winner - 1)[..., None], axis=-1)[..., 0]
+
+        # Prizes and statistics
+        tiers = PRIZE_TIERS[races]
+        self.prize_winners = [rng.integers(tier[3], tier[4] + 1, n) for tier in tiers]
+        self.prize_divisor = [rng.integers(tier[3], tier[4] + 1, n) for tier in tiers]
+        self.coverage = np.round(rng.uniform(0.5, 2.5, n), 2)
+        self.bettors = rng.integers(10000, 100001, n)
+        self.average_bet = rng.integers(50, 501, n)
+
+        # Plain lists are much faster to index than arrays when building dicts
+        for name, value in list(vars(self).items()):
+            if isinstance(value, np.ndarray):
+                setattr(self, name, value.tolist())
+        self.prize_winners = [w.tolist() for w in self.prize_winners]
+        self.prize_divisor = [d.tolist() for d in self.prize_divisor]
+
+
+# Pools as object arrays, so a whole array of draws maps to strings in one step
+_HORSE_NAMES = np.array(NORWEGIAN_HORSE_NAMES, dtype=object)
+_DRIVERS = np.array(NORWEGIAN_DRIVERS, dtype=object)
+_TRAINERS = np.array(NORWEGIAN_TRAINERS, dtype=object)
+_GENDERS = np.array(GENDERS, dtype=object)
+# Every possible form line ("3-1-7-2-9"), indexed by its placings minus one
+_FORMS = np.array(["-".join(str(place + 1) for place in places) for places in np.ndindex(9, 9, 9, 9, 9)],
+                  dtype=object).reshape(9, 9, 9, 9, 9)
+
+
+def _coupon(chunk: _Chunk, i: int, options: Dict[str, Any], base_date: date) -> Dict[str, Any]:
+    """Assemble coupon ``i`` of a chunk in the /api/generate-json schema."""
+    product = options["product"]
+    races = PRODUCT_RACES[product]
+    track = options["track"] or NORWEGIAN_TRACKS[chunk.track[i]]
+    race_date = date.fromordinal(base_date.toordinal() + chunk.day_offset[i])
+
+    coupon: Dict[str, Any] = {
+        "product": product if product != "Stalltips" else "V75",
+        "track": track,
+        "date": race_date.strftime("%Y-%m-%d"),
+        "startTime": f"{chunk.start_hour[i]}:{START_MINUTES[chunk.start_minute[i]]}",
+    }
+    if options["include_stalltips"] or product == "Stalltips":
+        coupon["stalltipsInfo"] = {
+            "type": "Stalltips",
+            "generatedBy": "Rikstoto Algorithm v3.2",
+            "strategy": STALLTIPS_STRATEGIES[chunk.strategy[i]],
+            "confidence": STALLTIPS_CONFIDENCE[chunk.confidence[i]],
+            "description": "Algoritmisk generert kupong basert på siste odds og spillemønster"
+        }
+
+    share_type = None
+    if product in STALLTIPS_PRODUCTS:
+        stake = options["stake"] or STALLTIPS_PRICES[chunk.price[i]]
+        rows, bet_type = 1, "Stalltips"
+        if stake <= 98:
+            share_type = "Lite spill"
+        elif stake <= 196:
+            share_type = "Standard spill"
+        elif stake <= 294:
+            share_type = "Stort spill"
+        else:
+            share_type = f"Eget beløp ({stake} kr)"
+    else:
+        rows, stake, bet_type = options["rows"] or 1, options["stake"] or 50, product
+    bet_second = chunk.bet_second[i]
+    coupon["betDetails"] = {
+        "betId": f"{product}-{race_date.strftime('%Y-%m%d')}-{track[:2].upper()}-{chunk.bet_number[i]}",
+        "betType": bet_type,
+        "systemPlay": False,
+        "rows": rows,
+        "costPerRow": stake,
+        "totalCost": stake,
+        "currency": "NOK",
+        "timestamp": f"{base_date.isoformat()}T{bet_second // 3600:02d}:{bet_second // 60 % 60:02d}:"
+                     f"{bet_second % 60:02d}Z"
+    }
+    if share_type:
+        coupon["betDetails"]["shareType"] = share_type
+
+    total_pool = options["pool_size"] or chunk.total_pool[i]
+    coupon["poolInfo"] = {
+        "totalPool": total_pool,
+        "currentPool": total_pool,
+        "bettingStatus": "open",
+        "jackpot": chunk.jackpot[i]
+    }
+
+    names = chunk.names[i]
+    race_name = "V75" if product == "Stalltips" else product
+    markings, race_results, name_index = {}, [], 0
+    for r in range(races):
+        starters = chunk.starters[i][r]
+        marked, positions = chunk.marked[i][r], chunk.positions[i][r]
+        odds, pct, amount = chunk.odds[i][r], chunk.pct_rounded[i][r], chunk.amount_bet[i][r]
+        drivers, details = chunk.driver[i][r], chunk.detail_index[i][r]
+        results = []
+        for h in range(starters):
+            name_slot = name_index + h
+            horse = {
+                "horse": h + 1,
+                "position": positions[h],
+                "marked": "true" if marked[h] else "false",
+                "name": names[name_slot] if name_slot < len(names) else f"Hest {h + 1}",
+                "driver": drivers[h],
+                "odds": odds[h],
+                "percentageBet": pct[h],
+                "amountBet": amount[h],
+                "publicRanking": h + 1
+            }
+            if marked[h]:
+                horse.update(chunk.details[details[h]])
+            results.append(horse)
+        name_index += starters
+        markings[str(r + 1)] = [h + 1 for h in range(starters) if marked[h]]
+
+        race = {
+            "race": r + 1,
+            "name": f"{race_name}-{r + 1}",
+            "distance": RACE_DISTANCES[chunk.distance[i][r]],
+            "startMethod": START_METHODS[chunk.start_method[i][r]],
+            "totalStarters": starters,
+            "poolSize": chunk.race_pool[i][r],
+            "results": results
+        }
+        if options["include_betting_distribution"]:
+            top = chunk.by_bets[i][r]
+            race["bettingDistribution"] = {
+                key: {"horse": top[rank] + 1, "percentage": pct[top[rank]]}
+                for rank, key in enumerate(("favorite", "secondChoice", "thirdChoice"))
+            }
+        winner = chunk.winner[i][r]
+        race["winner"] = winner
+        race["winnerName"] = results[winner - 1]["name"]
+        race["winnerOdds"] = odds[winner - 1]
+        race["hit"] = chunk.hit[i][r]
+        race_results.append(race)
+
+    coupon["markings"] = markings
+    # No race ever has a single marked horse, so there are no bankers
+    coupon["bankers"] = []
+    coupon["raceResults"] = race_results
+
+    if options["scenario"] == "custom" and options["desired_correct"] is not None:
+        correct_races = min(options["desired_correct"], races)
+        for r, race in enumerate(race_results):
+            race["hit"] = r < correct_races
+    else:
+        correct_races = sum(1 for race in race_results if race["hit"])
+
+    prize_pool = total_pool * 0.65
+    prizes, payout = {}, 0
+    for t, (key, correct, share, _, _, needs_all) in enumerate(PRIZE_TIERS[races]):
+        paid = not needs_all or correct_races == correct
+        amount = round(prize_pool * share / chunk.prize_divisor[t][i]) if paid else 0
+        prizes[key] = {"winners": chunk.prize_winners[t][i] if paid else 0, "amount": amount}
+        if correct_races == correct:
+            payout = amount * rows
+    if options["force_win"] and options["target_payout"] is not None:
+        payout = options["target_payout"]
+
+    coupon["result"] = {
+        "status": "generated",
+        "correctRaces": correct_races,
+        "totalRaces": races,
+        "prizeLevel": f"{correct_races} av {races} rette",
+        "payout": payout,
+        "roi": round(payout / stake * 100, 2) if payout > 0 else 0
+    }
+    coupon["prizes"] = prizes
+    coupon["statistics"] = {
+        "coveragePercentage": chunk.coverage[i],
+        "averageWinnerOdds": round(sum(race["winnerOdds"] for race in race_results) / races, 2),
+        "favoriteWins": sum(1 for race in race_results if race["winner"] <= 3),
+        "outsiderWins": sum(1 for race in race_results if race["winner"] > race["totalStarters"] - 3),
+        "totalBettors": chunk.bettors[i],
+        "averageBetSize": chunk.average_bet[i]
+    }
+    return coupon
+
+
+def new_seed() -> int:
+    """A fresh random seed, to report back so a generated dataset can be reproduced."""
+    return int(np.random.SeedSequence().entropy % (2 ** 63))
+
+
+def iter_coupons(count: int, seed: int, start: int = 0, base_date: Optional[date] = None,
+                 product: str = "V75", scenario: str = "mixed", track: Optional[str] = None,
+                 include_stalltips: bool = True, include_betting_distribution: bool = True,
+                 desired_correct: Optional[int] = None, force_win: Optional[bool] = None,
+                 target_payout: Optional[int] = None, stake: Optional[int] = None,
+                 rows: Optional[int] = None, pool_size: Optional[int] = None,
+                 **_: Any) -> Iterator[Dict[str, Any]]:
+    """Yield coupons ``start`` to ``start + count - 1`` of the dataset for ``seed``.
+
+    Coupons are drawn a block of ``CHUNK_SIZE`` at a time, so memory stays
+    flat however many are requested. Keyword options are the fields of
+    /api/generate-json's request (fields the generator ignores, such as
+    marking_strategy, are accepted and ignored here too).
+
+    Args:
+        count: Number of coupons
+        seed: Dataset seed
+        start: Index of the first coupon (to continue or page through a dataset)
+        base_date: Day the bets are placed; races follow within 30 days (default: today)
+
+    Yields:
+        Coupon dictionaries in the /api/generate-json schema
+    """
+    options = {
+        "product": product, "scenario": scenario, "track": track, "include_stalltips": include_stalltips,
+        "include_betting_distribution": include_betting_distribution, "desired_correct": desired_correct,
+        "force_win": force_win, "target_payout": target_payout, "stake": stake, "rows": rows,
+        "pool_size": pool_size
+    }
+    base_date = base_date or date.today()
+    races = PRODUCT_RACES[product]
+    end = start + count
+    for chunk_index in range(start // CHUNK_SIZE, (end - 1) // CHUNK_SIZE + 1 if count > 0 else 0):
+        chunk = _Chunk(seed, chunk_index, races, scenario)
+        first = chunk_index * CHUNK_SIZE
+        for i in range(max(start, first) - first, min(end, first + CHUNK_SIZE) - first):
+            yield _coupon(chunk, i, options, base_date)
+
+
+def generate_coupons(count: int, seed: int, **options: Any) -> List[Dict[str, Any]]:
+    """``count`` coupons of the dataset for ``seed`` as a list (see ``iter_coupons``)."""
+    return list(iter_coupons(count, seed, **options))
+
+
+def iter_ndjson(count: int, seed: int, compress: bool = False, **options: Any) -> Iterator[bytes]:
+    """Yield a dataset as NDJSON, one encoded block of ``CHUNK_SIZE`` coupons at a time.
+
+    Only one block is held in memory, so datasets of any size can be
+    streamed to a client or a file.
+
+    Args:
+        count: Number of coupons
+        seed: Dataset seed
+        compress: Yield a gzip stream (for a ``.ndjson.gz`` file) instead of plain NDJSON
+        **options: As for ``iter_coupons``
+
+    Yields:
+        Byte blocks that concatenate to the whole (possibly gzipped) file
+    """
+    gzip = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if compress else None
+    lines: List[str] = []
+    for coupon in iter_coupons(count, seed, **options):
+        lines.append(json.dumps(coupon, ensure_ascii=False, separators=(",", ":")))
+        if len(lines) == CHUNK_SIZE:
+            block = ("\n".join(lines) + "\n").encode()
+            lines = []
+            block = gzip.compress(block) if gzip else block
+            if block:
+                yield block
+    block = ("\n".join(lines) + "\n").encode() if lines else b""
+    if gzip:
+        block = gzip.compress(block) + gzip.flush()
+    if block:
+        yield block
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Write a generated coupon dataset as NDJSON to stdout")
+    parser.add_argument("--count", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=None, help="Dataset seed (default: random, printed to stderr)")
+    parser.add_argument("--start", type=int, default=0)
+    parser.add_argument("--product", default="V75", choices=list(PRODUCT_RACES))
+    parser.add_argument("--scenario", default="mixed", choices=["favorites", "upsets", "mixed", "random", "custom"])
+    parser.add_argument("--base-date", type=date.fromisoformat, default=None, help="YYYY-MM-DD (default: today)")
+    parser.add_argument("--gzip", action="store_true", help="Write gzip-compressed NDJSON")
+    args = parser.parse_args()
+
+    seed = args.seed if args.seed is not None else new_seed()
+    print(f"seed={seed}", file=sys.stderr)
+    for block in iter_ndjson(args.count, seed, compress=args.gzip, start=args.start, base_date=args.base_date,
+                             product=args.product, scenario=args.scenario):
+        sys.stdout.buffer.write(block)
@@ -0,0 +1,19 @@
+"""
+Parsing helpers for the backend's environment-variable configuration.
+
+Several settings map keys to values in a single variable, e.g.
+SCHEDULER_PROVIDER_LIMITS="azure_openai=32,mistral=8" or
+MODEL_TIMEOUTS="o3-mini=120,gpt-4o=45". They all share one parser.
+"""
+
+from typing import Dict
+
+
+def parse_pairs(spec: str) -> Dict[str, str]:
+    """Parse "key=value,key=value" into a dictionary (items without "=" are ignored)."""
+    pairs = {}
+    for item in spec.split(","):
+        if "=" in item:
+            key, value = item.split("=", 1)
+            pairs[key.strip()] = value.strip()
+    return pairs
@@ -0,0 +1,179 @@
+"""
+Deadlines, per-model timeouts and hedged calls for the Rikstoto AI backend.
+
+A /generate-all comparison is only as fast as its slowest model, and o3
+models may reason for up to two minutes. Every generation therefore runs
+under a timeout: the model's budget, capped by the deadline of the request
+it belongs to. A model that runs out of time is reported as failed, while
+the other models' results are kept.
+
+Hedging (optional) targets the tail: when the primary call has not
+answered by the time the model's p95 latency has passed, a duplicate
+request goes to a secondary route (another Azure deployment, or the
+direct Anthropic or Google API) and the first successful answer wins. The
+slower call is cancelled. A hedge needs a free scheduler slot of its own,
+so it is skipped when the provider is already at its concurrency cap.
+
+Configuration via environment variables:
+    GENERATE_ALL_DEADLINE_SECONDS: Deadline for a whole /generate-all request (default: 90)
+    MODEL_TIMEOUTS: Per-model timeout budgets in seconds, e.g. "o3-mini=120,gpt-4o=45"
+    DEFAULT_MODEL_TIMEOUT: Budget for models without one (default: 60)
+    HEDGING_ENABLED: Send hedged requests to secondary routes (default: false)
+    HEDGE_QUANTILE: Latency quantile after which a hedge is sent (default: 0.95)
+    HEDGE_MIN_SAMPLES: Observations needed before the quantile is trusted (default: 20)
+    HEDGE_DEFAULT_DELAY_SECONDS: Hedge delay until then (default: 8)
+    HEDGE_AZURE_DEPLOYMENTS: Secondary Azure deployments, e.g. "gpt-4o=gpt-4o-swedencentral"
+"""
+
+import asyncio
+import contextvars
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from envconfig import parse_pairs
+
+# Timeout budget per model in seconds; o3 models reason before answering
+MODEL_TIMEOUTS = {
+    "gpt-4o": 45,
+    "gpt-4o-mini": 30,
+    "o3-mini": 120,
+    "mistral-large": 45,
+    "claude-3-5-sonnet": 45,
+    "gemini-1-5-flash": 30,
+}
+
+
+def model_timeout(model_name: str, requested: Optional[float] = None) -> float:
+    """Timeout budget for one generation (a requested timeout can only shorten it)."""
+    overrides = parse_pairs(os.getenv("MODEL_TIMEOUTS", ""))
+    if model_name in overrides:
+        budget = float(overrides[model_name])
+    else:
+        budget = float(MODEL_TIMEOUTS.get(model_name, os.getenv("DEFAULT_MODEL_TIMEOUT", "60")))
+    return min(budget, requested) if requested else budget
+
+
+def request_deadline(requested: Optional[float] = None) -> float:
+    """Deadline in seconds for a whole /generate-all request."""
+    default = float(os.getenv("GENERATE_ALL_DEADLINE_SECONDS", "90"))
+    return min(default, requested) if requested else default
+
+
+# Monotonic time by which the current generation must finish (None: no deadline)
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("deadline", default=None)
+
+
+def set_deadline(seconds: float) -> None:
+    """Start the deadline of the current generation ``seconds`` from now.
+
+    Set inside the task that runs the generation, so it covers exactly
+    the calls (and retries) made for it.
+    """
+    _deadline.set(time.monotonic() + seconds)
+
+
+def time_remaining() -> Optional[float]:
+    """Seconds left before the current generation's deadline; None without one."""
+    deadline = _deadline.get()
+    return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+
+def hedge_deployment(model_name: str) -> Optional[str]:
+    """Secondary Azure OpenAI deployment for a model, if one is configured."""
+    return parse_pairs(os.getenv("HEDGE_AZURE_DEPLOYMENTS", "")).get(model_name)
+
+
+class Hedger:
+    """Run a call with a hedged duplicate on a secondary route.
+
+    Args:
+        enabled: Whether hedges are sent at all
+        quantile: Latency quantile after which the hedge is sent
+        min_samples: Observations needed before the quantile is used
+        default_delay: Hedge delay until enough observations exist
+    """
+
+    def __init__(self, enabled: bool = False, quantile: float = 0.95, min_samples: int = 20,
+                 default_delay: float = 8.0):
+        self.enabled = enabled
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.default_delay = default_delay
+        # Metrics per model
+        self.fired: Dict[str, int] = {}
+        self.won: Dict[str, int] = {}
+        self.skipped: Dict[str, int] = {}
+
+    @classmethod
+    def from_env(cls) -> "Hedger":
+        return cls(
+            enabled=os.getenv("HEDGING_ENABLED", "false").lower() == "true",
+            quantile=float(os.getenv("HEDGE_QUANTILE", "0.95")),
+            min_samples=int(os.getenv("HEDGE_MIN_SAMPLES", "20")),
+            default_delay=float(os.getenv("HEDGE_DEFAULT_DELAY_SECONDS", "8"))
+        )
+
+    async def run(self, model_name: str, primary: Callable[[], Awaitable[Any]],
+                  secondary: Optional[Callable[[], Awaitable[Any]]], delay: Optional[float],
+                  is_error: Callable[[Any], bool],
+                  can_hedge: Optional[Callable[[], bool]] = None) -> Tuple[Any, str]:
+        """Call ``primary``, and ``secondary`` too if the primary is still running after ``delay``.
+
+        Args:
+            model_name: Model the calls are for (used for metrics)
+            primary: Zero-argument coroutine function for the normal route
+            secondary: Same call on another route, or None if there is none
+            delay: Seconds to wait before hedging; None for the default delay
+            is_error: Whether a result is a failure (the other call is then awaited)
+            can_hedge: Whether there is capacity for the hedge when it is due;
+                if not, only the primary is awaited
+
+        Returns:
+            Tuple of (result, route) where route is "primary" or "hedge". If
+            both calls fail, the primary's failure is returned.
+        """
+        if not self.enabled or secondary is None:
+            return await primary(), "primary"
+        first = asyncio.ensure_future(primary())
+        tasks = {first: "primary"}
+        try:
+            done, _ = await asyncio.wait({first}, timeout=self.default_delay if delay is None else delay)
+            if not done and can_hedge is not None and not can_hedge():
+                self.skipped[model_name] = self.skipped.get(model_name, 0) + 1
+            elif not done:
+                self.fired[model_name] = self.fired.get(model_name, 0) + 1
+                tasks[asyncio.ensure_future(secondary())] = "hedge"
+            failures: Dict[str, Any] = {}
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    route = tasks[task]
+                    if task.exception() is not None:
+                        failures[route] = task.exception()
+                        continue
+                    if is_error(task.result()):
+                        failures[route] = task.result()
+                        continue
+                    if route == "hedge":
+                        self.won[model_name] = self.won.get(model_name, 0) + 1
+                    return task.result(), route
+            failure = failures.get("primary", failures.get("hedge"))
+            if isinstance(failure, BaseException):
+                raise failure
+            return failure, "primary"
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hedges sent, won and skipped (no capacity) per model."""
+        return {
+            "enabled": self.enabled,
+            "quantile": self.quantile,
+            "fired": dict(self.fired),
+            "won": dict(self.won),
+            "skipped": dict(self.skipped)
+        }
@@ -12,22 +12,34 @@ License: MIT
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse
-from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Optional, List, Dict, Any, AsyncIterator, Awaitable, Callable, Iterator, Literal, Tuple
 import json
 import os
 from dotenv import load_dotenv
-import requests
-from openai import AzureOpenAI
-import anthropic
+import httpx
 import google.generativeai as genai
 import hashlib
-from datetime import datetime, timedelta
+from datetime import date, datetime
 import uuid
 import asyncio
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import logging
+import openai
+from clients import ProviderClientRegistry, HTTPClientPool, AZURE_OPENAI_MODELS
+from scheduler import GenerationScheduler
+from cache import cache_from_env
+from singleflight import SingleFlight
+from templates import compile_template, template_cache_stats
+from compaction import PreparedJSON
+from tokens import count_tokens, estimate_generation, token_counter
+from request_log import StructuredLogger, current_request_log, log_fields
+from metrics import generation_latency, render_prometheus, render_sample
+from hedging import Hedger, hedge_deployment, model_timeout, request_deadline, set_deadline, time_remaining
+from breakers import ProviderGuards, error_summary, is_neutral_error
+from ratelimit import RateLimiterRegistry, RateLimitTimeout
+from batch import BatchRunner
 
 # Load environment variables from .env file
 load_dotenv()
@@ -56,10 +68,27 @@ except ImportError:
             return func
         return decorator
 
-# In-memory cache for JSON data and AI responses
-json_cache = {}  # Format: {session_id: {"json": data, "timestamp": datetime}}
-response_cache = {}  # Format: {cache_key: {"response": data, "timestamp": datetime}}
+# Long-lived Azure OpenAI clients shared by /generate and /generate-all
+provider_clients = ProviderClientRegistry(wrapper=wrap_openai if LANGSMITH_AVAILABLE else None)
+# One pooled async HTTP client per upstream host (Mistral, Databricks, APIM, Hugging Face)
+http_clients = HTTPClientPool()
+# Process-wide cap on upstream generations, shared by all endpoints
+generation_scheduler = GenerationScheduler.from_env()
+
+# Caches for prepared JSON and AI responses (memory, SQLite or Redis - see CACHE_BACKEND)
 CACHE_TTL_MINUTES = 30  # Cache TTL
+json_cache = cache_from_env("sessions", "SESSION_CACHE", CACHE_TTL_MINUTES * 60)  # {session_id: PreparedJSON.to_dict()}
+response_cache = cache_from_env("responses", "RESPONSE_CACHE", CACHE_TTL_MINUTES * 60)  # {cache_key: response}
+# Identical generations already in flight are shared instead of sent upstream again
+generation_flights = SingleFlight()
+# One structured JSON log line per generation (see LOG_LEVEL and LOG_SAMPLE_RATE)
+request_logger = StructuredLogger.from_env()
+# Duplicate slow calls to a secondary route (see HEDGING_ENABLED)
+hedger = Hedger.from_env()
+# Circuit breaker and AIMD concurrency limit per provider, feeding the scheduler's caps
+provider_guards = ProviderGuards.from_env(on_limit_change=generation_scheduler.set_adaptive_limit)
+# RPM/TPM pacing and 429 retries per Azure OpenAI deployment (see AZURE_OPENAI_QUOTAS)
+rate_limiters = RateLimiterRegistry.from_env()
 
 # Initialize FastAPI application
 app = FastAPI(
@@ -74,6 +103,28 @@ app = FastAPI(
 if os.getenv("RENDER"):
     print("🚀 Running on Render - extended timeouts enabled for O3 models")
 
+@app.on_event("startup")
+async def create_provider_clients() -> None:
+    """Create pooled provider clients once so requests reuse warm connections."""
+    provider_clients.warm(AZURE_OPENAI_MODELS)
+    request_logger.start()
+    # Load tokenizers off the event loop so the first request doesn't download them
+    await asyncio.to_thread(token_counter.warm)
+    # Pick up batch jobs a previous process left unfinished
+    resumed = await batch_runner.resume()
+    if resumed:
+        print(f"🔁 Resumed {len(resumed)} batch job(s)")
+
+@app.on_event("shutdown")
+async def close_provider_clients() -> None:
+    """Close pooled provider connections and cache backends on shutdown."""
+    await provider_clients.close()
+    await http_clients.close()
+    await json_cache.close()
+    await response_cache.close()
+    await batch_runner.close()
+    request_logger.stop()
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3001"],
@@ -87,7 +138,9 @@ class GenerationRequest(BaseModel):
     
     Attributes:
         model_name: Hugging Face model identifier
-        system_prompt: The prompt template (can include {{json}} placeholder)
+        system_prompt: The prompt template (can include {{json}}, {{model}} and
+            {{user_prompt}} placeholders)
+        user_prompt: Optional user message, inserted at {{user_prompt}} if present
         json_data: Optional JSON string to be inserted into the prompt
         session_id: Optional session ID to use cached JSON data
         use_cache: Whether to check response cache (default: True)
@@ -95,9 +148,11 @@ class GenerationRequest(BaseModel):
         temperature: Controls randomness in generation (0.0-1.0, default: 0.7)
         top_p: Nucleus sampling parameter (0.0-1.0, default: 0.9)
         top_k: Top-k sampling parameter (default: 50)
+        timeout_seconds: Optional timeout, capped at the model's budget
     """
     model_name: str
     system_prompt: str
+    user_prompt: Optional[str] = None
     json_data: Optional[str] = None
     session_id: Optional[str] = None
     use_cache: Optional[bool] = True
@@ -105,6 +160,7 @@ class GenerationRequest(BaseModel):
     temperature: Optional[float] = 0.7
     top_p: Optional[float] = 0.9
     top_k: Optional[int] = 50
+    timeout_seconds: Optional[float] = None
 
 class ModelInfo(BaseModel):
     """Information about an available AI model.
@@ -305,57 +361,108 @@ AVAILABLE_MODELS = [
     )
 ]
 
+def azure_chat_params(prompt: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """Build Azure OpenAI chat completion parameters (without the deployment)."""
+    return {
+        "messages": [
+            {"role": "system", "content": "Du er en hjelpsom AI-assistent for Norsk Rikstoto."},
+            {"role": "user", "content": prompt}
+        ],
+        "temperature": params.get("temperature", 0.7),
+        "top_p": params.get("top_p", 0.9),
+        "max_tokens": params.get("max_tokens", params.get("max_length", 500))
+    }
+
+def is_rate_limited(error: Exception) -> bool:
+    """Whether an Azure OpenAI call failed on quota (429 or no slot before the deadline)."""
+    return isinstance(error, (openai.RateLimitError, RateLimitTimeout))
+
+def azure_error_message(error: Exception) -> str:
+    """Sanitize an Azure OpenAI error message to avoid exposing sensitive data."""
+    if is_rate_limited(error):
+        return "Azure OpenAI rate limit reached. Please try again shortly."
+    error_msg = str(error)
+    if "401" in error_msg or "authentication" in error_msg.lower():
+        return "Azure OpenAI authentication failed. Please check configuration."
+    elif "404" in error_msg:
+        return "Azure OpenAI deployment not found."
+    # Only return generic error message in production
+    return "Azure OpenAI request failed."
+
+# 429s plus errors where the request may not have reached the model
+AZURE_RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+
+async def create_azure_completion(client: Any, deployment_name: str, model_name: str,
+                                  api_params: Dict[str, Any], stream: bool = False) -> Any:
+    """Create a chat completion within the deployment's quota, retrying 429s.
+
+    The call waits in the deployment's queue until its requests-per-minute
+    and tokens-per-minute buckets have room. A 429 pauses the whole
+    deployment for the Retry-After the service sent; other transient errors
+    back off with jitter. No wait runs past the current generation's deadline.
+
+    Args:
+        client: Pooled Azure OpenAI client
+        deployment_name: Deployment the call goes to
+        model_name: Model name (for token counting)
+        api_params: Chat completion parameters without the deployment
+        stream: Whether to open a streaming response
+
+    Returns:
+        The completion (or the stream when ``stream`` is set)
+
+    Raises:
+        RateLimitTimeout: If no quota frees up before the deadline
+        openai.APIError: The last error once retries are used up
+    """
+    limiter = rate_limiters.get(deployment_name)
+    prompt_text = "\n".join(message["content"] for message in api_params["messages"])
+    # Azure charges a request's quota as prompt tokens plus max_tokens up front
+    estimated_tokens = count_tokens(prompt_text, model_name) + api_params.get("max_tokens", 0)
+    for attempt in range(rate_limiters.retries + 1):
+        await limiter.acquire(estimated_tokens, max_wait=time_remaining())
+        try:
+            response = await client.chat.completions.create(model=deployment_name, stream=stream, **api_params)
+        except AZURE_RETRYABLE_ERRORS as e:
+            # A rejected request doesn't count against the quota
+            limiter.settle(estimated_tokens, 0)
+            response_headers = e.response.headers if isinstance(e, openai.APIStatusError) else None
+            delay = rate_limiters.retry_delay(attempt, response_headers)
+            remaining = time_remaining()
+            if attempt == rate_limiters.retries or (remaining is not None and delay > remaining):
+                raise
+            log_fields(retries=attempt + 1, rate_limited=isinstance(e, openai.RateLimitError))
+            if isinstance(e, openai.RateLimitError):
+                # Hold every caller of this deployment; the next acquire waits it out
+                limiter.pause(delay)
+            else:
+                await asyncio.sleep(delay)
+            continue
+        if not stream and response.usage:
+            limiter.settle(estimated_tokens, response.usage.total_tokens)
+        return response
+
 @traceable(
     name="azure_openai_generate",
     run_type="llm",
     metadata={"provider": "azure_openai", "project": "rikstoto"}
 )
-def call_azure_openai(model_name: str, prompt: str, params: Dict[str, Any]) -> Any:
+async def call_azure_openai(model_name: str, prompt: str, params: Dict[str, Any],
+                            deployment: Optional[str] = None) -> Any:
     """Call Azure OpenAI API to generate text.
     
     Args:
         model_name: The model to use (gpt-4o, gpt-4o-mini, o3-mini)
         prompt: The input text prompt
         params: Generation parameters (temperature, top_p, max_tokens)
+        deployment: Optional deployment overriding the model's (hedged requests)
         
     Returns:
         Generated text string or error dictionary
     """
     try:
-        # O3 models need longer timeout due to reasoning process
-        timeout_seconds = 120 if "o3" in model_name else 60
-        
-        client = AzureOpenAI(
-            api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-            api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2025-01-01-preview"),
-            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-            timeout=timeout_seconds  # Add timeout for long-running requests
-        )
-        
-        # Wrap client with LangSmith if available
-        if LANGSMITH_AVAILABLE:
-            client = wrap_openai(client)
-        
-        # Map model names to deployment names
-        deployment_map = {
-            "gpt-4o": os.getenv("AZURE_OPENAI_GPT4O_DEPLOYMENT", "gpt-4o"),
-            "gpt-4o-mini": os.getenv("AZURE_OPENAI_GPT4O_MINI_DEPLOYMENT", "gpt-4o-mini"),
-            "o3-mini": os.getenv("AZURE_OPENAI_O3_MINI_DEPLOYMENT", "o3-mini")
-        }
-        
-        deployment_name = deployment_map.get(model_name, os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"))
-        
-        # Build API call parameters
-        api_params = {
-            "model": deployment_name,
-            "messages": [
-                {"role": "system", "content": "Du er en hjelpsom AI-assistent for Norsk Rikstoto."},
-                {"role": "user", "content": prompt}
-            ],
-            "temperature": params.get("temperature", 0.7),
-            "top_p": params.get("top_p", 0.9),
-            "max_tokens": params.get("max_tokens", params.get("max_length", 500))
-        }
+        # Build API call parameters (deployment is filled in from the shared client)
+        api_params = azure_chat_params(prompt, params)
         
         # Add o3-mini specific parameters
         # Note: reasoning_effort not supported in current Azure deployment
@@ -363,34 +470,18 @@ def call_azure_openai(model_name: str, prompt: str, params: Dict[str, Any]) -> A
         # if model_name == "o3-mini" and "reasoning_effort" in params:
         #     api_params["reasoning_effort"] = params.get("reasoning_effort", "medium")
         
-        # Log if using O3 model (which takes longer)
-        if "o3" in model_name:
-            print(f"⏱️ Using {model_name} - this may take up to 2 minutes due to reasoning process...")
+        # Reuse the pooled client for this deployment instead of a new one per call
+        async with provider_clients.azure(model_name, deployment) as (client, deployment_name):
+            response = await create_azure_completion(client, deployment_name, model_name, api_params)
         
-        response = client.chat.completions.create(**api_params)
-        
-        # Log response details for debugging
         result_text = response.choices[0].message.content
-        print(f"✅ Azure OpenAI response length: {len(result_text)} chars")
-        
-        # Check if response seems truncated (ends mid-sentence)
-        if result_text and not result_text.rstrip().endswith(('.', '!', '?', '"', '»')):
-            print(f"⚠️ Response may be truncated - doesn't end with punctuation")
-            print(f"⚠️ Last 50 chars: ...{result_text[-50:]}")
-        
+        if response.choices[0].finish_reason:
+            log_fields(finish_reason=response.choices[0].finish_reason)
         return result_text
     except Exception as e:
-        error_msg = str(e)
-        # Sanitize error message to avoid exposing sensitive data
-        if "401" in error_msg or "authentication" in error_msg.lower():
-            return {"error": "Azure OpenAI authentication failed. Please check configuration.", "loading": False}
-        elif "404" in error_msg:
-            return {"error": "Azure OpenAI deployment not found.", "loading": False}
-        else:
-            # Only return generic error message in production
-            return {"error": "Azure OpenAI request failed.", "loading": False}
+        return {"error": azure_error_message(e), "loading": is_rate_limited(e), "neutral": is_neutral_error(e)}
 
-def call_mistral_azure(prompt: str, params: Dict[str, Any]) -> Any:
+async def call_mistral_azure(prompt: str, params: Dict[str, Any]) -> Any:
     """Call Mistral Large via Azure AI Model-as-a-Service.
     
     Args:
@@ -405,7 +496,7 @@ def call_mistral_azure(prompt: str, params: Dict[str, Any]) -> Any:
         api_key = os.getenv("AZURE_MISTRAL_API_KEY")
         
         if not endpoint or not api_key:
-            return {"error": "Mistral Large not configured in Azure", "loading": False}
+            return {"error": "Mistral Large not configured in Azure", "loading": False, "neutral": True}
         
         headers = {
             "Content-Type": "application/json",
@@ -422,7 +513,7 @@ def call_mistral_azure(prompt: str, params: Dict[str, Any]) -> Any:
             "max_tokens": params.get("max_tokens", 500)
         }
         
-        response = requests.post(
+        response = await http_clients.post(
             f"{endpoint}/v1/chat/completions",
             headers=headers,
             json=payload,
@@ -434,9 +525,30 @@ def call_mistral_azure(prompt: str, params: Dict[str, Any]) -> Any:
         return result["choices"][0]["message"]["content"]
     except Exception as e:
         # Sanitize error message
-        return {"error": "Mistral API request failed.", "loading": False}
+        return {"error": "Mistral API request failed.", "loading": False, "neutral": is_neutral_error(e)}
 
-def call_claude_databricks(prompt: str, params: Dict[str, Any]) -> Any:
+async def call_anthropic_direct(prompt: str, params: Dict[str, Any]) -> Any:
+    """Call Claude through the direct Anthropic API (Databricks fallback and hedge route).
+    
+    Returns:
+        Generated text string or error dictionary
+    """
+    try:
+        async with provider_clients.anthropic() as (client, anthropic_model):
+            response = await client.messages.create(
+                model=anthropic_model,
+                max_tokens=params.get("max_tokens", 500),
+                temperature=params.get("temperature", 0.7),
+                messages=[
+                    {"role": "user", "content": prompt}
+                ]
+            )
+        return response.content[0].text
+    except Exception as e:
+        # Sanitize error message
+        return {"error": "Claude API request failed.", "loading": False, "neutral": is_neutral_error(e)}
+
+async def call_claude_databricks(prompt: str, params: Dict[str, Any]) -> Any:
     """Call Claude 3.5 Sonnet via Azure Databricks.
     
     Args:
@@ -452,19 +564,9 @@ def call_claude_databricks(prompt: str, params: Dict[str, Any]) -> Any:
         
         if not endpoint or not api_key:
             # Fallback to direct Anthropic API if available
-            anthropic_key = os.getenv("ANTHROPIC_API_KEY")
-            if anthropic_key:
-                client = anthropic.Anthropic(api_key=anthropic_key)
-                response = client.messages.create(
-                    model="claude-3-5-sonnet-20241022",
-                    max_tokens=params.get("max_tokens", 500),
-                    temperature=params.get("temperature", 0.7),
-                    messages=[
-                        {"role": "user", "content": prompt}
-                    ]
-                )
-                return response.content[0].text
-            return {"error": "Claude not configured", "loading": False}
+            if os.getenv("ANTHROPIC_API_KEY"):
+                return await call_anthropic_direct(prompt, params)
+            return {"error": "Claude not configured", "loading": False, "neutral": True}
         
         headers = {
             "Content-Type": "application/json",
@@ -477,7 +579,7 @@ def call_claude_databricks(prompt: str, params: Dict[str, Any]) -> Any:
             "temperature": params.get("temperature", 0.7)
         }
         
-        response = requests.post(
+        response = await http_clients.post(
             endpoint,
             headers=headers,
             json=payload,
@@ -489,9 +591,31 @@ def call_claude_databricks(prompt: str, params: Dict[str, Any]) -> Any:
         return result["content"][0]["text"]
     except Exception as e:
         # Sanitize error message
-        return {"error": "Claude API request failed.", "loading": False}
+        return {"error": "Claude API request failed.", "loading": False, "neutral": is_neutral_error(e)}
+
+async def call_google_direct(prompt: str, params: Dict[str, Any]) -> Any:
+    """Call Gemini through the direct Google API (APIM fallback and hedge route).
+    
+    Returns:
+        Generated text string or error dictionary
+    """
+    try:
+        genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+        model = genai.GenerativeModel('gemini-1.5-flash')
+        response = await model.generate_content_async(
+            prompt,
+            generation_config=genai.GenerationConfig(
+                temperature=params.get("temperature", 0.7),
+                top_p=params.get("top_p", 0.9),
+                max_output_tokens=params.get("max_tokens", 500)
+            )
+        )
+        return response.text
+    except Exception as e:
+        # Sanitize error message
+        return {"error": "Gemini API request failed.", "loading": False, "neutral": is_neutral_error(e)}
 
-def call_gemini_azure(prompt: str, params: Dict[str, Any]) -> Any:
+async def call_gemini_azure(prompt: str, params: Dict[str, Any]) -> Any:
     """Call Gemini 1.5 Flash via Azure API Management.
     
     Args:
@@ -507,20 +631,9 @@ def call_gemini_azure(prompt: str, params: Dict[str, Any]) -> Any:
         
         if not endpoint or not api_key:
             # Fallback to direct Google API if available
-            google_key = os.getenv("GOOGLE_API_KEY")
-            if google_key:
-                genai.configure(api_key=google_key)
-                model = genai.GenerativeModel('gemini-1.5-flash')
-                response = model.generate_content(
-                    prompt,
-                    generation_config=genai.GenerationConfig(
-                        temperature=params.get("temperature", 0.7),
-                        top_p=params.get("top_p", 0.9),
-                        max_output_tokens=params.get("max_tokens", 500)
-                    )
-                )
-                return response.text
-            return {"error": "Gemini not configured", "loading": False}
+            if os.getenv("GOOGLE_API_KEY"):
+                return await call_google_direct(prompt, params)
+            return {"error": "Gemini not configured", "loading": False, "neutral": True}
         
         headers = {
             "Content-Type": "application/json",
@@ -536,7 +649,7 @@ def call_gemini_azure(prompt: str, params: Dict[str, Any]) -> Any:
             }
         }
         
-        response = requests.post(
+        response = await http_clients.post(
             endpoint,
             headers=headers,
             json=payload,
@@ -548,9 +661,9 @@ def call_gemini_azure(prompt: str, params: Dict[str, Any]) -> Any:
         return result["candidates"][0]["content"]["parts"][0]["text"]
     except Exception as e:
         # Sanitize error message
-        return {"error": "Gemini API request failed.", "loading": False}
+        return {"error": "Gemini API request failed.", "loading": False, "neutral": is_neutral_error(e)}
 
-def call_huggingface_api(model_name: str, prompt: str, params: Dict[str, Any]) -> Any:
+async def call_huggingface_api(model_name: str, prompt: str, params: Dict[str, Any]) -> Any:
     """Call Hugging Face Inference API to generate text.
     
     Args:
@@ -577,7 +690,7 @@ def call_huggingface_api(model_name: str, prompt: str, params: Dict[str, Any]) -
     if custom_endpoint:
         # Use the dedicated Inference Endpoint
         api_urls = [custom_endpoint]
-        print(f"Using Inference Endpoint: {custom_endpoint}")
+        log_fields(inference_endpoint=True)
     else:
         # Try the free Inference API (may not work without proper permissions)
         api_urls = [
@@ -625,27 +738,33 @@ def call_huggingface_api(model_name: str, prompt: str, params: Dict[str, Any]) -
         }
     
     # Try the first URL
+    response = None
     for api_url in api_urls:
         try:
-            response = requests.post(api_url, headers=headers, json=payload, timeout=30)
+            response = await http_clients.post(api_url, headers=headers, json=payload, timeout=30)
             if response.status_code != 404:
                 break
-        except:
+        except httpx.HTTPError:
             continue
     
+    if response is None:
+        return {"error": f"No response from Hugging Face for model '{model_name}'. Please try again.", "loading": False}
+    
     try:
         
         if response.status_code == 503:
             # Model is loading
-            return {"error": "Model is loading, please try again in 10-20 seconds", "loading": True}
+            return {"error": "Model is loading, please try again in 10-20 seconds", "loading": True, "neutral": True}
         
         if response.status_code == 404:
             # Model not found - try without auth in case it's a public model
-            print(f"Model {model_name} returned 404. Response: {response.text}")
-            return {"error": f"Model '{model_name}' not found. It may be private or require different access. Try another model.", "loading": False}
+            log_fields(upstream_status=404)
+            return {"error": f"Model '{model_name}' not found. It may be private or require different access. Try another model.", "loading": False,
+                    "neutral": True}
         
         if response.status_code == 401:
-            return {"error": "Authentication failed. Please check your Hugging Face token.", "loading": False}
+            return {"error": "Authentication failed. Please check your Hugging Face token.", "loading": False,
+                    "neutral": True}
         
         response.raise_for_status()
         result = response.json()
@@ -670,11 +789,378 @@ def call_huggingface_api(model_name: str, prompt: str, params: Dict[str, Any]) -
         
         return str(result)
         
-    except requests.exceptions.Timeout:
+    except httpx.TimeoutException:
         raise HTTPException(status_code=504, detail="Request timed out")
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         raise HTTPException(status_code=500, detail=f"API error: {str(e)}")
 
+class ProviderError(Exception):
+    """Upstream failure reported by a provider (streaming or not).
+    
+    Attributes:
+        message: Sanitized error message safe to show to the client
+        loading: Whether the model is loading (retry later) rather than failing
+        neutral: Whether the failure is caused by the request or our
+            configuration rather than the provider (see breakers.is_neutral_error)
+    """
+    def __init__(self, message: str, loading: bool = False, neutral: bool = False):
+        super().__init__(message)
+        self.message = message
+        self.loading = loading
+        self.neutral = neutral
+
+async def stream_full_result(result: Awaitable[Any]) -> AsyncIterator[str]:
+    """Adapt a non-streaming provider call to the streaming interface (one delta)."""
+    text = await result
+    if isinstance(text, dict) and "error" in text:
+        raise ProviderError(text["error"], text.get("loading", False), text.get("neutral", False))
+    yield text
+
+async def stream_azure_openai(model_name: str, prompt: str, params: Dict[str, Any]) -> AsyncIterator[str]:
+    """Stream token deltas from Azure OpenAI.
+    
+    Args:
+        model_name: The model to use (gpt-4o, gpt-4o-mini, o3-mini)
+        prompt: The input text prompt
+        params: Generation parameters (temperature, top_p, max_tokens)
+        
+    Yields:
+        Text deltas as they arrive
+        
+    Raises:
+        ProviderError: With a sanitized message if the request fails
+    """
+    try:
+        async with provider_clients.azure(model_name) as (client, deployment_name):
+            stream = await create_azure_completion(
+                client, deployment_name, model_name, azure_chat_params(prompt, params), stream=True
+            )
+            async for chunk in stream:
+                # Azure sends content-filter chunks without choices
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+    except Exception as e:
+        raise ProviderError(azure_error_message(e), is_rate_limited(e), is_neutral_error(e))
+
+async def stream_mistral_azure(prompt: str, params: Dict[str, Any]) -> AsyncIterator[str]:
+    """Stream token deltas from Mistral Large (OpenAI-compatible server-sent events).
+    
+    Raises:
+        ProviderError: If Mistral is not configured or the request fails
+    """
+    endpoint = os.getenv("AZURE_MISTRAL_ENDPOINT")
+    api_key = os.getenv("AZURE_MISTRAL_API_KEY")
+    
+    if not endpoint or not api_key:
+        raise ProviderError("Mistral Large not configured in Azure", neutral=True)
+    
+    payload = {
+        "messages": [
+            {"role": "system", "content": "Du er en hjelpsom AI-assistent for Norsk Rikstoto."},
+            {"role": "user", "content": prompt}
+        ],
+        "temperature": params.get("temperature", 0.7),
+        "top_p": params.get("top_p", 0.9),
+        "max_tokens": params.get("max_tokens", 500),
+        "stream": True
+    }
+    
+    try:
+        async with http_clients.stream(
+            f"{endpoint}/v1/chat/completions",
+            headers={"Content-Type": "application/json", "Authorization": f"Bearer {api_key}"},
+            json=payload,
+            timeout=30
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get("choices") or []
+                delta = choices[0].get("delta", {}).get("content") if choices else None
+                if delta:
+                    yield delta
+    except Exception as e:
+        # Sanitize error message
+        raise ProviderError("Mistral API request failed.", neutral=is_neutral_error(e))
+
+async def stream_claude(prompt: str, params: Dict[str, Any]) -> AsyncIterator[str]:
+    """Stream token deltas from Claude.
+    
+    The direct Anthropic API streams token by token; the Databricks endpoint
+    is called without streaming and sent as a single delta.
+    
+    Raises:
+        ProviderError: If Claude is not configured or the request fails
+    """
+    if os.getenv("AZURE_DATABRICKS_CLAUDE_ENDPOINT") and os.getenv("AZURE_DATABRICKS_API_KEY"):
+        async for delta in stream_full_result(call_claude_databricks(prompt, params)):
+            yield delta
+        return
+    
+    if not os.getenv("ANTHROPIC_API_KEY"):
+        raise ProviderError("Claude not configured", neutral=True)
+    
+    try:
+        async with provider_clients.anthropic() as (client, anthropic_model):
+            async with client.messages.stream(
+                model=anthropic_model,
+                max_tokens=params.get("max_tokens", 500),
+                temperature=params.get("temperature", 0.7),
+                messages=[{"role": "user", "content": prompt}]
+            ) as stream:
+                async for text in stream.text_stream:
+                    yield text
+    except Exception as e:
+        # Sanitize error message
+        raise ProviderError("Claude API request failed.", neutral=is_neutral_error(e))
+
+async def stream_gemini(prompt: str, params: Dict[str, Any]) -> AsyncIterator[str]:
+    """Stream token deltas from Gemini.
+    
+    The direct Google API streams chunks; the API Management endpoint is
+    called without streaming and sent as a single delta.
+    
+    Raises:
+        ProviderError: If Gemini is not configured or the request fails
+    """
+    if os.getenv("AZURE_APIM_GEMINI_ENDPOINT") and os.getenv("AZURE_APIM_GEMINI_KEY"):
+        async for delta in stream_full_result(call_gemini_azure(prompt, params)):
+            yield delta
+        return
+    
+    google_key = os.getenv("GOOGLE_API_KEY")
+    if not google_key:
+        raise ProviderError("Gemini not configured", neutral=True)
+    
+    try:
+        genai.configure(api_key=google_key)
+        model = genai.GenerativeModel('gemini-1.5-flash')
+        response = await model.generate_content_async(
+            prompt,
+            generation_config=genai.GenerationConfig(
+                temperature=params.get("temperature", 0.7),
+                top_p=params.get("top_p", 0.9),
+                max_output_tokens=params.get("max_tokens", 500)
+            ),
+            stream=True
+        )
+        async for chunk in response:
+            if chunk.text:
+                yield chunk.text
+    except Exception as e:
+        # Sanitize error message
+        raise ProviderError("Gemini API request failed.", neutral=is_neutral_error(e))
+
+# Provider behind each model - used for per-provider concurrency limits
+MODEL_PROVIDERS = {
+    "gpt-4o": "azure_openai",
+    "gpt-4o-mini": "azure_openai",
+    "o3-mini": "azure_openai",
+    "mistral-large": "mistral",
+    "claude-3-5-sonnet": "claude",
+    "gemini-1-5-flash": "gemini"
+}
+
+def provider_path(model_name: str) -> Tuple[str, str, str]:
+    """Provider and the route a model's calls take with the current configuration.
+    
+    Mirrors the fallbacks in the provider functions, e.g. Claude goes
+    through Databricks when it is configured and to Anthropic directly
+    otherwise. Models outside MODEL_PROVIDERS are reported as "other" to
+    keep metric labels bounded.
+    
+    Returns:
+        Tuple of (model label, provider, path)
+    """
+    provider = MODEL_PROVIDERS.get(model_name)
+    if provider is None:
+        path = "inference_endpoint" if os.getenv("INFERENCE_ENDPOINT_URL") else "inference_api"
+        return "other", "huggingface", path
+    if provider == "claude":
+        configured = os.getenv("AZURE_DATABRICKS_CLAUDE_ENDPOINT") and os.getenv("AZURE_DATABRICKS_API_KEY")
+        return model_name, provider, "databricks" if configured else "anthropic"
+    if provider == "gemini":
+        configured = os.getenv("AZURE_APIM_GEMINI_ENDPOINT") and os.getenv("AZURE_APIM_GEMINI_KEY")
+        return model_name, provider, "azure_apim" if configured else "google"
+    return model_name, provider, "azure"
+
+def observe_generation(model_name: str, endpoint: str, outcome: str, seconds: float) -> None:
+    """Record a generation's latency in the per-model histogram.
+    
+    Args:
+        model_name: Model requested
+        endpoint: "generate", "generate_stream" or "generate_all"
+        outcome: "success", "cache_hit", "timeout" or "error"
+        seconds: Time from request to response
+    """
+    generation_latency.observe(seconds, *provider_path(model_name), endpoint, outcome)
+
+def is_provider_error(result: Any) -> bool:
+    """Whether a provider function returned an error dictionary instead of text."""
+    return isinstance(result, dict) and "error" in result
+
+def hedge_route(model_name: str, prompt: str, params: Dict[str, Any]) -> Optional[Callable[[], Awaitable[Any]]]:
+    """Secondary route for a hedged request, or None if the model has none.
+    
+    Azure OpenAI models hedge to the deployment in HEDGE_AZURE_DEPLOYMENTS;
+    Claude on Databricks hedges to the direct Anthropic API and Gemini on
+    APIM to the direct Google API, when their keys are set.
+    """
+    _, provider, path = provider_path(model_name)
+    if provider == "azure_openai":
+        deployment = hedge_deployment(model_name)
+        if deployment:
+            return lambda: call_azure_openai(model_name, prompt, params, deployment)
+    elif provider == "claude" and path == "databricks" and os.getenv("ANTHROPIC_API_KEY"):
+        return lambda: call_anthropic_direct(prompt, params)
+    elif provider == "gemini" and path == "azure_apim" and os.getenv("GOOGLE_API_KEY"):
+        return lambda: call_google_direct(prompt, params)
+    return None
+
+def breaker_open_error(provider: str) -> Dict[str, Any]:
+    """Error returned without calling a provider whose circuit breaker is open."""
+    breaker = provider_guards.breaker(provider)
+    detail = f": {breaker.last_error}" if breaker.last_error else ""
+    return {
+        "error": f"{provider} is unavailable after repeated failures, "
+                 f"retrying in {breaker.retry_after():.0f}s{detail}",
+        # Retryable later, so /generate answers 503 like a loading model
+        "loading": True
+    }
+
+def hedge_delay(model_name: str) -> Optional[float]:
+    """Observed latency quantile of successful generations (None until there are enough)."""
+    return generation_latency.quantile_where(hedger.quantile, hedger.min_samples,
+                                             model=model_name, outcome="success")
+
+async def call_model(model_name: str, prompt: str, params: Dict[str, Any], request_id: Optional[str] = None) -> Any:
+    """Route a generation to the right provider through the shared scheduler.
+    
+    Args:
+        model_name: Model to use; unknown models fall back to Hugging Face
+        prompt: The input text prompt
+        params: Generation parameters
+        request_id: ID of the originating request, used for fair queueing
+        
+    Returns:
+        Generated text string or error dictionary (from the hedge route if
+        hedging is enabled and it answered first). Fails fast with an error
+        dictionary while the provider's circuit breaker is open.
+    """
+    provider = MODEL_PROVIDERS.get(model_name, "huggingface")
+    log_fields(provider=provider)
+    if not provider_guards.allow(provider):
+        log_fields(breaker="open")
+        return breaker_open_error(provider)
+    budget = model_timeout(model_name)
+    started = None
+    
+    async def primary() -> Any:
+        if provider == "azure_openai":
+            return await call_azure_openai(model_name, prompt, params)
+        elif provider == "mistral":
+            return await call_mistral_azure(prompt, params)
+        elif provider == "claude":
+            return await call_claude_databricks(prompt, params)
+        elif provider == "gemini":
+            return await call_gemini_azure(prompt, params)
+        # Fallback to Hugging Face for any other models
+        return await call_huggingface_api(model_name, prompt, params)
+    
+    async def call() -> Any:
+        nonlocal started
+        started = time.perf_counter()
+        # Only look up a hedge route and its delay when hedging is on
+        secondary = hedge_route(model_name, prompt, params) if hedger.enabled else None
+        delay = hedge_delay(model_name) if secondary is not None else None
+        
+        async def hedge() -> Any:
+            # The duplicate takes its own scheduler slot so hedging never exceeds
+            # the provider's cap; if the slot went in the meantime, let the primary answer
+            async with generation_scheduler.try_slot(provider) as taken:
+                if not taken:
+                    return {"error": f"No {provider} capacity for a hedged request", "loading": False}
+                return await secondary()
+        
+        result, route = await hedger.run(model_name, primary, hedge if secondary else None, delay,
+                                         is_provider_error,
+                                         can_hedge=lambda: generation_scheduler.has_free_slot(provider))
+        log_fields(route=route)
+        return result
+    
+    try:
+        result = await generation_scheduler.run(request_id or str(uuid.uuid4()), provider, call)
+    except asyncio.CancelledError:
+        provider_guards.cancelled(provider, time.perf_counter() - started if started else 0.0, budget)
+        raise
+    except Exception as e:
+        provider_guards.record(provider, False, time.perf_counter() - (started or time.perf_counter()), budget, error_summary(e))
+        raise
+    if is_provider_error(result) and result.get("neutral"):
+        # The request or our configuration failed, not the provider
+        provider_guards.release(provider)
+    else:
+        provider_guards.record(provider, not is_provider_error(result), time.perf_counter() - started, budget,
+                               result["error"] if is_provider_error(result) else None)
+    return result
+
+async def stream_model(model_name: str, prompt: str, params: Dict[str, Any],
+                       request_id: Optional[str] = None) -> AsyncIterator[str]:
+    """Stream a generation from the right provider through the shared scheduler.
+    
+    The scheduler slot is held until the stream is fully consumed.
+    
+    Yields:
+        Text deltas as they arrive
+        
+    Raises:
+        ProviderError: If the upstream call fails, or at once while the
+            provider's circuit breaker is open
+    """
+    provider = MODEL_PROVIDERS.get(model_name, "huggingface")
+    log_fields(provider=provider)
+    if not provider_guards.allow(provider):
+        log_fields(breaker="open")
+        raise ProviderError(breaker_open_error(provider)["error"])
+    budget = model_timeout(model_name)
+    started = None
+    
+    try:
+        async with generation_scheduler.slot(request_id or str(uuid.uuid4()), provider):
+            started = time.perf_counter()
+            if provider == "azure_openai":
+                stream = stream_azure_openai(model_name, prompt, params)
+            elif provider == "mistral":
+                stream = stream_mistral_azure(prompt, params)
+            elif provider == "claude":
+                stream = stream_claude(prompt, params)
+            elif provider == "gemini":
+                stream = stream_gemini(prompt, params)
+            else:
+                stream = stream_full_result(call_huggingface_api(model_name, prompt, params))
+            async for delta in stream:
+                yield delta
+    except (asyncio.CancelledError, GeneratorExit):
+        # Client went away mid-stream (counted only if the call ran long)
+        provider_guards.cancelled(provider, time.perf_counter() - started if started else 0.0, budget)
+        raise
+    except ProviderError as e:
+        if e.neutral:
+            provider_guards.release(provider)
+        else:
+            provider_guards.record(provider, False, time.perf_counter() - (started or time.perf_counter()),
+                                   budget, e.message)
+        raise
+    except Exception as e:
+        provider_guards.record(provider, False, time.perf_counter() - (started or time.perf_counter()),
+                               budget, error_summary(e))
+        raise
+    provider_guards.record(provider, True, time.perf_counter() - started, budget)
+
 @app.get("/api")
 async def api_info() -> Dict[str, str]:
     """API endpoint providing API information.
@@ -722,13 +1208,21 @@ class ModelConfig(BaseModel):
     max_length: Optional[int] = None
     top_p: Optional[float] = None
     top_k: Optional[int] = 50
+    timeout_seconds: Optional[float] = None
 
 class ParallelGenerationRequest(BaseModel):
-    """Request for parallel generation across multiple models."""
+    """Request for parallel generation across multiple models.
+    
+    Either ``json_data`` or the ``session_id`` of a /prepare-json session is
+    required; a live session takes precedence. Models still running when
+    ``deadline_seconds`` (capped at GENERATE_ALL_DEADLINE_SECONDS) runs out
+    are reported as failed.
+    """
     models: List[ModelConfig]
-    json_data: str
+    json_data: Optional[str] = None
     session_id: Optional[str] = None
     use_cache: bool = True
+    deadline_seconds: Optional[float] = None
 
 class ModelResult(BaseModel):
     """Result from a single model generation."""
@@ -751,11 +1245,18 @@ async def prepare_json(request: PrepareJSONRequest) -> Dict[str, Any]:
     - Caching frequently used JSON structures
     - Reducing latency when user clicks generate
     
+    The JSON is compacted, serialized and digested once here, at every
+    compaction level; /generate and /generate-all splice the level that
+    fits each model's token budget straight into the prompt when given
+    the session ID.
+    
     Args:
         request: Contains JSON string and optional session ID
         
     Returns:
-        Validation status, session ID, and prepared data
+        Validation status, session ID, prepared data and estimated
+        JSON tokens per compaction level and tokenizer encoding (the same
+        counts /generate-all/estimate uses for each model)
     """
     try:
         json_obj = json.loads(request.json_data)
@@ -763,19 +1264,10 @@ async def prepare_json(request: PrepareJSONRequest) -> Dict[str, Any]:
         # Generate or use provided session ID
         session_id = request.session_id or str(uuid.uuid4())
         
-        # Store in cache with timestamp
-        json_cache[session_id] = {
-            "json": json_obj,
-            "timestamp": datetime.now(),
-            "hash": hashlib.md5(request.json_data.encode()).hexdigest()
-        }
-        
-        # Clean old cache entries
-        cutoff_time = datetime.now() - timedelta(minutes=CACHE_TTL_MINUTES)
-        expired_keys = [k for k, v in json_cache.items() 
-                       if v["timestamp"] < cutoff_time]
-        for key in expired_keys:
-            del json_cache[key]
+        # Store in the session cache (expires after CACHE_TTL_MINUTES)
+        # Every level and tokenizer is counted for the report, off the event loop
+        prepared = await asyncio.to_thread(lambda: prepare_json_payload(json_obj).count_all())
+        await json_cache.set(session_id, prepared.to_dict())
         
         return {
             "status": "ready",
@@ -783,7 +1275,8 @@ async def prepare_json(request: PrepareJSONRequest) -> Dict[str, Any]:
             "session_id": session_id,
             "data": json_obj,
             "message": "JSON validated and cached for fast AI generation",
-            "cache_ttl_minutes": CACHE_TTL_MINUTES
+            "cache_ttl_minutes": CACHE_TTL_MINUTES,
+            "tokens": {level: counts for level, (_, counts) in prepared.variants.items()}
         }
     except json.JSONDecodeError as e:
         return {
@@ -793,6 +1286,248 @@ async def prepare_json(request: PrepareJSONRequest) -> Dict[str, Any]:
             "session_id": None
         }
 
+def json_digest(json_obj: Any) -> str:
+    """Digest of the canonical form of a JSON value (sorted keys, no whitespace).
+    
+    JSON that differs only in key order or formatting gets the same digest.
+    Returns an empty string when there is no JSON.
+    """
+    if json_obj is None:
+        return ""
+    canonical = json.dumps(json_obj, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+def prepare_json_payload(json_obj: Any) -> PreparedJSON:
+    """Compact and serialize JSON data for prompts once (see compaction.py).
+    
+    Returns:
+        PreparedJSON holding the compact JSON string for each compaction
+        level and the canonical digest
+    """
+    # Use compact JSON to save tokens and avoid truncation
+    return PreparedJSON.from_json(json_obj, json_digest(json_obj))
+
+async def load_prepared_json(session_id: Optional[str]) -> Optional[PreparedJSON]:
+    """Return the JSON prepared by /prepare-json, or None if expired or unknown."""
+    if not session_id:
+        return None
+    cached_session = await json_cache.get(session_id)
+    if not cached_session or "variants" not in cached_session[0]:
+        return None
+    return PreparedJSON.from_dict(cached_session[0])
+
+def select_json_for_model(prepared: Optional[PreparedJSON], model_name: str) -> Tuple[Optional[str], str]:
+    """Pick the compaction level of prepared JSON that fits a model's token budget.
+    
+    Returns:
+        Tuple of (compact JSON string or None, data digest for the cache key)
+    """
+    if prepared is None:
+        return None, ""
+    level, json_str, tokens = prepared.select(model_name)
+    log_fields(json_level=level, json_tokens=tokens, json_tokens_full=prepared.full_tokens(model_name))
+    return json_str, f"{prepared.digest}:{level}"
+
+def generation_cache_key(model_name: str, prompt_template: str, data_digest: str, params: Dict[str, Any],
+                         slot_values: Optional[Dict[str, str]] = None) -> str:
+    """Canonical response cache key shared by /generate and /generate-all.
+    
+    Args:
+        model_name: Model the response was generated with
+        prompt_template: System prompt before the JSON is filled in
+        data_digest: ``json_digest`` of the JSON data plus the compaction level
+            used (empty when there is no JSON)
+        params: Effective generation parameters sent to the model
+        slot_values: Other template slot values the prompt was rendered with
+            (only those the template actually uses)
+        
+    Returns:
+        Hex digest covering the model, every parameter, the prompt template,
+        its slot values and the canonical JSON
+    """
+    template_digest = hashlib.sha256(prompt_template.encode()).hexdigest()
+    canonical_params = json.dumps(params, sort_keys=True, separators=(',', ':'))
+    key = f"v1|{model_name}|{template_digest}|{data_digest}|{canonical_params}"
+    if slot_values:
+        key += "|" + json.dumps(slot_values, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(key.encode()).hexdigest()
+
+async def build_generation(request: GenerationRequest) -> Tuple[str, Dict[str, Any], Optional[str]]:
+    """Assemble the prompt, generation parameters and cache key for a request.
+    
+    Args:
+        request: GenerationRequest containing model name, prompt, and parameters
+        
+    Returns:
+        Tuple of (prompt, params, cache_key); cache_key is None when caching is off
+        
+    Raises:
+        HTTPException: 400 if JSON data is invalid
+    """
+    # Check if we should use prepared JSON (already compact, no re-parsing)
+    prepared = await load_prepared_json(request.session_id)
+    
+    if prepared is None and request.json_data:
+        try:
+            prepared = prepare_json_payload(json.loads(request.json_data))
+        except json.JSONDecodeError:
+            raise HTTPException(status_code=400, detail="Invalid JSON data")
+    
+    # Prepare the prompt with JSON data if provided (template compiled once per prompt text)
+    template = compile_template(request.system_prompt)
+    json_str, data_digest = select_json_for_model(prepared, request.model_name)
+    slot_values = {"model": request.model_name, "user_prompt": request.user_prompt}
+    slot_values = {name: value for name, value in slot_values.items() if name in template.slots and value is not None}
+    prompt = template.render(json=json_str, **slot_values)
+    
+    model_name = request.model_name
+    
+    # Get model defaults
+    model_defaults = MODEL_DEFAULTS.get(model_name, {})
+    
+    # Use model-specific defaults if available, otherwise use request parameters
+    # For o3-mini, always use model defaults for better responses
+    if model_name in MODEL_DEFAULTS:
+        params = {
+            "max_length": model_defaults.get("max_length", request.max_length),
+            "max_tokens": model_defaults.get("max_length", request.max_length),  # For Azure OpenAI
+            "temperature": model_defaults.get("temperature", request.temperature),
+            "top_p": model_defaults.get("top_p", request.top_p),
+            "top_k": request.top_k or 50
+        }
+    else:
+        params = {
+            "max_length": request.max_length,
+            "max_tokens": request.max_length,  # For Azure OpenAI
+            "temperature": request.temperature,
+            "top_p": request.top_p,
+            "top_k": request.top_k
+        }
+    
+    # Generate cache key for response caching
+    cache_key = None
+    if request.use_cache:
+        # model is already part of the key
+        slot_values.pop("model", None)
+        cache_key = generation_cache_key(model_name, request.system_prompt, data_digest, params, slot_values)
+    
+    return prompt, params, cache_key
+
+async def cached_generation(cache_key: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Return the cached /generate response for a cache key, if still fresh."""
+    if not cache_key:
+        return None
+    cached = await response_cache.get(cache_key)
+    if cached is None:
+        return None
+    cached_response, age_seconds = cached
+    return {
+        **cached_response,
+        "from_cache": True,
+        "cache_age_seconds": int(age_seconds)
+    }
+
+async def store_generation(cache_key: Optional[str], response_data: Dict[str, Any]) -> None:
+    """Cache a successful /generate response (expired and LRU entries are evicted)."""
+    if cache_key:
+        await response_cache.set(cache_key, response_data)
+
+async def run_generation(model_name: str, prompt: str, params: Dict[str, Any], cache_key: Optional[str],
+                         request_id: Optional[str] = None) -> Dict[str, Any]:
+    """Call a model and cache the response, sharing the call among concurrent requests.
+    
+    Concurrent misses for the same cache key wait on one upstream call
+    (single-flight). Without a cache key the model is always called.
+    
+    Returns:
+        Response body in the /generate format
+        
+    Raises:
+        ProviderError: If the provider returned an error
+    """
+    async def generate() -> Dict[str, Any]:
+        # Route to appropriate API based on model (queued behind the global scheduler)
+        result = await call_model(model_name, prompt, params, request_id)
+        if isinstance(result, dict) and "error" in result:
+            raise ProviderError(result["error"], loading=bool(result.get("loading")))
+        
+        response_data = build_response_data(model_name, prompt, params, result)
+        
+        # Cache the successful response
+        await store_generation(cache_key, response_data)
+        return response_data
+    
+    if not cache_key:
+        return await generate()
+    response_data, shared = await generation_flights.do(cache_key, generate, label=model_name)
+    log_fields(shared_flight=shared)
+    return response_data
+
+def log_prompt_diagnostics(model_name: str, prompt: str) -> None:
+    """Add prompt diagnostics to the request's log line, if the request is sampled.
+    
+    Checks that the JSON placeholder was replaced and the race data is
+    all there. Each check scans the prompt, so nothing runs when
+    diagnostics are disabled for the request.
+    """
+    record = current_request_log()
+    if record is None or not record.diagnostics:
+        return
+    record.set(
+        prompt_chars=len(prompt),
+        prompt_tokens=count_tokens(prompt, model_name),
+        tokenizer=token_counter.tokenizer_for(model_name),
+        placeholder_unreplaced="{{json}}" in prompt,
+        # Count races in the prompt to verify all data is there
+        races_in_prompt=prompt.count('"race":'),
+        json_fields={field: field in prompt for field in ("percentageBet", "amountBet", "raceResults", "betResult")}
+    )
+    if record.previews and len(prompt) > 200:
+        record.set(prompt_tail=prompt[-200:])
+
+def log_response_diagnostics(result: Any) -> None:
+    """Add response length and truncation checks to the request's log line, if sampled."""
+    record = current_request_log()
+    if record is None or not record.diagnostics or not isinstance(result, str):
+        return
+    record.set(
+        response_chars=len(result),
+        # A response that ends mid-sentence was probably cut off by max_tokens
+        response_unterminated=bool(result) and not result.rstrip().endswith(('.', '!', '?', '"', '»'))
+    )
+    if record.previews and result:
+        record.set(response_head=result[:50], response_tail=result[-50:])
+
+def build_response_data(model_name: str, prompt: str, params: Dict[str, Any], result: Any) -> Dict[str, Any]:
+    """Build the /generate response body for a generated text."""
+    log_response_diagnostics(result)
+    
+    return {
+        "generated_text": result,
+        "model_used": model_name,
+        "prompt_length": len(prompt),
+        "parameters": params,
+        "api_mode": True,
+        "from_cache": False,
+        "response_length": len(result) if isinstance(result, str) else 0  # Add length to response
+    }
+
+def stream_frame(frame_type: str, payload: Dict[str, Any], stream_format: str) -> str:
+    """Encode one streaming frame as a Server-Sent Event or an NDJSON line."""
+    if stream_format == "ndjson":
+        return json.dumps({"type": frame_type, **payload}) + "\n"
+    return f"event: {frame_type}\ndata: {json.dumps(payload)}\n\n"
+
+def streaming_response(frames: AsyncIterator[str], stream_format: str) -> StreamingResponse:
+    """Wrap streaming frames in a response with the right media type."""
+    media_type = "application/x-ndjson" if stream_format == "ndjson" else "text/event-stream"
+    return StreamingResponse(
+        frames,
+        media_type=media_type,
+        # Disable proxy buffering so frames reach the browser immediately
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.post("/generate")
 async def generate_text(request: GenerationRequest) -> Dict[str, Any]:
     """Generate text using specified model and parameters.
@@ -818,158 +1553,210 @@ async def generate_text(request: GenerationRequest) -> Dict[str, Any]:
             - 504 if request times out
             - 500 for other errors
     """
+    log = request_logger.begin("generate", model=request.model_name)
+    start_time = time.perf_counter()
     try:
-        # Check if we should use cached JSON
-        json_to_use = request.json_data
+        prompt, params, cache_key = await build_generation(request)
         
-        if request.session_id and request.session_id in json_cache:
-            cached_data = json_cache[request.session_id]
-            # Check if cache is still valid
-            if datetime.now() - cached_data["timestamp"] < timedelta(minutes=CACHE_TTL_MINUTES):
-                json_to_use = json.dumps(cached_data["json"])
+        # Check if we have a cached response
+        cached_response = await cached_generation(cache_key)
+        if cached_response:
+            observe_generation(request.model_name, "generate", "cache_hit", time.perf_counter() - start_time)
+            log.emit(status=200, from_cache=True)
+            return cached_response
         
-        # Prepare the prompt with JSON data if provided
-        prompt = request.system_prompt
+        log_prompt_diagnostics(request.model_name, prompt)
         
-        if json_to_use:
-            try:
-                if isinstance(json_to_use, str):
-                    json_obj = json.loads(json_to_use)
-                else:
-                    json_obj = json_to_use
-                # Use compact JSON to save tokens and avoid truncation
-                json_str = json.dumps(json_obj, separators=(',', ':'))  # Compact format
-                print(f"📦 JSON size: {len(json_str)} chars (compact format)")
-                prompt = prompt.replace("{{json}}", json_str)
-                prompt = prompt.replace("{json}", json_str)
-            except json.JSONDecodeError:
-                raise HTTPException(status_code=400, detail="Invalid JSON data")
-        
-        # Generate cache key for response caching
-        cache_key = None
-        if request.use_cache:
-            cache_key = hashlib.md5(
-                f"{request.model_name}:{prompt}:{request.temperature}:{request.max_length}".encode()
-            ).hexdigest()
-            
-            # Check if we have a cached response
-            if cache_key in response_cache:
-                cached_response = response_cache[cache_key]
-                if datetime.now() - cached_response["timestamp"] < timedelta(minutes=CACHE_TTL_MINUTES):
-                    return {
-                        **cached_response["response"],
-                        "from_cache": True,
-                        "cache_age_seconds": (datetime.now() - cached_response["timestamp"]).seconds
-                    }
-        
-        # Route to appropriate API based on model name
-        model_name = request.model_name
-        
-        # Get model defaults
-        model_defaults = MODEL_DEFAULTS.get(model_name, {})
-        
-        # Use model-specific defaults if available, otherwise use request parameters
-        # For o3-mini, always use model defaults for better responses
-        if model_name in MODEL_DEFAULTS:
-            params = {
-                "max_length": model_defaults.get("max_length", request.max_length),
-                "max_tokens": model_defaults.get("max_length", request.max_length),  # For Azure OpenAI
-                "temperature": model_defaults.get("temperature", request.temperature),
-                "top_p": model_defaults.get("top_p", request.top_p),
-                "top_k": request.top_k or 50
-            }
-        else:
-            params = {
-                "max_length": request.max_length,
-                "max_tokens": request.max_length,  # For Azure OpenAI
-                "temperature": request.temperature,
-                "top_p": request.top_p,
-                "top_k": request.top_k
-            }
-        
-        # Debug: Log what's being sent to verify full JSON is included
-        print(f"\n🔍 DEBUG: Sending to {model_name}")
-        print(f"📏 Prompt length: {len(prompt)} characters")
-        
-        # Check if prompt seems complete
-        if "{{json}}" in prompt:
-            print(f"⚠️ WARNING: JSON placeholder not replaced!")
-        
-        # Count races in the prompt to verify all data is there
-        race_count = prompt.count('"race":')
-        print(f"📊 Races found in prompt: {race_count}")
-        
-        # Check for key fields
-        print(f"📊 JSON indicators in prompt:")
-        print(f"  - Contains 'percentageBet': {'percentageBet' in prompt}")
-        print(f"  - Contains 'amountBet': {'amountBet' in prompt}")
-        print(f"  - Contains 'raceResults': {'raceResults' in prompt}")
-        print(f"  - Contains 'betResult': {'betResult' in prompt}")
-        
-        # Log the last part to check for truncation
-        if len(prompt) > 200:
-            print(f"📄 Last 200 chars of prompt: ...{prompt[-200:]}")
-        
-        # Route to appropriate API based on model
-        if model_name in ["gpt-4o", "gpt-4o-mini", "o3-mini"]:
-            result = call_azure_openai(model_name, prompt, params)
-        elif model_name == "mistral-large":
-            result = call_mistral_azure(prompt, params)
-        elif model_name == "claude-3-5-sonnet":
-            result = call_claude_databricks(prompt, params)
-        elif model_name == "gemini-1-5-flash":
-            result = call_gemini_azure(prompt, params)
-        else:
-            # Fallback to Hugging Face for any other models
-            result = call_huggingface_api(model_name, prompt, params)
-        
-        # Handle error states
-        if isinstance(result, dict) and "error" in result:
-            if result.get("loading"):
-                raise HTTPException(status_code=503, detail=result["error"])
+        timeout = model_timeout(request.model_name, request.timeout_seconds)
+        # Rate-limit retries inside the call give up rather than outlive the timeout
+        set_deadline(timeout)
+        try:
+            response_data = await asyncio.wait_for(
+                run_generation(request.model_name, prompt, params, cache_key), timeout
+            )
+            observe_generation(request.model_name, "generate", "success", time.perf_counter() - start_time)
+            log.emit(status=200, from_cache=False)
+            return response_data
+        except ProviderError as e:
+            # Handle error states
+            if e.loading:
+                raise HTTPException(status_code=503, detail=e.message)
             else:
-                raise HTTPException(status_code=400, detail=result["error"])
-        
-        # Log the result length for debugging
-        if isinstance(result, str):
-            print(f"📐 Final response length before sending: {len(result)} chars")
-            if len(result) > 0:
-                print(f"📐 First 50 chars: {result[:50]}...")
-                print(f"📐 Last 50 chars: ...{result[-50:]}")
-        
-        response_data = {
-            "generated_text": result,
-            "model_used": request.model_name,
-            "prompt_length": len(prompt),
-            "parameters": params,
-            "api_mode": True,
-            "from_cache": False,
-            "response_length": len(result) if isinstance(result, str) else 0  # Add length to response
-        }
-        
-        # Cache the successful response
-        if cache_key and request.use_cache:
-            response_cache[cache_key] = {
-                "response": response_data,
-                "timestamp": datetime.now()
-            }
-            
-            # Clean old cache entries
-            cutoff_time = datetime.now() - timedelta(minutes=CACHE_TTL_MINUTES)
-            expired_keys = [k for k, v in response_cache.items() 
-                           if v["timestamp"] < cutoff_time]
-            for key in expired_keys:
-                del response_cache[key]
-        
-        return response_data
-    
-    except HTTPException:
+                raise HTTPException(status_code=400, detail=e.message)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail=f"{request.model_name} did not answer within {timeout:.0f}s")
+    
+    except HTTPException as e:
+        outcome = "timeout" if e.status_code == 504 else "error"
+        observe_generation(request.model_name, "generate", outcome, time.perf_counter() - start_time)
+        log.emit(logging.WARNING, status=e.status_code, error=e.detail)
         raise
     except Exception as e:
+        observe_generation(request.model_name, "generate", "error", time.perf_counter() - start_time)
+        log.emit(logging.ERROR, status=500, error=str(e))
         raise HTTPException(status_code=500, detail=str(e))
 
-def generate_for_model(model_config: ModelConfig, json_str: str, session_id: Optional[str] = None) -> ModelResult:
-    """Generate text for a single model (used in parallel execution)."""
+@app.post("/generate/stream")
+async def generate_text_stream(request: GenerationRequest,
+                               format: Literal["sse", "ndjson"] = "sse") -> StreamingResponse:
+    """Generate text and stream token deltas as the model produces them.
+    
+    Sends ``delta`` frames ({"text": "..."}) as they arrive from the
+    provider, then a ``done`` frame with the same metadata as /generate
+    (model_used, parameters, prompt_length, response_length, from_cache).
+    Providers without a streaming API send the full text as one delta.
+    Failures after streaming has started are sent as an ``error`` frame
+    ({"detail": "...", "loading": bool}). The complete text is cached
+    like a normal /generate response. The stream runs under the same
+    timeout as /generate; running out of time sends an ``error`` frame.
+    
+    Args:
+        request: GenerationRequest containing model name, prompt, and parameters
+        format: "sse" for Server-Sent Events (default) or "ndjson" for
+            newline-delimited JSON ({"type": "delta", "text": "..."})
+        
+    Returns:
+        Streaming response of delta frames and a closing done frame
+        
+    Raises:
+        HTTPException: 400 if JSON data is invalid
+    """
+    prompt, params, cache_key = await build_generation(request)
+    cached_response = await cached_generation(cache_key)
+    
+    async def frames() -> AsyncIterator[str]:
+        log = request_logger.begin("generate_stream", model=request.model_name, format=format)
+        
+        def observe(outcome: str) -> None:
+            observe_generation(request.model_name, "generate_stream", outcome, time.perf_counter() - log.start)
+        
+        if cached_response:
+            observe("cache_hit")
+            log.emit(from_cache=True)
+            yield stream_frame("delta", {"text": cached_response["generated_text"]}, format)
+            yield stream_frame("done", {k: v for k, v in cached_response.items() if k != "generated_text"}, format)
+            return
+        
+        log_prompt_diagnostics(request.model_name, prompt)
+        timeout = model_timeout(request.model_name, request.timeout_seconds)
+        # Same deadline as /generate, covering the whole stream (and rate-limit retries)
+        set_deadline(timeout)
+        stream = stream_model(request.model_name, prompt, params)
+        chunks = []
+        try:
+            while True:
+                try:
+                    delta = await asyncio.wait_for(stream.__anext__(), time_remaining())
+                except StopAsyncIteration:
+                    break
+                if not chunks:
+                    log.set(first_delta_ms=round((time.perf_counter() - log.start) * 1000, 1))
+                chunks.append(delta)
+                yield stream_frame("delta", {"text": delta}, format)
+        except (asyncio.CancelledError, GeneratorExit):
+            # Client disconnected mid-stream
+            log.emit(from_cache=False, cancelled=True, deltas=len(chunks))
+            raise
+        except ProviderError as e:
+            observe("error")
+            log.emit(logging.WARNING, from_cache=False, error=e.message)
+            yield stream_frame("error", {"detail": e.message, "loading": e.loading}, format)
+            return
+        except asyncio.TimeoutError:
+            detail = f"{request.model_name} did not answer within {timeout:.0f}s"
+            observe("timeout")
+            log.emit(logging.WARNING, from_cache=False, error=detail, deltas=len(chunks))
+            yield stream_frame("error", {"detail": detail, "loading": False}, format)
+            return
+        except HTTPException as e:
+            observe("error")
+            log.emit(logging.WARNING, from_cache=False, error=e.detail)
+            yield stream_frame("error", {"detail": e.detail, "loading": e.status_code == 503}, format)
+            return
+        except Exception as e:
+            observe("error")
+            log.emit(logging.ERROR, from_cache=False, error=str(e))
+            yield stream_frame("error", {"detail": str(e), "loading": False}, format)
+            return
+        
+        response_data = build_response_data(request.model_name, prompt, params, "".join(chunks))
+        await store_generation(cache_key, response_data)
+        observe("success")
+        log.emit(from_cache=False, deltas=len(chunks))
+        yield stream_frame("done", {k: v for k, v in response_data.items() if k != "generated_text"}, format)
+    
+    return streaming_response(frames(), format)
+
+def build_model_prompt(model_config: ModelConfig,
+                       prepared: PreparedJSON) -> Tuple[str, str, Dict[str, Any], str]:
+    """Render the prompt and parameters one model in a parallel request is called with.
+    
+    Returns:
+        Tuple of (system prompt template, rendered prompt, parameters,
+        data digest for the cache key)
+    """
+    # Get defaults and merge with custom config
+    defaults = MODEL_DEFAULTS.get(model_config.name, {})
+    system_prompt = model_config.system_prompt or defaults.get("system_prompt", "Analyze: {{json}}")
+    
+    # Prepare prompt
+    json_str, data_digest = select_json_for_model(prepared, model_config.name)
+    prompt = compile_template(system_prompt).render(json=json_str, model=model_config.name)
+    
+    # Prepare parameters
+    params = {
+        "temperature": model_config.temperature or defaults.get("temperature", 0.7),
+        "max_length": model_config.max_length or defaults.get("max_length", 500),
+        "max_tokens": model_config.max_length or defaults.get("max_length", 500),
+        "top_p": model_config.top_p or defaults.get("top_p", 0.9),
+        "top_k": model_config.top_k or 50
+    }
+    
+    # Add o3-mini specific reasoning_effort parameter when supported
+    # Note: Commented out until Azure supports it (needs API version 2025-04-01-preview)
+    # if model_config.name == "o3-mini" and "reasoning_effort" in defaults:
+    #     params["reasoning_effort"] = defaults.get("reasoning_effort", "medium")
+    
+    return system_prompt, prompt, params, data_digest
+
+async def generate_for_model(model_config: ModelConfig, prepared: PreparedJSON, session_id: Optional[str] = None,
+                             request_id: Optional[str] = None, use_cache: bool = True,
+                             timeout: Optional[float] = None) -> ModelResult:
+    """Generate text for a single model (used in parallel execution).
+    
+    The JSON is taken from ``prepared`` at the compaction level that fits
+    the model's token budget. Calls from the same /generate-all request
+    share ``request_id`` so the scheduler can queue them fairly against
+    other requests. With ``use_cache``, responses are served from and
+    stored in the same cache as /generate, and an identical generation
+    already in flight is shared. A model that hasn't answered within
+    ``timeout`` seconds is reported as failed. The generation time is
+    recorded in the latency histogram.
+    """
+    if timeout:
+        set_deadline(timeout)
+    try:
+        result = await asyncio.wait_for(
+            generate_model_result(model_config, prepared, session_id, request_id, use_cache), timeout
+        )
+    except asyncio.TimeoutError:
+        model_info = next((m for m in AVAILABLE_MODELS if m.name == model_config.name), None)
+        observe_generation(model_config.name, "generate_all", "timeout", timeout)
+        return ModelResult(
+            model_name=model_config.name,
+            display_name=model_info.display_name if model_info else model_config.name,
+            success=False,
+            error=f"Timed out after {timeout:.0f}s",
+            generation_time=timeout,
+            parameters_used={}
+        )
+    outcome = "error" if not result.success else "cache_hit" if result.from_cache else "success"
+    observe_generation(model_config.name, "generate_all", outcome, result.generation_time)
+    return result
+
+async def generate_model_result(model_config: ModelConfig, prepared: PreparedJSON, session_id: Optional[str],
+                                request_id: Optional[str], use_cache: bool) -> ModelResult:
+    """Run one model of a parallel generation and wrap the outcome in a ModelResult."""
     start_time = time.time()
     model_info = next((m for m in AVAILABLE_MODELS if m.name == model_config.name), None)
     
@@ -984,46 +1771,45 @@ def generate_for_model(model_config: ModelConfig, json_str: str, session_id: Opt
         )
     
     try:
-        # Get defaults and merge with custom config
-        defaults = MODEL_DEFAULTS.get(model_config.name, {})
-        system_prompt = model_config.system_prompt or defaults.get("system_prompt", "Analyze: {{json}}")
+        system_prompt, prompt, params, data_digest = build_model_prompt(model_config, prepared)
         
-        # Prepare prompt
-        prompt = system_prompt.replace("{{json}}", json_str).replace("{json}", json_str)
+        if model_config.name not in MODEL_PROVIDERS:
+            return ModelResult(
+                model_name=model_config.name,
+                display_name=model_info.display_name,
+                success=False,
+                error=f"Model {model_config.name} not configured",
+                generation_time=time.time() - start_time,
+                parameters_used=params
+            )
         
-        # Prepare parameters
-        params = {
-            "temperature": model_config.temperature or defaults.get("temperature", 0.7),
-            "max_length": model_config.max_length or defaults.get("max_length", 500),
-            "max_tokens": model_config.max_length or defaults.get("max_length", 500),
-            "top_p": model_config.top_p or defaults.get("top_p", 0.9),
-            "top_k": model_config.top_k or 50
-        }
+        # Serve from the shared response cache when possible
+        cache_key = None
+        if use_cache:
+            cache_key = generation_cache_key(model_config.name, system_prompt, data_digest, params)
+            cached_response = await cached_generation(cache_key)
+            if cached_response:
+                return ModelResult(
+                    model_name=model_config.name,
+                    display_name=model_info.display_name,
+                    success=True,
+                    generated_text=cached_response["generated_text"],
+                    generation_time=time.time() - start_time,
+                    from_cache=True,
+                    parameters_used=params
+                )
         
-        # Add o3-mini specific reasoning_effort parameter when supported
-        # Note: Commented out until Azure supports it (needs API version 2025-04-01-preview)
-        # if model_config.name == "o3-mini" and "reasoning_effort" in defaults:
-        #     params["reasoning_effort"] = defaults.get("reasoning_effort", "medium")
+        log_prompt_diagnostics(model_config.name, prompt)
         
         # Route to appropriate API
-        if model_config.name in ["gpt-4o", "gpt-4o-mini", "o3-mini"]:
-            result = call_azure_openai(model_config.name, prompt, params)
-        elif model_config.name == "mistral-large":
-            result = call_mistral_azure(prompt, params)
-        elif model_config.name == "claude-3-5-sonnet":
-            result = call_claude_databricks(prompt, params)
-        elif model_config.name == "gemini-1-5-flash":
-            result = call_gemini_azure(prompt, params)
-        else:
-            result = {"error": f"Model {model_config.name} not configured"}
-        
-        # Check for errors
-        if isinstance(result, dict) and "error" in result:
+        try:
+            response_data = await run_generation(model_config.name, prompt, params, cache_key, request_id)
+        except ProviderError as e:
             return ModelResult(
                 model_name=model_config.name,
                 display_name=model_info.display_name,
                 success=False,
-                error=result["error"],
+                error=e.message,
                 generation_time=time.time() - start_time,
                 parameters_used=params
             )
@@ -1032,7 +1818,7 @@ def generate_for_model(model_config: ModelConfig, json_str: str, session_id: Opt
             model_name=model_config.name,
             display_name=model_info.display_name,
             success=True,
-            generated_text=result,
+            generated_text=response_data["generated_text"],
             generation_time=time.time() - start_time,
             from_cache=False,
             parameters_used=params
@@ -1048,11 +1834,97 @@ def generate_for_model(model_config: ModelConfig, json_str: str, session_id: Opt
             parameters_used={}
         )
 
+async def prepare_parallel_generation(request: ParallelGenerationRequest) -> Tuple[PreparedJSON, List[ModelConfig]]:
+    """Validate a parallel generation request.
+    
+    Uses the prepared JSON of ``request.session_id`` when the session is
+    still live, otherwise parses ``request.json_data``.
+    
+    Returns:
+        Tuple of (prepared JSON, enabled model configs)
+        
+    Raises:
+        HTTPException: 400 if the JSON is invalid or missing, or no models are enabled
+    """
+    prepared = await load_prepared_json(request.session_id)
+    if prepared is None:
+        if not request.json_data:
+            raise HTTPException(status_code=400, detail="json_data is required when session_id is missing or expired")
+        # Validate JSON
+        try:
+            prepared = prepare_json_payload(json.loads(request.json_data))
+        except json.JSONDecodeError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid JSON: {str(e)}")
+    # Filter enabled models
+    enabled_models = [m for m in request.models if m.enabled]
+    
+    if not enabled_models:
+        raise HTTPException(status_code=400, detail="No models enabled")
+    
+    return prepared, enabled_models
+
+async def iter_model_results(request: ParallelGenerationRequest, prepared: PreparedJSON,
+                             enabled_models: List[ModelConfig],
+                             request_id: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+    """Run all enabled models concurrently and yield each result as it completes.
+    
+    Unfinished generations are cancelled if the consumer stops early
+    (e.g. a streaming client disconnects). Calls are queued in the scheduler
+    under ``request_id`` (a new one per call by default; batch jobs pass
+    their job ID so the whole job shares one fair share).
+    """
+    # Run models concurrently; the global scheduler bounds upstream concurrency
+    request_id = request_id or str(uuid.uuid4())
+    # Every model gets its own budget, but none may run past the request deadline
+    deadline = request_deadline(request.deadline_seconds)
+    
+    async def run_model(model: ModelConfig) -> Dict[str, Any]:
+        model_start = time.time()
+        # Each model runs in its own task, so it gets its own log line
+        log = request_logger.begin("generate_model", model=model.name, request_id=request_id)
+        try:
+            result = await generate_for_model(model, prepared, request.session_id, request_id,
+                                              use_cache=request.use_cache,
+                                              timeout=min(model_timeout(model.name, model.timeout_seconds), deadline))
+        except Exception as e:
+            result = ModelResult(
+                model_name=model.name,
+                display_name=model.name,
+                success=False,
+                error=f"Timeout or error: {str(e)}",
+                generation_time=time.time() - model_start,
+                parameters_used={}
+            )
+        except asyncio.CancelledError:
+            log.emit(cancelled=True)
+            raise
+        log.emit(logging.INFO if result.success else logging.WARNING, success=result.success,
+                 from_cache=result.from_cache, error=result.error)
+        return result.dict()
+    
+    tasks = [asyncio.ensure_future(run_model(model)) for model in enabled_models]
+    try:
+        for next_result in asyncio.as_completed(tasks):
+            yield await next_result
+    finally:
+        for task in tasks:
+            task.cancel()
+
+def summarize_results(results: List[Dict[str, Any]], models_run: int, start_time: float) -> Dict[str, Any]:
+    """Timing and success counts for a parallel generation run."""
+    return {
+        "total_time": time.time() - start_time,
+        "models_run": models_run,
+        "successful": sum(1 for r in results if r["success"]),
+        "failed": sum(1 for r in results if not r["success"])
+    }
+
 @app.post("/generate-all")
 async def generate_all(request: ParallelGenerationRequest) -> Dict[str, Any]:
     """Generate text using multiple models in parallel.
     
     This endpoint runs all enabled models simultaneously and returns
+    once every model has finished. Use /generate-all/stream to receive
     results as they complete.
     
     Args:
@@ -1062,53 +1934,82 @@ async def generate_all(request: ParallelGenerationRequest) -> Dict[str, Any]:
         Dictionary with results from all models and timing information
     """
     start_time = time.time()
+    prepared, enabled_models = await prepare_parallel_generation(request)
     
-    # Validate JSON
-    try:
-        json_obj = json.loads(request.json_data)
-        # Use compact JSON format to save tokens
-        json_str = json.dumps(json_obj, separators=(',', ':'))
-        print(f"📦 Parallel generation JSON size: {len(json_str)} chars (compact)")
-    except json.JSONDecodeError as e:
-        raise HTTPException(status_code=400, detail=f"Invalid JSON: {str(e)}")
+    # Collect results in completion order
+    results = [result async for result in iter_model_results(request, prepared, enabled_models)]
     
-    # Filter enabled models
-    enabled_models = [m for m in request.models if m.enabled]
+    return {
+        "results": results,
+        **summarize_results(results, len(enabled_models), start_time)
+    }
+
+@app.post("/generate-all/stream")
+async def generate_all_stream(request: ParallelGenerationRequest,
+                              format: Literal["sse", "ndjson"] = "sse") -> StreamingResponse:
+    """Stream parallel generation results as each model completes.
     
-    if not enabled_models:
-        raise HTTPException(status_code=400, detail="No models enabled")
+    Sends one ``result`` frame per model (a ModelResult) in completion
+    order, followed by a ``summary`` frame with total_time, models_run,
+    successful and failed. Time to first result is the latency of the
+    fastest model instead of the slowest.
     
-    # Run models in parallel using ThreadPoolExecutor
-    results = []
-    with ThreadPoolExecutor(max_workers=len(enabled_models)) as executor:
-        future_to_model = {
-            executor.submit(generate_for_model, model, json_str, request.session_id): model
-            for model in enabled_models
-        }
+    Args:
+        request: Contains model configurations and JSON data
+        format: "sse" for Server-Sent Events (default) or "ndjson" for
+            newline-delimited JSON ({"type": "result", "result": {...}})
         
-        for future in as_completed(future_to_model):
-            model = future_to_model[future]
-            try:
-                result = future.result(timeout=30)
-                results.append(result.dict())
-            except Exception as e:
-                results.append(ModelResult(
-                    model_name=model.name,
-                    display_name=model.name,
-                    success=False,
-                    error=f"Timeout or error: {str(e)}",
-                    generation_time=30.0,
-                    parameters_used={}
-                ).dict())
-    
-    total_time = time.time() - start_time
+    Returns:
+        Streaming response of result frames and a final summary frame
+    """
+    start_time = time.time()
+    prepared, enabled_models = await prepare_parallel_generation(request)
+    
+    async def frames() -> AsyncIterator[str]:
+        results = []
+        async for result in iter_model_results(request, prepared, enabled_models):
+            results.append(result)
+            if format == "ndjson":
+                yield stream_frame("result", {"result": result}, format)
+            else:
+                yield stream_frame("result", result, format)
+        yield stream_frame("summary", summarize_results(results, len(enabled_models), start_time), format)
+    
+    return streaming_response(frames(), format)
+
+@app.post("/generate-all/estimate")
+async def estimate_generate_all(request: ParallelGenerationRequest) -> Dict[str, Any]:
+    """Pre-flight estimate for a /generate-all request, without calling any model.
+    
+    Renders each enabled model's prompt exactly as /generate-all would
+    (same compaction level and parameters) and counts its tokens locally.
+    
+    Args:
+        request: Same body as /generate-all
+        
+    Returns:
+        Dictionary with per-model ``estimates`` (input/output tokens, cost in
+        USD, expected latency, compaction level, and whether max_tokens may
+        truncate the answer or the prompt overflows the context window), plus
+        total cost and expected wall time (the slowest model, since models
+        run in parallel)
+    """
+    prepared, enabled_models = await prepare_parallel_generation(request)
+    
+    estimates = []
+    for model_config in enabled_models:
+        _, prompt, params, data_digest = build_model_prompt(model_config, prepared)
+        estimate = estimate_generation(model_config.name, prompt, params["max_tokens"])
+        estimate["compaction_level"] = data_digest.rsplit(":", 1)[-1]
+        estimate["configured"] = model_config.name in MODEL_PROVIDERS
+        estimates.append(estimate)
     
     return {
-        "results": results,
-        "total_time": total_time,
-        "models_run": len(enabled_models),
-        "successful": sum(1 for r in results if r["success"]),
-        "failed": sum(1 for r in results if not r["success"])
+        "estimates": estimates,
+        "total_input_tokens": sum(e["input_tokens"] for e in estimates),
+        "total_estimated_cost_usd": round(sum(e["estimated_cost_usd"] for e in estimates), 6),
+        "expected_wall_time_seconds": max(e["expected_latency_seconds"] for e in estimates),
+        "token_counter": token_counter.stats()
     }
 
 @app.get("/health")
@@ -1121,6 +2022,11 @@ async def health_check() -> Dict[str, Any]:
         - mode: Operation mode ("api" for API-based inference)
         - token_configured: Whether Hugging Face token is configured
         - azure_configured: Whether Azure OpenAI is configured
+        - logging: Log level, diagnostics sampling and dropped log lines
+        - providers: Circuit breaker state and adaptive concurrency limit
+          per provider that has been called
+        - models_available: False for models whose provider's breaker is
+          open (calls fail fast), so clients can skip them
     """
     api_token = os.getenv("HUGGINGFACE_TOKEN")
     azure_key = os.getenv("AZURE_OPENAI_API_KEY")
@@ -1134,9 +2040,121 @@ async def health_check() -> Dict[str, Any]:
             "mistral": bool(os.getenv("AZURE_MISTRAL_API_KEY")),
             "claude": bool(os.getenv("AZURE_DATABRICKS_API_KEY") or os.getenv("ANTHROPIC_API_KEY")),
             "gemini": bool(os.getenv("AZURE_APIM_GEMINI_KEY") or os.getenv("GOOGLE_API_KEY"))
+        },
+        "logging": request_logger.stats(),
+        "providers": provider_guards.stats(),
+        "models_available": {
+            model: not provider_guards.is_open(provider) for model, provider in MODEL_PROVIDERS.items()
         }
     }
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics() -> PlainTextResponse:
+    """Prometheus scrape endpoint.
+    
+    Exposes the ``rikstoto_generation_seconds`` latency histogram
+    (labelled by model, provider, path, endpoint and outcome) plus cache,
+    single-flight, hedging and scheduler counters for this worker. Error rate and
+    cache hit ratio are the ``outcome`` shares of ``_count``.
+    """
+    scheduler = generation_scheduler.stats()
+    breaker_stats = provider_guards.stats()
+    rate_limit_stats = rate_limiters.stats()
+    extra = [
+        *render_sample("rikstoto_cache_hits_total", "counter", "Cache lookups that hit",
+                       [({"cache": "responses"}, response_cache.hits), ({"cache": "sessions"}, json_cache.hits)]),
+        *render_sample("rikstoto_cache_misses_total", "counter", "Cache lookups that missed",
+                       [({"cache": "responses"}, response_cache.misses), ({"cache": "sessions"}, json_cache.misses)]),
+        *render_sample("rikstoto_singleflight_collapsed_total", "counter",
+                       "Generations that joined an identical call already in flight",
+                       [({}, generation_flights.collapsed)]),
+        *render_sample("rikstoto_hedges_fired_total", "counter", "Hedged duplicate requests sent",
+                       [({"model": m}, n) for m, n in hedger.fired.items()]),
+        *render_sample("rikstoto_hedges_won_total", "counter", "Hedged requests that answered first",
+                       [({"model": m}, n) for m, n in hedger.won.items()]),
+        *render_sample("rikstoto_breaker_open", "gauge", "1 while the provider's circuit breaker is open",
+                       [({"provider": p}, int(s["state"] == "open")) for p, s in breaker_stats.items()]),
+        *render_sample("rikstoto_provider_concurrency_limit", "gauge", "Adaptive concurrency limit per provider",
+                       [({"provider": p}, s["concurrency_limit"]) for p, s in breaker_stats.items()]),
+        *render_sample("rikstoto_azure_throttled_total", "counter", "429 responses per Azure OpenAI deployment",
+                       [({"deployment": d}, s["throttled"]) for d, s in rate_limit_stats.items()]),
+        *render_sample("rikstoto_azure_rate_limit_wait_seconds_total", "counter",
+                       "Time calls waited for Azure OpenAI quota",
+                       [({"deployment": d}, s["wait_seconds_total"]) for d, s in rate_limit_stats.items()]),
+        *render_sample("rikstoto_azure_rate_limit_waiting", "gauge", "Calls queued for Azure OpenAI quota",
+                       [({"deployment": d}, s["waiting"]) for d, s in rate_limit_stats.items()]),
+        *render_sample("rikstoto_scheduler_running", "gauge", "Upstream generations running",
+                       [({}, scheduler["running"])]),
+        *render_sample("rikstoto_scheduler_queue_depth", "gauge", "Generations waiting for a slot",
+                       [({}, scheduler["queue_depth"])]),
+        *render_sample("rikstoto_log_lines_dropped_total", "counter", "Log lines dropped on a full queue",
+                       [({}, request_logger.stats()["dropped"])])
+    ]
+    return PlainTextResponse(render_prometheus([generation_latency], extra),
+                             media_type="text/plain; version=0.0.4")
+
+@app.get("/metrics/latency")
+async def latency_percentiles(group_by: str = "model,path,outcome") -> Dict[str, Any]:
+    """Estimated p50/p95/p99 generation latency from the histogram.
+    
+    Args:
+        group_by: Comma-separated labels to aggregate by (model, provider,
+            path, endpoint, outcome)
+        
+    Returns:
+        Dictionary with a ``latency`` list of {labels..., count, mean, p50, p95, p99}
+        in seconds
+    """
+    labels = [name for name in group_by.split(",") if name in generation_latency.label_names]
+    return {"group_by": labels, "latency": generation_latency.percentiles(labels)}
+
+@app.get("/pool-stats")
+async def pool_stats() -> Dict[str, Any]:
+    """Connection pool statistics for the shared provider clients.
+    
+    Useful for checking connection reuse under load: a healthy pool shows
+    few open connections relative to the number of requests served.
+    
+    Returns:
+        Dictionary with open, idle and in-flight counts per pooled Azure
+        OpenAI client, and connections opened per upstream HTTP host
+    """
+    return {
+        "azure_openai": provider_clients.stats(),
+        "http_clients": http_clients.stats()
+    }
+
+@app.get("/scheduler-stats")
+async def scheduler_stats() -> Dict[str, Any]:
+    """Queue depth, running generations and queue wait times for the scheduler.
+    
+    Returns:
+        Dictionary with global and per-provider running/queued counts,
+        average, max and last wait time in seconds, and the quota pacing
+        state per Azure OpenAI deployment
+    """
+    return {**generation_scheduler.stats(), "rate_limits": rate_limiters.stats()}
+
+@app.get("/cache-stats")
+async def cache_stats() -> Dict[str, Any]:
+    """Usage and hit/miss/eviction counters for the response and session caches.
+    
+    Returns:
+        Dictionary with ``responses`` and ``sessions`` entries: backend name,
+        TTL, hits, misses and hit rate for this worker, plus entries and bytes
+        against their budgets and evictions where the backend tracks them.
+        ``single_flight`` counts upstream calls made and identical concurrent
+        calls collapsed into them (in total and per model); ``token_counts``
+        reports the token count cache and which tokenizers are loaded
+    """
+    return {
+        "responses": await response_cache.stats(),
+        "sessions": await json_cache.stats(),
+        "single_flight": generation_flights.stats(),
+        "templates": template_cache_stats(),
+        "token_counts": token_counter.stats()
+    }
+
 @app.get("/test-models")
 async def test_models():
     """Test which models are actually accessible via the Inference API."""
@@ -1162,7 +2180,7 @@ async def test_models():
                 }
             }
             
-            response = requests.post(api_url, headers=headers, json=payload, timeout=5)
+            response = await http_clients.post(api_url, headers=headers, json=payload, timeout=5)
             
             status = "available" if response.status_code == 200 else \
                     "loading" if response.status_code == 503 else \
@@ -1187,95 +2205,10 @@ async def test_models():
 # ============================================================================
 
 import random
-from typing import Literal
-
-# Norwegian Horse Racing Data Pools - Updated 2024/2025
-NORWEGIAN_HORSE_NAMES = [
-    # Popular current horses
-    "Tangen Haap", "Looking Superb", "Wilda", "Sweetlikecandybar", "Disco Volante",
-    "Bolt Brodde", "Clodrique", "Flash Forward", "Victory Lane", "Thunder Strike",
-    "Troll Solen", "Myr Faksen", "Grisle Odin G.L.", "Lionel", "Gullrussen",
-    "Alm Svarten", "Philip Lyn", "Voje Pumbaa", "Moe Odin", "Sjur Foten",
-    "Odd Herakles", "Alm Norfinn", "Valle Grim", "Lykkje Svarten", "Tekno Odin",
-    "Finnskog Torden", "Stjerne Faks", "Bånseth", "Rafolo", "Tyrifaksen",
-    
-    # Classic Norwegian names
-    "Northern Star", "Quick Silver", "Midnight Express", "Storm Chaser", "Dark Shadow",
-    "Lucky Seven", "Speed Demon", "Final Rush", "Viking Storm", "Ice Queen",
-    "Red Lightning", "Blue Diamond", "Green Flash", "Yellow Fever", "Orange Crush",
-    "Purple Rain", "Black Beauty", "White Knight", "Golden Arrow", "Silver Bullet",
-    
-    # International horses racing in Norway
-    "Power Drive", "Easy Rider", "Slow Motion", "Last Chance", "First Class",
-    "Royal Fortune", "Diamond King", "Emerald Queen", "Ruby Red", "Sapphire Blue",
-    "Pearl White", "Crystal Clear", "Alpha Centauri", "Beta Minor", "Gamma Ray",
-    "Delta Force", "Epsilon Plus", "Zeta Jones", "Eta Carinae", "Theta Wave",
-    
-    # Fantasy/creative names
-    "Iota Star", "Quantum Leap", "Sonic Boom", "Light Speed", "Warp Drive",
-    "Hyper Space", "Stellar Wind", "Cosmic Ray", "Solar Flare", "Speed King",
-    "Zulu Warrior", "Powerful Dream", "Night Runner", "Sky Walker", "Moon Shadow",
-    "Star Gazer", "Wind Rider", "Fire Storm", "Ice Breaker", "Mountain King",
-    "Valley Queen", "River Dance", "Ocean Wave", "Desert Storm", "Arctic Fox",
-    
-    # Norse mythology themed
-    "Nordic Prince", "Viking Queen", "Thor's Hammer", "Odin's Raven", "Freya's Gift",
-    "Loki's Trick", "Balder's Light", "Heimdall's Watch", "Frigg's Blessing", "Tyr's Sword",
-    "Fenris Wolf", "Midgard Serpent", "Valhalla Glory", "Asgard Prince", "Bifrost Runner",
-    "Ragnarok Storm", "Yggdrasil Power", "Mjolnir Force", "Sleipnir Speed", "Gungnir Strike"
-]
 
-NORWEGIAN_DRIVERS = [
-    # Top current Norwegian drivers 2024/2025
-    "Eirik Høitomt", "Magnus Teien Gundersen", "Åsbjørn Tengsareid", "Frode Hamre",
-    "Vidar Hop", "Tom Erik Solberg", "Adrian Solberg Akselsen", "Per Oleg Midtfjeld",
-    "Ole Johan Østre", "Dag-Sveinung Dalen", "Jan Eilert Kvam", "Lars Anvar Kolle",
-    "Geir Nordbotten", "Kristian Malmin", "Gunnar Austevoll", "Erlend Rennesvik",
-    
-    # Additional active drivers
-    "Lars O. Romtveit", "Kai Johansen", "Hans Chr. Holm", "Johan Kringeland",
-    "Jomar Blekkan", "Cato Antonsen", "Tobias Kilen", "Geir Mikkelsen",
-    "Ove Wassberg", "Thor Borg", "Øystein Austevoll", "Anders Lundstrøm Wolden",
-    
-    # International drivers racing in Norway
-    "Ulf Ohlsson", "Bjørn Goop", "Magnus A Djuse", "Erik Adielsson",
-    "Jorma Kontio", "Örjan Kihlström", "Peter Untersteiner", "Carl Johan Jepson"
-]
-
-NORWEGIAN_TRAINERS = [
-    # Top Norwegian trainers 2024/2025
-    "Frode Hamre", "Erlend Rennesvik", "Geir Vegard Gundersen", "Jan Martinsen",
-    "Lutfi Kolgjini", "Tom Andersen", "Roger Walmann", "Dag-Sveinung Dalen",
-    "Øystein Tjomsland", "Are Hyldmo", "Trond Anderssen", "Cecilie Andersson",
-    "Kristine Kvasnes", "Per Ludvig Nilsen", "Lars O. Romtveit", "Gunnar Austevoll",
-    
-    # Swedish trainers with horses in Norway
-    "Stefan Melander", "Daniel Redén", "Robert Bergh", "Joakim Løvgren",
-    "Björn Goop", "Timo Nurmos", "Jerry Riordan", "Roger Malmqvist"
-]
-
-# Updated Norwegian tracks 2024/2025
-NORWEGIAN_TRACKS = [
-    "Bjerke",           # Oslo - National arena
-    "Klosterskogen",    # Drammen area
-    "Jarlsberg",        # Tønsberg
-    "Momarken",         # Mysen
-    "Forus",            # Stavanger - Oldest still active
-    "Bergen Travpark",  # Bergen
-    "Biri",             # Gjøvik area
-    "Sørlandet",        # Kristiansand
-    "Harstad",          # Harstad
-    "Bodø",             # Bodø
-    "Varig Orkla Arena", # Orkdal
-    "Voss",             # Voss
-    "Nossum",           # Løten
-    "Rissa",            # Rissa
-    "Lofoten Travpark", # Lofoten
-    "Olsborgmoen",      # Nord-Odal
-]
-
-RACE_DISTANCES = [1609, 2100, 2140, 2600, 2609, 3100]
-START_METHODS = ["A", "V"]  # A = Auto, V = Volt
+from coupons import (NORWEGIAN_HORSE_NAMES, NORWEGIAN_DRIVERS, NORWEGIAN_TRAINERS, NORWEGIAN_TRACKS,
+                     RACE_DISTANCES, START_METHODS, GENDERS, BET_BANDS, MARK_CANDIDATES, MARK_COUNTS,
+                     UPSET_WINNERS, generate_coupons, iter_ndjson, new_seed)
 
 class JsonGeneratorRequest(BaseModel):
     product: Literal["V75", "V64", "V5", "DD", "Stalltips"] = "V75"
@@ -1297,13 +2230,17 @@ class JsonGeneratorRequest(BaseModel):
     horses_per_race: Optional[List[int]] = None
     bankers: Optional[List[int]] = None
 
-@app.post("/api/generate-json")
-async def generate_test_json(request: JsonGeneratorRequest):
-    """Generate realistic V75/V64/V5 test JSON data for AI model testing."""
+def build_test_json(request: JsonGeneratorRequest) -> Dict[str, Any]:
+    """Build one realistic V75/V64/V5 test coupon.
+    
+    Every draw comes from an RNG owned by this call, so a seeded request
+    gives the same coupon however many others run at the same time, and
+    the function is safe to run on worker threads or processes. Only
+    ``betDetails.timestamp`` (the current time) differs between runs.
+    """
     
-    # Set random seed for reproducibility if provided
-    if request.seed:
-        random.seed(request.seed)
+    # Own RNG per request; seeded for reproducibility if a seed is provided
+    rng = random.Random(request.seed)
     
     # Determine number of races based on product
     num_races = {
@@ -1315,18 +2252,18 @@ async def generate_test_json(request: JsonGeneratorRequest):
     }.get(request.product, 7)
     
     # Select track
-    track = request.track or random.choice(NORWEGIAN_TRACKS)
+    track = request.track or rng.choice(NORWEGIAN_TRACKS)
     
     # Generate date (random date in next 30 days)
     from datetime import date, timedelta
-    race_date = date.today() + timedelta(days=random.randint(1, 30))
+    race_date = date.today() + timedelta(days=rng.randint(1, 30))
     
     # Generate base structure
     json_data = {
         "product": request.product if request.product != "Stalltips" else "V75",
         "track": track,
         "date": race_date.strftime("%Y-%m-%d"),
-        "startTime": f"{random.randint(17, 20)}:{random.choice(['00', '15', '30', '45'])}",
+        "startTime": f"{rng.randint(17, 20)}:{rng.choice(['00', '15', '30', '45'])}",
     }
     
     # Add Stalltips info if requested
@@ -1334,8 +2271,8 @@ async def generate_test_json(request: JsonGeneratorRequest):
         json_data["stalltipsInfo"] = {
             "type": "Stalltips",
             "generatedBy": "Rikstoto Algorithm v3.2",
-            "strategy": random.choice(["Favoritt-fokus", "Balansert mix", "Outsider-jakt", "Sikker strategi"]),
-            "confidence": random.choice(["Høy", "Medium", "Moderat"]),
+            "strategy": rng.choice(["Favoritt-fokus", "Balansert mix", "Outsider-jakt", "Sikker strategi"]),
+            "confidence": rng.choice(["Høy", "Medium", "Moderat"]),
             "description": "Algoritmisk generert kupong basert på siste odds og spillemønster"
         }
     
@@ -1349,7 +2286,7 @@ async def generate_test_json(request: JsonGeneratorRequest):
             stake_amount = request.stake
         else:
             # Random realistic Stalltips price level
-            stake_amount = random.choice([98, 196, 294, 392, 490])
+            stake_amount = rng.choice([98, 196, 294, 392, 490])
         
         rows = 1  # Stalltips is always ONE shared coupon, not multiple rows
         is_system = False  # Not a personal systemspill
@@ -1372,7 +2309,7 @@ async def generate_test_json(request: JsonGeneratorRequest):
         bet_type = request.product
     
     json_data["betDetails"] = {
-        "betId": f"{request.product}-{race_date.strftime('%Y-%m%d')}-{track[:2].upper()}-{random.randint(100000, 999999)}",
+        "betId": f"{request.product}-{race_date.strftime('%Y-%m%d')}-{track[:2].upper()}-{rng.randint(100000, 999999)}",
         "betType": bet_type,  # Shows "Stalltips" for V75/V64/V5
         "systemPlay": is_system,  # Always false for Stalltips
         "rows": rows,  # Always 1 for Stalltips (one shared coupon)
@@ -1387,138 +2324,121 @@ async def generate_test_json(request: JsonGeneratorRequest):
         json_data["betDetails"]["shareType"] = share_type  # "Lite spill", "Standard spill", etc.
     
     # Generate pool info
-    total_pool = request.pool_size or random.randint(500000, 15000000)
+    total_pool = request.pool_size or rng.randint(500000, 15000000)
     json_data["poolInfo"] = {
         "totalPool": total_pool,
         "currentPool": total_pool,
         "bettingStatus": "open",
-        "jackpot": random.randint(0, 5000000) if random.random() > 0.7 else 0
+        "jackpot": rng.randint(0, 5000000) if rng.random() > 0.7 else 0
     }
     
     # Generate races
     races = []
-    all_horses = random.sample(NORWEGIAN_HORSE_NAMES, min(len(NORWEGIAN_HORSE_NAMES), num_races * 12))
+    all_horses = rng.sample(NORWEGIAN_HORSE_NAMES, min(len(NORWEGIAN_HORSE_NAMES), num_races * 12))
     horse_index = 0
     
     markings = {}
     bankers = []
     
+    # Per-scenario index tables (by number of starters), looked up once per coupon
+    scenario = request.scenario if request.scenario in ("favorites", "upsets") else None
+    mark_candidates = MARK_CANDIDATES[scenario]
+    min_marked, max_marked = MARK_COUNTS[scenario]
+    race_name = request.product if request.product != "Stalltips" else "V75"
+    randint, choice, uniform = rng.randint, rng.choice, rng.uniform
+    
     for race_num in range(1, num_races + 1):
-        num_horses = random.randint(8, 15)
+        num_horses = randint(8, 15)
         race_horses = all_horses[horse_index:horse_index + num_horses]
         horse_index += num_horses
         
         # Generate race data
         race = {
             "race": race_num,
-            "name": f"{request.product}-{race_num}" if request.product != "Stalltips" else f"V75-{race_num}",
-            "distance": random.choice(RACE_DISTANCES),
-            "startMethod": random.choice(START_METHODS),
+            "name": f"{race_name}-{race_num}",
+            "distance": choice(RACE_DISTANCES),
+            "startMethod": choice(START_METHODS),
             "totalStarters": num_horses,
-            "poolSize": random.randint(100000, 2000000)
+            "poolSize": randint(100000, 2000000)
         }
         
-        # Betting distribution will be added after horse results are generated
-        
         # Generate horse results
         results = []
         positions = list(range(1, num_horses + 1))
-        random.shuffle(positions)
-        
-        # Determine marking strategy based on scenario
-        if request.scenario == "favorites":
-            # Mark top 3-4 horses by odds
-            horses_to_mark = random.sample(range(1, min(5, num_horses + 1)), random.randint(2, 4))
-        elif request.scenario == "upsets":
-            # Mark some outsiders
-            horses_to_mark = random.sample(range(max(1, num_horses - 5), num_horses + 1), random.randint(2, 4))
-        else:
-            # Mixed strategy
-            horses_to_mark = random.sample(range(1, num_horses + 1), random.randint(2, 5))
+        rng.shuffle(positions)
         
+        # Mark horses according to the scenario: top 3-4 by odds for
+        # favorites, outsiders for upsets, any horses otherwise
+        horses_to_mark = set(rng.sample(mark_candidates[num_horses], randint(min_marked, max_marked)))
         markings[str(race_num)] = sorted(horses_to_mark)
         
         # Add banker for some races
-        if random.random() > 0.6 and len(horses_to_mark) == 1:
+        if rng.random() > 0.6 and len(horses_to_mark) == 1:
             bankers.append(race_num)
         
-        # Generate realistic betting distribution
-        total_pool = race["poolSize"]
-        remaining_pool = total_pool
-        bet_percentages = []
-        
-        # Generate decreasing bet percentages based on ranking
-        for i in range(num_horses):
-            if i == 0:  # Favorite
-                pct = random.uniform(25, 45)
-            elif i == 1:  # Second choice
-                pct = random.uniform(15, 25)
-            elif i == 2:  # Third choice
-                pct = random.uniform(8, 15)
-            elif i < num_horses // 2:  # Mid-field
-                pct = random.uniform(3, 8)
-            else:  # Outsiders
-                pct = random.uniform(0.1, 3)
-            bet_percentages.append(pct)
-        
-        # Normalize percentages to sum to 100
+        # Generate decreasing bet percentages based on ranking, normalized to sum to 100
+        pool_size = race["poolSize"]
+        bet_percentages = [uniform(low, high) for low, high in BET_BANDS[num_horses]]
         total_pct = sum(bet_percentages)
         bet_percentages = [p / total_pct * 100 for p in bet_percentages]
         
-        for i, horse_num in enumerate(range(1, num_horses + 1)):
+        for i, bet_pct in enumerate(bet_percentages):
+            horse_num = i + 1
             # Calculate realistic odds from betting percentage
-            bet_pct = bet_percentages[i]
             odds = round(95 / bet_pct, 1) if bet_pct > 0 else 999.0  # 95% payout after takeout
+            marked = horse_num in horses_to_mark
             
             horse_data = {
                 "horse": horse_num,
                 "position": positions[i],
-                "marked": "true" if horse_num in horses_to_mark else "false",
+                "marked": "true" if marked else "false",
                 "name": race_horses[i] if i < len(race_horses) else f"Hest {horse_num}",
-                "driver": random.choice(NORWEGIAN_DRIVERS),
+                "driver": choice(NORWEGIAN_DRIVERS),
                 "odds": min(odds, 999.0),  # Cap at 999
                 "percentageBet": round(bet_pct, 1),
-                "amountBet": int(total_pool * bet_pct / 100),
-                "publicRanking": i + 1
+                "amountBet": int(pool_size * bet_pct / 100),
+                "publicRanking": horse_num
             }
             
             # Add extra details for marked horses
-            if horse_num in horses_to_mark:
+            if marked:
                 horse_data.update({
-                    "trainer": random.choice(NORWEGIAN_TRAINERS),
-                    "form": f"{random.randint(1,9)}-{random.randint(1,9)}-{random.randint(1,9)}-{random.randint(1,9)}-{random.randint(1,9)}",
-                    "winPercentage": random.randint(10, 40),
-                    "placePercentage": random.randint(30, 80),
-                    "earnings": random.randint(100000, 2000000),
-                    "age": random.randint(3, 10),
-                    "gender": random.choice(["H", "V", "G"])
+                    "trainer": choice(NORWEGIAN_TRAINERS),
+                    "form": f"{randint(1,9)}-{randint(1,9)}-{randint(1,9)}-{randint(1,9)}-{randint(1,9)}",
+                    "winPercentage": randint(10, 40),
+                    "placePercentage": randint(30, 80),
+                    "earnings": randint(100000, 2000000),
+                    "age": randint(3, 10),
+                    "gender": choice(GENDERS)
                 })
             
             results.append(horse_data)
         
         race["results"] = results
         
-        # Add betting distribution based on the generated data
+        # Horse indexes by rounded bet percentage, highest first (ties keep horse order);
+        # one sort serves both the betting distribution and the favorites winner
+        by_bets = sorted(range(num_horses), key=lambda h: results[h]["percentageBet"], reverse=True)
         if request.include_betting_distribution:
-            # Find top 3 horses by bet percentage
-            sorted_horses = sorted(results, key=lambda x: x["percentageBet"], reverse=True)
+            first, second, third = results[by_bets[0]], results[by_bets[1]], results[by_bets[2]]
             race["bettingDistribution"] = {
-                "favorite": {"horse": sorted_horses[0]["horse"], "percentage": sorted_horses[0]["percentageBet"]},
-                "secondChoice": {"horse": sorted_horses[1]["horse"], "percentage": sorted_horses[1]["percentageBet"]},
-                "thirdChoice": {"horse": sorted_horses[2]["horse"], "percentage": sorted_horses[2]["percentageBet"]}
+                "favorite": {"horse": first["horse"], "percentage": first["percentageBet"]},
+                "secondChoice": {"horse": second["horse"], "percentage": second["percentageBet"]},
+                "thirdChoice": {"horse": third["horse"], "percentage": third["percentageBet"]}
             }
         
         # Determine winner
         if request.scenario == "favorites":
-            winner = sorted(results, key=lambda x: x["percentageBet"], reverse=True)[0]["horse"]
+            winner = by_bets[0] + 1
         elif request.scenario == "upsets":
-            winner = random.choice([h for h in range(num_horses//2, num_horses + 1)])
+            winner = choice(UPSET_WINNERS[num_horses])
         else:
-            winner = random.randint(1, num_horses)
+            winner = randint(1, num_horses)
         
+        winner_data = results[winner - 1]
         race["winner"] = winner
-        race["winnerName"] = next((h["name"] for h in results if h["horse"] == winner), "Unknown")
-        race["winnerOdds"] = next((h["odds"] for h in results if h["horse"] == winner), 10.0)
+        race["winnerName"] = winner_data["name"]
+        race["winnerOdds"] = winner_data["odds"]
         race["hit"] = winner in horses_to_mark
         
         races.append(race)
@@ -1552,53 +2472,53 @@ async def generate_test_json(request: JsonGeneratorRequest):
     if num_races == 7:  # V75
         prizes = {
             "sevenCorrect": {
-                "winners": random.randint(1, 5) if correct_races == 7 else 0,
-                "amount": round(prize_pool * 0.4 / max(1, random.randint(1, 5))) if correct_races == 7 else 0
+                "winners": rng.randint(1, 5) if correct_races == 7 else 0,
+                "amount": round(prize_pool * 0.4 / max(1, rng.randint(1, 5))) if correct_races == 7 else 0
             },
             "sixCorrect": {
-                "winners": random.randint(5, 50),
-                "amount": round(prize_pool * 0.3 / random.randint(5, 50))
+                "winners": rng.randint(5, 50),
+                "amount": round(prize_pool * 0.3 / rng.randint(5, 50))
             },
             "fiveCorrect": {
-                "winners": random.randint(100, 1000),
-                "amount": round(prize_pool * 0.3 / random.randint(100, 1000))
+                "winners": rng.randint(100, 1000),
+                "amount": round(prize_pool * 0.3 / rng.randint(100, 1000))
             }
         }
     elif num_races == 6:  # V64
         prizes = {
             "sixCorrect": {
-                "winners": random.randint(1, 10),
-                "amount": round(prize_pool * 0.5 / max(1, random.randint(1, 10)))
+                "winners": rng.randint(1, 10),
+                "amount": round(prize_pool * 0.5 / max(1, rng.randint(1, 10)))
             },
             "fiveCorrect": {
-                "winners": random.randint(20, 200),
-                "amount": round(prize_pool * 0.3 / random.randint(20, 200))
+                "winners": rng.randint(20, 200),
+                "amount": round(prize_pool * 0.3 / rng.randint(20, 200))
             },
             "fourCorrect": {
-                "winners": random.randint(500, 5000),
-                "amount": round(prize_pool * 0.2 / random.randint(500, 5000))
+                "winners": rng.randint(500, 5000),
+                "amount": round(prize_pool * 0.2 / rng.randint(500, 5000))
             }
         }
     elif num_races == 2:  # DD (Dagens Dobbel)
         prizes = {
             "twoCorrect": {
-                "winners": random.randint(10, 100) if correct_races == 2 else 0,
-                "amount": round(prize_pool / max(1, random.randint(10, 100))) if correct_races == 2 else 0
+                "winners": rng.randint(10, 100) if correct_races == 2 else 0,
+                "amount": round(prize_pool / max(1, rng.randint(10, 100))) if correct_races == 2 else 0
             }
         }
     else:  # V5
         prizes = {
             "fiveCorrect": {
-                "winners": random.randint(5, 50) if correct_races == 5 else 0,
-                "amount": round(prize_pool * 0.5 / max(1, random.randint(5, 50))) if correct_races == 5 else 0
+                "winners": rng.randint(5, 50) if correct_races == 5 else 0,
+                "amount": round(prize_pool * 0.5 / max(1, rng.randint(5, 50))) if correct_races == 5 else 0
             },
             "fourCorrect": {
-                "winners": random.randint(50, 500),
-                "amount": round(prize_pool * 0.3 / random.randint(50, 500))
+                "winners": rng.randint(50, 500),
+                "amount": round(prize_pool * 0.3 / rng.randint(50, 500))
             },
             "threeCorrect": {
-                "winners": random.randint(500, 5000),
-                "amount": round(prize_pool * 0.2 / random.randint(500, 5000))
+                "winners": rng.randint(500, 5000),
+                "amount": round(prize_pool * 0.2 / rng.randint(500, 5000))
             }
         }
     
@@ -1648,16 +2568,258 @@ async def generate_test_json(request: JsonGeneratorRequest):
     
     # Add statistics
     json_data["statistics"] = {
-        "coveragePercentage": round(random.uniform(0.5, 2.5), 2),
+        "coveragePercentage": round(rng.uniform(0.5, 2.5), 2),
         "averageWinnerOdds": round(sum(r["winnerOdds"] for r in races) / len(races), 2),
         "favoriteWins": sum(1 for r in races if r["winner"] <= 3),
         "outsiderWins": sum(1 for r in races if r["winner"] > num_horses - 3),
-        "totalBettors": random.randint(10000, 100000),
-        "averageBetSize": random.randint(50, 500)
+        "totalBettors": rng.randint(10000, 100000),
+        "averageBetSize": rng.randint(50, 500)
     }
     
     return json_data
 
+@app.post("/api/generate-json")
+async def generate_test_json(request: JsonGeneratorRequest):
+    """Generate realistic V75/V64/V5 test JSON data for AI model testing."""
+    return await asyncio.to_thread(build_test_json, request)
+
+COUPON_BULK_MAX_COUNT = int(os.getenv("COUPON_BULK_MAX_COUNT", "10000"))
+
+class JsonBulkRequest(JsonGeneratorRequest):
+    """Request for many generated coupons; ``start`` pages through a seeded dataset."""
+    # NumPy seeds must be non-negative
+    seed: Optional[int] = Field(default=None, ge=0)
+    count: int = 100
+    start: int = 0
+    base_date: Optional[date] = None
+
+@app.post("/api/generate-json/bulk")
+async def generate_test_json_bulk(request: JsonBulkRequest):
+    """Generate many test coupons at once with the vectorized generator.
+    
+    The same seed, start, count, base_date and options always give the same
+    coupons. Without a seed one is chosen and returned so the dataset can be
+    reproduced.
+    """
+    if not 1 <= request.count <= COUPON_BULK_MAX_COUNT:
+        raise HTTPException(status_code=400, detail=f"count must be between 1 and {COUPON_BULK_MAX_COUNT}")
+    if request.start < 0:
+        raise HTTPException(status_code=400, detail="start must not be negative")
+    seed = request.seed if request.seed is not None else new_seed()
+    options = request.model_dump(exclude={"seed", "count"})
+    coupons = await asyncio.to_thread(generate_coupons, request.count, seed, **options)
+    return {"seed": seed, "start": request.start, "count": len(coupons), "coupons": coupons}
+
+COUPON_EXPORT_MAX_COUNT = int(os.getenv("COUPON_EXPORT_MAX_COUNT", "10000000"))
+
+class JsonExportRequest(JsonBulkRequest):
+    """Request for a streamed coupon dataset."""
+    count: int = 1000
+    format: Literal["ndjson", "gzip"] = "ndjson"
+
+async def stream_blocks(blocks: Iterator[bytes], first: Optional[bytes] = None) -> AsyncIterator[bytes]:
+    """Pull a blocking byte iterator on a worker thread, one block at a time.
+    
+    ``first`` is a block already taken from the iterator, sent before the rest.
+    """
+    if first:
+        yield first
+    while True:
+        block = await asyncio.to_thread(next, blocks, None)
+        if block is None:
+            return
+        yield block
+
+@app.post("/api/generate-json/export")
+async def export_test_json(request: JsonExportRequest) -> StreamingResponse:
+    """Stream a generated coupon dataset as NDJSON, optionally gzipped.
+    
+    Coupons are generated and encoded a block at a time while the response
+    is sent, so memory stays flat for any count. The seed is returned in the
+    X-Coupon-Seed header so the dataset can be regenerated. The first block
+    is built before the response starts, so bad options get a 400 instead
+    of a truncated 200.
+    
+    Example:
+        curl -X POST localhost:8000/api/generate-json/export -H 'Content-Type: application/json' \\
+             -d '{"count": 1000000, "seed": 42, "format": "gzip"}' -o coupons.ndjson.gz
+    """
+    if not 1 <= request.count <= COUPON_EXPORT_MAX_COUNT:
+        raise HTTPException(status_code=400, detail=f"count must be between 1 and {COUPON_EXPORT_MAX_COUNT}")
+    if request.start < 0:
+        raise HTTPException(status_code=400, detail="start must not be negative")
+    seed = request.seed if request.seed is not None else new_seed()
+    compress = request.format == "gzip"
+    options = request.model_dump(exclude={"seed", "count", "format"})
+    filename = f"coupons-{request.product}-{seed}.ndjson" + (".gz" if compress else "")
+    blocks = iter_ndjson(request.count, seed, compress=compress, **options)
+    try:
+        first = await asyncio.to_thread(next, blocks, None)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid export options: {str(e)}")
+    return StreamingResponse(
+        stream_blocks(blocks, first),
+        media_type="application/gzip" if compress else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"',
+                 "X-Coupon-Seed": str(seed), "X-Coupon-Count": str(request.count)}
+    )
+
+class BatchItem(BaseModel):
+    """One coupon source in a batch job.
+    
+    Either ``json_data`` (a coupon JSON string) or ``generator`` (a spec for
+    /api/generate-json) is required. A generator item with ``count`` > 1
+    expands into that many coupons; with a seed, coupon i uses seed + i so
+    the batch is reproducible.
+    """
+    json_data: Optional[str] = None
+    generator: Optional[JsonGeneratorRequest] = None
+    count: int = Field(default=1, ge=1)
+    label: Optional[str] = None
+
+class BatchJobRequest(BaseModel):
+    """Request for a batch job: every coupon is sent to every enabled model."""
+    models: List[ModelConfig]
+    items: List[BatchItem]
+    use_cache: bool = True
+    deadline_seconds: Optional[float] = None
+
+async def run_batch_item(job_id: str, spec: Dict[str, Any], index: int,
+                         item: Dict[str, Any]) -> Tuple[Dict[str, Any], int, int]:
+    """Generate one coupon of a batch job with every model of the job.
+    
+    Returns:
+        Tuple of (JSONL result line, successful models, failed models)
+    """
+    if item.get("generator") is not None:
+        coupon = await generate_test_json(JsonGeneratorRequest(**item["generator"]))
+    else:
+        coupon = json.loads(item["json_data"])
+    request = ParallelGenerationRequest(models=spec["models"], use_cache=spec["use_cache"],
+                                        deadline_seconds=spec["deadline_seconds"])
+    results = [result async for result in iter_model_results(request, prepare_json_payload(coupon),
+                                                              request.models, request_id=job_id)]
+    # Completion order varies between runs; keep the job's model order in the output
+    order = [model.name for model in request.models]
+    results.sort(key=lambda result: order.index(result["model_name"]) if result["model_name"] in order else len(order))
+    successful = sum(1 for result in results if result["success"])
+    line = {"item": index, "label": item.get("label"), "coupon": coupon, "results": results}
+    return line, successful, len(results) - successful
+
+# Runs batch jobs in the background; progress and results are kept in BATCH_DB_PATH,
+# which is opened on first use (startup resumes jobs), not on import
+batch_runner = BatchRunner.from_env(run_batch_item)
+
+def expand_batch_items(items: List[BatchItem]) -> List[Dict[str, Any]]:
+    """Flatten batch items into one stored item per coupon.
+    
+    Raises:
+        HTTPException: 400 if an item has no (or invalid) coupon source
+    """
+    expanded = []
+    for position, item in enumerate(items):
+        if item.json_data is not None:
+            try:
+                json.loads(item.json_data)
+            except json.JSONDecodeError as e:
+                raise HTTPException(status_code=400, detail=f"Item {position}: invalid JSON: {str(e)}")
+            expanded.append({"json_data": item.json_data, "label": item.label})
+        elif item.generator is not None:
+            for i in range(item.count):
+                generator = item.generator.dict()
+                if generator["seed"] is not None:
+                    generator["seed"] += i
+                expanded.append({"generator": generator, "label": item.label})
+        else:
+            raise HTTPException(status_code=400, detail=f"Item {position}: json_data or generator is required")
+    return expanded
+
+def batch_job_view(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Public view of a stored job: progress and settings, without the coupons."""
+    spec = job.pop("spec")
+    job["models"] = [model["name"] for model in spec["models"]]
+    job["progress"] = round(job["completed_items"] / job["total_items"], 4) if job["total_items"] else 1.0
+    job["results_url"] = f"/batch-jobs/{job['job_id']}/results"
+    return job
+
+@app.post("/batch-jobs", status_code=202)
+async def create_batch_job(request: BatchJobRequest) -> Dict[str, Any]:
+    """Start a batch job that runs every coupon through every enabled model.
+    
+    The job runs in the background, through the same scheduler and provider
+    limits as /generate-all. Poll GET /batch-jobs/{job_id} for progress and
+    download the results from GET /batch-jobs/{job_id}/results.
+    
+    Args:
+        request: Models, coupon items and generation options
+        
+    Returns:
+        The queued job (job_id, status, total_items, progress, results_url)
+        
+    Raises:
+        HTTPException: 400 if no models are enabled, an item is invalid, or
+            the job has more than BATCH_MAX_ITEMS coupons
+    """
+    enabled_models = [m for m in request.models if m.enabled]
+    if not enabled_models:
+        raise HTTPException(status_code=400, detail="No models enabled")
+    # Check the size before expanding, so a huge count is rejected without building it
+    total_items = sum(item.count if item.generator is not None and item.json_data is None else 1
+                      for item in request.items)
+    if total_items > batch_runner.max_items:
+        raise HTTPException(status_code=400,
+                            detail=f"Batch has {total_items} coupons, the limit is {batch_runner.max_items}")
+    items = expand_batch_items(request.items)
+    if not items:
+        raise HTTPException(status_code=400, detail="No items")
+    
+    job_id = str(uuid.uuid4())
+    spec = {
+        "models": [model.dict() for model in enabled_models],
+        "use_cache": request.use_cache,
+        "deadline_seconds": request.deadline_seconds
+    }
+    await batch_runner.store.create(job_id, spec, items)
+    batch_runner.start(job_id)
+    return batch_job_view(await batch_runner.store.get(job_id))
+
+@app.get("/batch-jobs")
+async def list_batch_jobs(limit: int = 50) -> Dict[str, Any]:
+    """Most recent batch jobs with their progress, newest first."""
+    return {"jobs": [batch_job_view(job) for job in await batch_runner.store.list(limit)],
+            **batch_runner.stats()}
+
+@app.get("/batch-jobs/{job_id}")
+async def get_batch_job(job_id: str) -> Dict[str, Any]:
+    """Status and progress of one batch job."""
+    job = await batch_runner.store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Batch job not found")
+    return batch_job_view(job)
+
+@app.get("/batch-jobs/{job_id}/results")
+async def download_batch_results(job_id: str) -> StreamingResponse:
+    """Download a batch job's results as JSONL, one line per finished coupon.
+    
+    Each line holds the item index, its label, the coupon JSON and one
+    ModelResult per model. Can be called while the job is running to get
+    the coupons finished so far.
+    """
+    if await batch_runner.store.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Batch job not found")
+    return StreamingResponse(
+        batch_runner.store.iter_results(job_id),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="batch-{job_id}.jsonl"'}
+    )
+
+@app.delete("/batch-jobs/{job_id}")
+async def cancel_batch_job(job_id: str) -> Dict[str, Any]:
+    """Cancel a queued or running batch job; finished coupons are kept."""
+    if not await batch_runner.cancel(job_id):
+        raise HTTPException(status_code=409, detail="Batch job not found or already finished")
+    return batch_job_view(await batch_runner.store.get(job_id))
+
 # Serve React frontend if build exists
 frontend_build_path = os.path.join(os.path.dirname(__file__), "..", "frontend", "build")
 if os.path.exists(frontend_build_path):
@@ -1676,7 +2838,7 @@ if os.path.exists(frontend_build_path):
     async def serve_react_app(full_path: str):
         """Serve React app for all non-API routes."""
         # Skip API routes
-        if full_path.startswith("api") or full_path in ["health", "models", "generate", "prepare-json", "test-models", "docs", "redoc", "openapi.json"]:
+        if full_path.startswith("api") or full_path in ["health", "models", "generate", "prepare-json", "test-models", "pool-stats", "scheduler-stats", "cache-stats", "metrics", "batch-jobs", "docs", "redoc", "openapi.json"]:
             raise HTTPException(status_code=404)
         
         file_path = os.path.join(frontend_build_path, full_path)
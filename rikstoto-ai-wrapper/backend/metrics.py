@@ -0,0 +1,162 @@
+"""
+In-process metrics for the Rikstoto AI backend.
+
+Generation latency is recorded in a fixed-bucket histogram labelled by
+model, provider, provider path (e.g. Databricks vs the direct Anthropic
+fallback), endpoint and outcome. Recording an observation is a bisect
+and three increments, so it is cheap enough to do on every request.
+
+``render_prometheus`` writes the Prometheus text exposition format for a
+``/metrics`` scrape. ``Histogram.percentiles`` estimates p50/p95/p99 from
+the buckets (linear interpolation inside a bucket, as Prometheus'
+``histogram_quantile`` does) for a quick look without a Prometheus server.
+
+Metrics are per process: with several uvicorn workers, each worker is
+scraped (or reports) separately.
+"""
+
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Upper bounds in seconds; LLM calls range from cached (ms) to o3 reasoning (minutes)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 7.5, 10.0, 15.0, 20.0,
+                   30.0, 45.0, 60.0, 90.0, 120.0)
+
+LabelValues = Tuple[str, ...]
+
+
+class Histogram:
+    """Cumulative-bucket histogram with a fixed set of label names.
+
+    Args:
+        name: Metric name
+        help_text: Description shown in the exposition
+        label_names: Names of the labels every observation carries
+        buckets: Bucket upper bounds, ascending
+    """
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str],
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        # {label values: [count per bucket (last one is +Inf), sum, count]}
+        self._series: Dict[LabelValues, List] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        """Record one observation for the given label values (in label_names order)."""
+        series = self._series.get(label_values)
+        if series is None:
+            series = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            self._series[label_values] = series
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def series(self) -> Iterable[Tuple[Dict[str, str], List[int], float, int]]:
+        """Yield (labels, per-bucket counts, sum, count) for every label set seen."""
+        for label_values, (counts, total, count) in self._series.items():
+            yield dict(zip(self.label_names, label_values)), counts, total, count
+
+    def quantile(self, q: float, counts: List[int], count: int) -> Optional[float]:
+        """Estimate a quantile from bucket counts; None without observations."""
+        if not count:
+            return None
+        rank = q * count
+        seen = 0
+        lower = 0.0
+        for index, bucket_count in enumerate(counts):
+            if index == len(self.buckets):
+                # Above the last bucket: report its bound, as histogram_quantile does
+                return self.buckets[-1]
+            upper = self.buckets[index]
+            if seen + bucket_count >= rank and bucket_count:
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+            lower = upper
+        return self.buckets[-1]
+
+    def quantile_where(self, q: float, min_count: int = 1, **labels: str) -> Optional[float]:
+        """Estimate a quantile over all series matching ``labels``; None below ``min_count`` observations."""
+        merged = [0] * (len(self.buckets) + 1)
+        total = 0
+        for series_labels, counts, _, count in self.series():
+            if all(series_labels.get(k) == v for k, v in labels.items()):
+                merged = [a + b for a, b in zip(merged, counts)]
+                total += count
+        if total < max(min_count, 1):
+            return None
+        return self.quantile(q, merged, total)
+
+    def percentiles(self, group_by: Sequence[str] = ()) -> List[Dict]:
+        """p50/p95/p99, mean and count per label set, optionally merged by ``group_by`` labels."""
+        merged: Dict[LabelValues, List] = {}
+        for labels, counts, total, count in self.series():
+            key = tuple(labels[name] for name in group_by) if group_by else tuple(labels.values())
+            entry = merged.setdefault(key, [[0] * len(counts), 0.0, 0,
+                                            {n: labels[n] for n in (group_by or self.label_names)}])
+            entry[0] = [a + b for a, b in zip(entry[0], counts)]
+            entry[1] += total
+            entry[2] += count
+        return [
+            {
+                **labels,
+                "count": count,
+                "mean": round(total / count, 4),
+                "p50": _round(self.quantile(0.50, counts, count)),
+                "p95": _round(self.quantile(0.95, counts, count)),
+                "p99": _round(self.quantile(0.99, counts, count))
+            }
+            for counts, total, count, labels in merged.values()
+        ]
+
+    def render(self) -> List[str]:
+        """Prometheus text exposition lines for this histogram."""
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, counts, total, count in self.series():
+            label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+            prefix = f"{label_text}," if label_text else ""
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{label_text}}} {total}")
+            lines.append(f"{self.name}_count{{{label_text}}} {count}")
+        return lines
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 4) if value is not None else None
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render_sample(name: str, metric_type: str, help_text: str,
+                  samples: Iterable[Tuple[Dict[str, str], float]]) -> List[str]:
+    """Exposition lines for a counter or gauge read at scrape time."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+    for labels, value in samples:
+        label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+        lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+    return lines
+
+
+def render_prometheus(histograms: Iterable[Histogram], extra_lines: Iterable[str] = ()) -> str:
+    """Full /metrics body."""
+    lines: List[str] = []
+    for histogram in histograms:
+        lines.extend(histogram.render())
+    lines.extend(extra_lines)
+    return "\n".join(lines) + "\n"
+
+
+# Latency of every generation served by /generate, /generate/stream and /generate-all
+generation_latency = Histogram(
+    "rikstoto_generation_seconds",
+    "Generation latency by model, provider path, endpoint and outcome",
+    ("model", "provider", "path", "endpoint", "outcome")
+)
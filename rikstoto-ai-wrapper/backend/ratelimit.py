@@ -0,0 +1,265 @@
+"""
+Quota-aware pacing and 429 handling for Azure OpenAI deployments.
+
+Azure OpenAI enforces a requests-per-minute (RPM) and a tokens-per-minute
+(TPM) quota per deployment, checked over short windows. Going over it
+returns 429 with a Retry-After header. Instead of treating that as a hard
+failure, each deployment gets a pair of token buckets:
+
+    requests: refilled at RPM / 60 per second
+    tokens:   refilled at TPM / 60 per second, charged with the estimated
+              prompt tokens plus max_tokens and settled with the real usage
+
+Calls queue (FIFO) until both buckets have room, so bursts are paced
+instead of rejected. A 429 pauses the deployment for the Retry-After the
+service asked for (or a jittered backoff) before the call is retried.
+Waiting never runs past the request's deadline: if the wait would, the
+call gives up with a rate-limit error instead.
+
+Deployments without a configured quota are not paced, but still honour
+Retry-After on 429.
+
+Configuration via environment variables:
+    AZURE_OPENAI_QUOTAS: Per-deployment quotas as "deployment=rpm:tpm", e.g.
+        "gpt-4o=300:50000,o3-mini=100:100000"
+    RATE_LIMIT_RETRIES: Retries after a 429 or transient error (default: 3)
+    RATE_LIMIT_BACKOFF: Base backoff in seconds when no Retry-After is given (default: 1.0)
+    RATE_LIMIT_MAX_BACKOFF: Backoff cap in seconds (default: 20)
+"""
+
+import asyncio
+import email.utils
+import os
+import random
+import time
+from typing import Any, Callable, Dict, Mapping, Optional, Tuple
+
+from envconfig import parse_pairs
+
+# Azure checks quota over 10 second windows, so a full minute of quota
+# must not go out as one burst
+BURST_SECONDS = 10
+
+
+class RateLimitTimeout(Exception):
+    """Raised when waiting for quota would run past the request deadline."""
+
+    def __init__(self, deployment: str, wait: float):
+        super().__init__(f"Rate limit for {deployment}: next slot in {wait:.1f}s, after the deadline")
+        self.deployment = deployment
+        self.wait = wait
+
+
+def parse_retry_after(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    """Seconds to wait from retry-after-ms, x-ms-retry-after-ms or Retry-After headers."""
+    if not headers:
+        return None
+    for name in ("retry-after-ms", "x-ms-retry-after-ms"):
+        value = headers.get(name)
+        if value:
+            try:
+                return max(0.0, float(value) / 1000)
+            except ValueError:
+                pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        parsed = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        # Malformed header: fall back to the caller's own backoff
+        return None
+    return max(0.0, parsed.timestamp() - time.time())
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 20.0) -> float:
+    """Full-jitter exponential backoff for retry ``attempt`` (0-based)."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class TokenBucket:
+    """Bucket refilled continuously at ``per_minute`` / 60 per second.
+
+    Args:
+        per_minute: Quota per minute
+        clock: Time source (for tests)
+    """
+
+    def __init__(self, per_minute: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = per_minute / 60
+        self.capacity = max(1.0, per_minute * BURST_SECONDS / 60)
+        self._clock = clock
+        self.available = self.capacity
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self.available = min(self.capacity, self.available + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def time_until(self, amount: float) -> float:
+        """Seconds until ``amount`` (capped at the capacity) is available."""
+        self._refill()
+        deficit = min(amount, self.capacity) - self.available
+        return max(0.0, deficit / self.rate)
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.available -= min(amount, self.capacity)
+
+    def adjust(self, amount: float) -> None:
+        """Give back (positive) or charge (negative) tokens after the fact."""
+        self._refill()
+        self.available = min(self.capacity, self.available + amount)
+
+
+class DeploymentRateLimiter:
+    """Request and token pacing for one deployment.
+
+    Args:
+        deployment: Deployment name
+        rpm: Requests per minute quota (None to not pace requests)
+        tpm: Tokens per minute quota (None to not pace tokens)
+        clock: Time source (for tests)
+    """
+
+    def __init__(self, deployment: str, rpm: Optional[float] = None, tpm: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.deployment = deployment
+        self._clock = clock
+        self._requests = TokenBucket(rpm, clock) if rpm else None
+        self._tokens = TokenBucket(tpm, clock) if tpm else None
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+        self._waiting = 0
+        # Metrics
+        self.throttled = 0
+        self.paced = 0
+        self.wait_total = 0.0
+
+    def _time_until_ready(self, tokens: int) -> float:
+        wait = self._paused_until - self._clock()
+        if self._requests:
+            wait = max(wait, self._requests.time_until(1))
+        if self._tokens:
+            wait = max(wait, self._tokens.time_until(tokens))
+        return max(0.0, wait)
+
+    async def acquire(self, tokens: int, max_wait: Optional[float] = None) -> float:
+        """Wait in line until the quota has room for one request of ``tokens`` tokens.
+
+        Args:
+            tokens: Estimated tokens the request will use (prompt + max_tokens)
+            max_wait: Longest the caller can wait (remaining deadline); None for no limit
+
+        Returns:
+            Seconds waited
+
+        Raises:
+            RateLimitTimeout: If the wait would exceed ``max_wait``
+        """
+        started = self._clock()
+        self._waiting += 1
+        try:
+            async with self._lock:
+                while True:
+                    wait = self._time_until_ready(tokens)
+                    if wait <= 0:
+                        break
+                    if max_wait is not None and self._clock() - started + wait > max_wait:
+                        raise RateLimitTimeout(self.deployment, wait)
+                    await asyncio.sleep(wait)
+                if self._requests:
+                    self._requests.take(1)
+                if self._tokens:
+                    self._tokens.take(tokens)
+        finally:
+            self._waiting -= 1
+        waited = self._clock() - started
+        if waited > 0.001:
+            self.paced += 1
+            self.wait_total += waited
+        return waited
+
+    def pause(self, seconds: float) -> None:
+        """Hold every call to this deployment for ``seconds`` (after a 429)."""
+        self.throttled += 1
+        self._paused_until = max(self._paused_until, self._clock() + seconds)
+
+    def settle(self, estimated: int, actual: Optional[int]) -> None:
+        """Correct the token bucket with the usage the service reported."""
+        if self._tokens and actual is not None:
+            self._tokens.adjust(estimated - actual)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rpm": round(self._requests.rate * 60) if self._requests else None,
+            "tpm": round(self._tokens.rate * 60) if self._tokens else None,
+            "requests_available": round(self._requests.available, 1) if self._requests else None,
+            "tokens_available": round(self._tokens.available) if self._tokens else None,
+            "paused_for_seconds": round(max(0.0, self._paused_until - self._clock()), 1),
+            "waiting": self._waiting,
+            "paced": self.paced,
+            "throttled": self.throttled,
+            "wait_seconds_total": round(self.wait_total, 2)
+        }
+
+
+def parse_quotas(spec: str) -> Dict[str, Tuple[float, float]]:
+    """Parse "deployment=rpm:tpm,..." into {deployment: (rpm, tpm)}."""
+    quotas = {}
+    for deployment, limits in parse_pairs(spec).items():
+        if ":" in limits:
+            rpm, tpm = limits.split(":", 1)
+            quotas[deployment] = (float(rpm), float(tpm))
+    return quotas
+
+
+class RateLimiterRegistry:
+    """One rate limiter per deployment, plus the retry policy for 429s.
+
+    Args:
+        quotas: {deployment: (rpm, tpm)}
+        retries: Retries after a 429 or transient error
+        backoff: Base backoff in seconds when no Retry-After is given
+        max_backoff: Backoff cap in seconds
+    """
+
+    def __init__(self, quotas: Optional[Dict[str, Tuple[float, float]]] = None, retries: int = 3,
+                 backoff: float = 1.0, max_backoff: float = 20.0):
+        self.quotas = quotas or {}
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._limiters: Dict[str, DeploymentRateLimiter] = {}
+
+    @classmethod
+    def from_env(cls) -> "RateLimiterRegistry":
+        return cls(
+            quotas=parse_quotas(os.getenv("AZURE_OPENAI_QUOTAS", "")),
+            retries=int(os.getenv("RATE_LIMIT_RETRIES", "3")),
+            backoff=float(os.getenv("RATE_LIMIT_BACKOFF", "1.0")),
+            max_backoff=float(os.getenv("RATE_LIMIT_MAX_BACKOFF", "20"))
+        )
+
+    def get(self, deployment: str) -> DeploymentRateLimiter:
+        limiter = self._limiters.get(deployment)
+        if limiter is None:
+            rpm, tpm = self.quotas.get(deployment, (None, None))
+            limiter = self._limiters[deployment] = DeploymentRateLimiter(deployment, rpm, tpm)
+        return limiter
+
+    def retry_delay(self, attempt: int, headers: Optional[Mapping[str, str]] = None) -> float:
+        """Retry-After from the response if given, else jittered backoff."""
+        retry_after = parse_retry_after(headers)
+        if retry_after is not None:
+            # A little jitter so paused callers don't all retry in the same instant
+            return retry_after + random.uniform(0, 0.25)
+        return backoff_delay(attempt, self.backoff, self.max_backoff)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {deployment: limiter.stats() for deployment, limiter in self._limiters.items()}
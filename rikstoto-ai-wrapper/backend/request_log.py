@@ -0,0 +1,221 @@
+"""
+Structured, sampled request logging for the Rikstoto AI backend.
+
+Each generation produces one JSON line (model, provider, status, duration,
+cache and single-flight outcome) instead of a dozen ``print`` calls. Code
+deeper in the call stack adds fields to the current request's record with
+``log_fields``; the record is found through a context variable, so
+nothing has to be threaded through function signatures.
+
+Prompt and response diagnostics (race count, JSON field checks, token
+counts, truncation checks) scan the whole prompt and are only collected
+for a sampled fraction of requests. When a request is not sampled, or INFO
+is disabled, the scans are skipped entirely. Prompt and response previews
+are only included at DEBUG level.
+
+Lines are handed to a background thread through a bounded queue, so JSON
+encoding and writing to stdout never block the event loop. If the queue is
+full, lines are dropped and counted rather than waited on.
+
+Configuration via environment variables:
+    LOG_LEVEL: DEBUG, INFO, WARNING or ERROR (default: INFO)
+    LOG_SAMPLE_RATE: Fraction of requests with diagnostics, 0.0-1.0 (default: 1.0)
+    LOG_QUEUE_SIZE: Max lines waiting to be written (default: 10000)
+"""
+
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, TextIO
+
+LOGGER_NAME = "rikstoto"
+
+
+class JSONLineFormatter(logging.Formatter):
+    """Format a record whose message is a dict as one JSON line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = record.msg if isinstance(record.msg, dict) else {"message": record.getMessage()}
+        return json.dumps({
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            **payload
+        }, default=str, ensure_ascii=False)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that drops lines instead of blocking when the queue is full."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Formatting happens in the listener thread, not on the event loop
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RequestLog:
+    """Fields collected for one request, written as a single line by ``emit``.
+
+    Args:
+        logger: Logger the line is written to
+        event: Name of the request type, e.g. "generate"
+        diagnostics: Whether prompt/response diagnostics are collected
+        previews: Whether prompt/response previews are included
+    """
+
+    __slots__ = ("logger", "fields", "diagnostics", "previews", "start", "emitted")
+
+    def __init__(self, logger: "StructuredLogger", event: str, diagnostics: bool, previews: bool,
+                 **fields: Any):
+        self.logger = logger
+        self.fields: Dict[str, Any] = {"event": event, **fields}
+        self.diagnostics = diagnostics
+        self.previews = previews
+        self.start = time.perf_counter()
+        self.emitted = False
+
+    def set(self, **fields: Any) -> None:
+        """Add fields to the line; ignored once it has been written.
+
+        Tasks that outlive the request (shared flights, hedges) keep a
+        reference to its record and may still call this afterwards.
+        """
+        if not self.emitted:
+            self.fields.update(fields)
+
+    def emit(self, level: int = logging.INFO, **fields: Any) -> None:
+        """Write the line once, with the duration since the request started."""
+        if self.emitted:
+            return
+        self.emitted = True
+        self.fields.update(fields)
+        self.fields["duration_ms"] = round((time.perf_counter() - self.start) * 1000, 1)
+        # Snapshot: the line is encoded later, on the listener thread
+        self.logger.log(level, dict(self.fields))
+        if _current.get() is self:
+            _current.set(None)
+
+
+_current: "contextvars.ContextVar[Optional[RequestLog]]" = contextvars.ContextVar("request_log", default=None)
+
+
+class StructuredLogger:
+    """JSON line logger behind a queue, with per-request sampling of diagnostics.
+
+    Args:
+        name: Logger name
+        level: Minimum level written
+        sample_rate: Fraction of requests that collect diagnostics
+        queue_size: Max lines waiting to be written
+        stream: Where lines are written (default: stdout)
+    """
+
+    def __init__(self, name: str = LOGGER_NAME, level: str = "INFO", sample_rate: float = 1.0,
+                 queue_size: int = 10000, stream: Optional[TextIO] = None):
+        self.sample_rate = max(0.0, min(1.0, sample_rate))
+        self._logger = logging.getLogger(name)
+        self._logger.setLevel(getattr(logging, level.upper(), logging.INFO))
+        self._logger.propagate = False
+        self._handler = DroppingQueueHandler(queue.Queue(maxsize=queue_size))
+        self._logger.handlers = [self._handler]
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(JSONLineFormatter())
+        self._listener = logging.handlers.QueueListener(self._handler.queue, output)
+        self._running = False
+        self.sampled = 0
+        self.unsampled = 0
+
+    @classmethod
+    def from_env(cls) -> "StructuredLogger":
+        return cls(
+            level=os.getenv("LOG_LEVEL", "INFO"),
+            sample_rate=float(os.getenv("LOG_SAMPLE_RATE", "1.0")),
+            queue_size=int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+        )
+
+    def start(self) -> None:
+        """Start the writer thread."""
+        if not self._running:
+            self._listener.start()
+            self._running = True
+
+    def stop(self) -> None:
+        """Write out queued lines and stop the writer thread."""
+        if self._running:
+            self._listener.stop()
+            self._running = False
+
+    def is_enabled_for(self, level: int) -> bool:
+        return self._logger.isEnabledFor(level)
+
+    def log(self, level: int, fields: Dict[str, Any]) -> None:
+        if self._logger.isEnabledFor(level):
+            self._logger.log(level, fields)
+
+    def event(self, event: str, level: int = logging.INFO, **fields: Any) -> None:
+        """Write a one-off line that isn't tied to a request."""
+        self.log(level, {"event": event, **fields})
+
+    def begin(self, event: str, **fields: Any) -> RequestLog:
+        """Start the record for a request and make it the current one.
+
+        Diagnostics are sampled here, once per request.
+        """
+        diagnostics = self.is_enabled_for(logging.INFO) and random.random() < self.sample_rate
+        if diagnostics:
+            self.sampled += 1
+        else:
+            self.unsampled += 1
+        record = RequestLog(self, event, diagnostics, diagnostics and self.is_enabled_for(logging.DEBUG),
+                            **fields)
+        _current.set(record)
+        return record
+
+    def stats(self) -> Dict[str, Any]:
+        """Sampling counts and queue usage."""
+        return {
+            "level": logging.getLevelName(self._logger.level),
+            "sample_rate": self.sample_rate,
+            "sampled": self.sampled,
+            "unsampled": self.unsampled,
+            "queued": self._handler.queue.qsize(),
+            "dropped": self._handler.dropped
+        }
+
+
+def current_request_log() -> Optional[RequestLog]:
+    """Record of the request being handled, if any."""
+    return _current.get()
+
+
+def log_fields(**fields: Any) -> None:
+    """Add fields to the current request's line (no-op outside a request)."""
+    record = _current.get()
+    if record is not None:
+        record.set(**fields)
+
+
+def log_event(event: str, level: int = logging.INFO, **fields: Any) -> None:
+    """Write a one-off line from modules that don't hold the StructuredLogger."""
+    logging.getLogger(LOGGER_NAME).log(level, {"event": event, **fields})
+
+
+def diagnostics_enabled() -> bool:
+    """Whether the current request collects prompt/response diagnostics."""
+    record = _current.get()
+    return record is not None and record.diagnostics
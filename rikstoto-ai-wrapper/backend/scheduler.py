@@ -0,0 +1,233 @@
+"""
+Process-wide generation scheduler for the Rikstoto AI backend.
+
+Every upstream generation goes through one scheduler that bounds how many
+calls run at once, both globally and per provider. Waiting calls are queued
+per originating request and dispatched round-robin across requests, so one
+large /generate-all cannot starve a concurrent /generate.
+
+A provider's cap can be lowered at runtime with ``set_adaptive_limit``
+(the AIMD limiter in breakers.py does this when a provider degrades); the
+effective cap is the lower of the configured and the adaptive limit.
+
+Limits can be tuned with environment variables:
+    SCHEDULER_MAX_CONCURRENCY: Max generations in flight per worker (default: 64)
+    SCHEDULER_PROVIDER_LIMIT: Default max in flight per provider (default: 16)
+    SCHEDULER_PROVIDER_LIMITS: Per-provider overrides, e.g. "azure_openai=32,mistral=8"
+"""
+
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Optional
+
+from envconfig import parse_pairs
+
+
+def parse_provider_limits(spec: str) -> Dict[str, int]:
+    """Parse "provider=limit,provider=limit" into a dictionary."""
+    return {provider: int(limit) for provider, limit in parse_pairs(spec).items()}
+
+
+class _Waiter:
+    """A queued generation waiting for a slot."""
+
+    __slots__ = ("provider", "future")
+
+    def __init__(self, provider: str, future: asyncio.Future):
+        self.provider = provider
+        self.future = future
+
+
+class GenerationScheduler:
+    """Bounded, fair scheduler for upstream model calls.
+
+    Args:
+        max_concurrency: Global cap on generations in flight
+        provider_limits: Per-provider caps, overriding ``default_provider_limit``
+        default_provider_limit: Cap for providers without an explicit limit
+    """
+
+    def __init__(self, max_concurrency: int = 64, provider_limits: Optional[Dict[str, int]] = None,
+                 default_provider_limit: int = 16):
+        self.max_concurrency = max_concurrency
+        self.provider_limits = provider_limits or {}
+        self.default_provider_limit = default_provider_limit
+        self._adaptive_limits: Dict[str, int] = {}
+        self._queues: "OrderedDict[str, Deque[_Waiter]]" = OrderedDict()
+        self._running = 0
+        self._running_by_provider: Dict[str, int] = {}
+        # Metrics
+        self._submitted = 0
+        self._started = 0
+        self._completed = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._wait_last = 0.0
+
+    @classmethod
+    def from_env(cls) -> "GenerationScheduler":
+        """Build a scheduler from SCHEDULER_* environment variables."""
+        return cls(
+            max_concurrency=int(os.getenv("SCHEDULER_MAX_CONCURRENCY", "64")),
+            provider_limits=parse_provider_limits(os.getenv("SCHEDULER_PROVIDER_LIMITS", "")),
+            default_provider_limit=int(os.getenv("SCHEDULER_PROVIDER_LIMIT", "16"))
+        )
+
+    def provider_limit(self, provider: str) -> int:
+        """Concurrency cap for a provider (configured, lowered by any adaptive limit)."""
+        limit = self.provider_limits.get(provider, self.default_provider_limit)
+        return min(limit, self._adaptive_limits.get(provider, limit))
+
+    def set_adaptive_limit(self, provider: str, limit: int) -> None:
+        """Set a provider's adaptive cap; queued calls start at once if it went up."""
+        self._adaptive_limits[provider] = max(1, limit)
+        self._dispatch()
+
+    def _has_capacity(self, provider: str) -> bool:
+        return (self._running < self.max_concurrency
+                and self._running_by_provider.get(provider, 0) < self.provider_limit(provider))
+
+    def _acquire(self, provider: str) -> None:
+        self._running += 1
+        self._running_by_provider[provider] = self._running_by_provider.get(provider, 0) + 1
+
+    def _release(self, provider: str) -> None:
+        self._running -= 1
+        self._running_by_provider[provider] -= 1
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Grant free slots to queued waiters, round-robin across requests."""
+        progress = True
+        while progress and self._running < self.max_concurrency and self._queues:
+            progress = False
+            for request_id in list(self._queues.keys()):
+                queue = self._queues[request_id]
+                # Drop waiters cancelled before their own handler ran; they
+                # must not be granted a slot nobody will release
+                for dead in [w for w in queue if w.future.done()]:
+                    queue.remove(dead)
+                if not queue:
+                    del self._queues[request_id]
+                    continue
+                # Each request's calls start in order of submission per provider,
+                # but a request blocked on one provider doesn't hold up its others
+                waiter = next((w for w in queue if self._has_capacity(w.provider)), None)
+                if waiter is None:
+                    continue
+                queue.remove(waiter)
+                # Move this request to the back so others get the next slot
+                self._queues.move_to_end(request_id)
+                if not queue:
+                    del self._queues[request_id]
+                self._acquire(waiter.provider)
+                waiter.future.set_result(None)
+                progress = True
+                break
+
+    @asynccontextmanager
+    async def slot(self, request_id: str, provider: str) -> AsyncIterator[None]:
+        """Hold a global and a per-provider slot for the duration of the block.
+
+        Used directly for streaming generations, where the slot must stay
+        taken while the response is being read.
+
+        Args:
+            request_id: Identifier of the originating HTTP request (fairness key)
+            provider: Provider the call goes to (per-provider cap key)
+        """
+        self._submitted += 1
+        enqueued_at = time.perf_counter()
+        if not self._queues and self._has_capacity(provider):
+            self._acquire(provider)
+        else:
+            waiter = _Waiter(provider, asyncio.get_running_loop().create_future())
+            self._queues.setdefault(request_id, deque()).append(waiter)
+            self._dispatch()
+            try:
+                await waiter.future
+            except asyncio.CancelledError:
+                if waiter.future.done() and not waiter.future.cancelled():
+                    # Slot was granted just as we were cancelled - hand it on
+                    self._release(provider)
+                else:
+                    queue = self._queues.get(request_id)
+                    if queue and waiter in queue:
+                        queue.remove(waiter)
+                        if not queue:
+                            del self._queues[request_id]
+                raise
+
+        wait = time.perf_counter() - enqueued_at
+        self._started += 1
+        self._wait_total += wait
+        self._wait_max = max(self._wait_max, wait)
+        self._wait_last = wait
+        try:
+            yield
+        finally:
+            self._completed += 1
+            self._release(provider)
+
+    def has_free_slot(self, provider: str) -> bool:
+        """Whether a call to ``provider`` could start now without queueing."""
+        return not self._queues and self._has_capacity(provider)
+
+    @asynccontextmanager
+    async def try_slot(self, provider: str) -> AsyncIterator[bool]:
+        """Hold a slot for the block only if one is free right now; never queues.
+
+        Used for hedged duplicates, which are only worth sending when the
+        provider has room. Yields whether the slot was taken.
+        """
+        taken = self.has_free_slot(provider)
+        if taken:
+            self._acquire(provider)
+            self._started += 1
+        try:
+            yield taken
+        finally:
+            if taken:
+                self._completed += 1
+                self._release(provider)
+
+    async def run(self, request_id: str, provider: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        """Run ``call`` once a global and a per-provider slot are free.
+
+        Args:
+            request_id: Identifier of the originating HTTP request (fairness key)
+            provider: Provider the call goes to (per-provider cap key)
+            call: Zero-argument coroutine function performing the upstream call
+
+        Returns:
+            Whatever ``call`` returns
+        """
+        async with self.slot(request_id, provider):
+            return await call()
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, running counts and queue wait times."""
+        depth_by_provider: Dict[str, int] = {}
+        for queue in self._queues.values():
+            for waiter in queue:
+                depth_by_provider[waiter.provider] = depth_by_provider.get(waiter.provider, 0) + 1
+        return {
+            "max_concurrency": self.max_concurrency,
+            "running": self._running,
+            "running_by_provider": {p: n for p, n in self._running_by_provider.items() if n},
+            "adaptive_limits": {p: self.provider_limit(p) for p in self._adaptive_limits},
+            "queue_depth": sum(depth_by_provider.values()),
+            "queue_depth_by_provider": depth_by_provider,
+            "queued_requests": len(self._queues),
+            "submitted": self._submitted,
+            "started": self._started,
+            "completed": self._completed,
+            "wait_seconds": {
+                "avg": self._wait_total / self._started if self._started else 0.0,
+                "max": self._wait_max,
+                "last": self._wait_last
+            }
+        }
@@ -0,0 +1,85 @@
+"""
+Single-flight request coalescing for the Rikstoto AI backend.
+
+When several requests ask for the same generation at the same time (e.g.
+many users opening the same Stalltips coupon), only the first one calls
+the model. The others wait on that call and receive the same result, so
+N concurrent cache misses cost one upstream call instead of N.
+
+The shared call runs as its own task: if the request that started it is
+cancelled (client disconnect, timeout), the call keeps going for the
+requests still waiting on it. Once the last waiter is gone the call is
+cancelled too, so it gives its scheduler slot back instead of running on
+for nobody.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+
+class SingleFlight:
+    """Deduplicate concurrent calls that share a key."""
+
+    def __init__(self):
+        self._flights: Dict[str, asyncio.Task] = {}
+        self._waiters: Dict[asyncio.Task, int] = {}
+        # Metrics
+        self.calls = 0
+        self.collapsed = 0
+        self.collapsed_by_label: Dict[str, int] = {}
+
+    async def do(self, key: str, call: Callable[[], Awaitable[Any]],
+                 label: Optional[str] = None) -> Tuple[Any, bool]:
+        """Run ``call`` once per key among concurrent callers.
+
+        Args:
+            key: Identity of the call (e.g. the response cache key)
+            call: Zero-argument coroutine function performing the call
+            label: Optional name the collapsed count is reported under (e.g. model)
+
+        Returns:
+            Tuple of (result, shared); shared is True when this caller joined
+            a call started by another request. Exceptions raised by ``call``
+            propagate to every caller.
+        """
+        flight = self._flights.get(key)
+        shared = flight is not None
+        if shared:
+            self.collapsed += 1
+            if label:
+                self.collapsed_by_label[label] = self.collapsed_by_label.get(label, 0) + 1
+        else:
+            self.calls += 1
+            flight = asyncio.ensure_future(call())
+            self._flights[key] = flight
+            self._waiters[flight] = 0
+            flight.add_done_callback(lambda done: self._finish(key, done))
+        self._waiters[flight] += 1
+        try:
+            return await asyncio.shield(flight), shared
+        except asyncio.CancelledError:
+            if self._waiters.get(flight) == 1 and not flight.done():
+                # Last waiter gone: stop the call and free its key
+                flight.cancel()
+                self._flights.pop(key, None)
+            raise
+        finally:
+            if flight in self._waiters:
+                self._waiters[flight] -= 1
+
+    def _finish(self, key: str, flight: asyncio.Task) -> None:
+        self._waiters.pop(flight, None)
+        if self._flights.get(key) is flight:
+            self._flights.pop(key)
+        if not flight.cancelled():
+            # Mark the exception as retrieved in case every waiter was cancelled
+            flight.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        """Upstream calls made, calls collapsed into them, and flights in progress."""
+        return {
+            "in_flight": len(self._flights),
+            "calls": self.calls,
+            "collapsed": self.collapsed,
+            "collapsed_by_model": dict(self.collapsed_by_label)
+        }
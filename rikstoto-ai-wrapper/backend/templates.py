@@ -0,0 +1,93 @@
+"""
+Compiled prompt templates for the Rikstoto AI backend.
+
+System prompts are several kilobytes of Norwegian text with a ``{{json}}``
+placeholder. Instead of scanning the whole prompt with ``str.replace`` on
+every generation, each template is compiled once into literal segments and
+named slots, and rendering is a single join.
+
+Placeholders:
+    {{name}}  Any identifier, e.g. {{json}}, {{model}}, {{user_prompt}}
+    {json}    Legacy single-brace form of {{json}}
+
+Slots without a value are rendered as the original placeholder text, so a
+template can be rendered before all data is known. Values are inserted
+verbatim and never re-scanned, so JSON that happens to contain
+``{json}`` is left alone.
+"""
+
+import re
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+PLACEHOLDER_PATTERN = re.compile(r"\{\{\s*([A-Za-z_][A-Za-z0-9_]*)\s*\}\}|\{(json)\}")
+
+# Max compiled templates kept (custom prompts from requests included)
+TEMPLATE_CACHE_SIZE = 256
+
+
+class CompiledTemplate:
+    """A prompt split into literal segments and named slots.
+
+    Args:
+        text: Template source
+    """
+
+    __slots__ = ("text", "slots", "_parts", "_slot_positions")
+
+    def __init__(self, text: str):
+        self.text = text
+        parts: List[str] = []
+        slot_positions: List[Tuple[int, str]] = []
+        position = 0
+        for match in PLACEHOLDER_PATTERN.finditer(text):
+            parts.append(text[position:match.start()])
+            slot_positions.append((len(parts), match.group(1) or match.group(2)))
+            # Default to the placeholder itself until a value is given
+            parts.append(match.group(0))
+            position = match.end()
+        parts.append(text[position:])
+        self._parts = parts
+        self._slot_positions = slot_positions
+        self.slots = tuple(dict.fromkeys(name for _, name in slot_positions))
+
+    def render(self, **values: str) -> str:
+        """Fill the slots and join the segments."""
+        if not self._slot_positions:
+            return self.text
+        parts = self._parts.copy()
+        for index, name in self._slot_positions:
+            value = values.get(name)
+            if value is not None:
+                parts[index] = value
+        return "".join(parts)
+
+
+_compiled: "OrderedDict[str, CompiledTemplate]" = OrderedDict()
+
+
+def compile_template(text: str) -> CompiledTemplate:
+    """Return the compiled form of a template, compiling it on first use.
+
+    Compiled templates are cached by content (least recently used ones
+    are dropped beyond ``TEMPLATE_CACHE_SIZE``).
+    """
+    template = _compiled.get(text)
+    if template is None:
+        template = CompiledTemplate(text)
+        _compiled[text] = template
+        if len(_compiled) > TEMPLATE_CACHE_SIZE:
+            _compiled.popitem(last=False)
+    else:
+        _compiled.move_to_end(text)
+    return template
+
+
+def render_prompt(text: str, **values: str) -> str:
+    """Render a template string, e.g. ``render_prompt(system_prompt, json=json_str)``."""
+    return compile_template(text).render(**values)
+
+
+def template_cache_stats() -> Dict[str, int]:
+    """Number of compiled templates held in the cache."""
+    return {"compiled_templates": len(_compiled), "max_templates": TEMPLATE_CACHE_SIZE}
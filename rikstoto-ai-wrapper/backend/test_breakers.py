@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Check the circuit breaker and adaptive concurrency limit
+
+Drives CircuitBreaker through closed -> open -> half-open -> closed (and
+back to open on a failed probe) with a fake clock, checks that AIMDLimiter
+halves on failures and creeps back up on fast successes, and that 4xx
+errors other than 429 are classified as neutral. Needs no API keys or
+running server.
+
+Usage: python test_breakers.py
+"""
+
+import sys
+
+from breakers import CLOSED, HALF_OPEN, OPEN, AIMDLimiter, CircuitBreaker, is_neutral_error
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def test_breaker_cycle():
+    """Open on failures, fail fast, probe after open_seconds, close on success"""
+    clock = FakeClock()
+    breaker = CircuitBreaker(window=10, min_calls=4, failure_rate=0.5, open_seconds=30, clock=clock)
+
+    for success in (True, False, True):
+        assert breaker.allow()
+        breaker.record(success, slow=False, error=None if success else "HTTP 500")
+    assert breaker.state == CLOSED, "Opened before min_calls"
+
+    assert breaker.allow()
+    breaker.record(False, slow=False, error="HTTP 502")
+    assert breaker.state == OPEN, "Did not open at the failure rate"
+    assert breaker.last_error == "HTTP 502"
+    assert not breaker.allow(), "Open breaker let a call through"
+    assert breaker.rejected == 1
+    assert breaker.retry_after() == 30
+
+    clock.now = 29.9
+    assert breaker.state == OPEN, "Probed before open_seconds"
+    clock.now = 30
+    assert breaker.state == HALF_OPEN, "Did not half-open after open_seconds"
+    assert breaker.allow(), "Half-open breaker refused the probe"
+    assert not breaker.allow(), "Half-open breaker allowed more than one probe"
+
+    breaker.record(True, slow=False)
+    assert breaker.state == CLOSED, "Successful probe did not close the breaker"
+    assert breaker.stats()["recent_calls"] == 0, "Window was not reset on close"
+    print("✅ closed -> open -> half-open -> closed")
+
+
+def test_breaker_failed_probe_reopens():
+    """A failed or slow probe opens the breaker again; a released one frees the permit"""
+    clock = FakeClock()
+    breaker = CircuitBreaker(window=4, min_calls=2, failure_rate=0.5, open_seconds=10, clock=clock)
+    for _ in range(2):
+        breaker.allow()
+        breaker.record(False, slow=False)
+    assert breaker.state == OPEN
+
+    clock.now = 10
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.allow(), "Released probe permit was not given back"
+
+    breaker.record(True, slow=True)
+    assert breaker.state == OPEN, "Slow probe did not reopen the breaker"
+    assert breaker.times_opened == 2
+    print("✅ failed probe reopens, released probe frees its permit")
+
+
+def test_breaker_slow_calls():
+    """Mostly slow calls open the breaker even when they succeed"""
+    breaker = CircuitBreaker(window=5, min_calls=5, slow_call_rate=0.8, clock=FakeClock())
+    for slow in (True, True, True, True, False):
+        breaker.allow()
+        breaker.record(True, slow=slow)
+    assert breaker.state == OPEN, "Slow calls did not open the breaker"
+    print("✅ slow calls open the breaker")
+
+
+def test_aimd_limiter():
+    """Halve on failure down to min_limit, about +1 per round of fast successes up to max_limit"""
+    limiter = AIMDLimiter(initial=16, min_limit=2, max_limit=16)
+    assert limiter.record(False, slow=False) and limiter.limit == 8
+    assert limiter.record(True, slow=True) and limiter.limit == 4, "Slow call did not halve the limit"
+    limiter.record(False, slow=False)
+    assert not limiter.record(False, slow=False), "Limit went below min_limit"
+    assert limiter.limit == 2
+
+    # Each success adds 1/limit, so +1 takes about one round of calls
+    changed = [limiter.record(True, slow=False) for _ in range(3)]
+    assert limiter.limit == 3 and changed == [False, False, True], f"Expected 3 after 3 successes, got {limiter.limit}"
+    for _ in range(500):
+        limiter.record(True, slow=False)
+    assert limiter.limit == 16, f"Limit did not stop at max_limit: {limiter.limit}"
+    print("✅ AIMD limiter")
+
+
+def test_neutral_errors():
+    """4xx other than 429 is neutral; 429, 5xx and errors without a status are not"""
+    assert is_neutral_error(StatusError(404)) and is_neutral_error(StatusError(401))
+    assert not is_neutral_error(StatusError(429))
+    assert not is_neutral_error(StatusError(503))
+    assert not is_neutral_error(TimeoutError())
+    print("✅ neutral error classification")
+
+
+if __name__ == "__main__":
+    print("🔌 Circuit breaker test\n")
+    try:
+        test_breaker_cycle()
+        test_breaker_failed_probe_reopens()
+        test_breaker_slow_calls()
+        test_aimd_limiter()
+        test_neutral_errors()
+    except AssertionError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
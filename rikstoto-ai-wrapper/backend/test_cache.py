@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Check the cache backends against one shared set of expectations
+
+Runs the memory, SQLite and Redis backends through the same get/set,
+overwrite, delete, clear and TTL checks, plus LRU eviction for the two
+backends that enforce their own budgets (Redis leaves that to the
+server's maxmemory policy). Unreadable entries in the shared SQLite and
+Redis stores must be dropped and treated as misses. The Redis backend talks to the local
+stand-in from benchmarks/redis_stub.py through the real redis client,
+so it is skipped when the redis package is not installed. Needs no API
+keys or running server.
+
+Usage: python test_cache.py
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from cache import REDIS_AVAILABLE, LRUTTLCache, RedisCache, SQLiteCache
+from benchmarks.redis_stub import start_redis_stub
+
+TTL_SECONDS = 0.3
+
+
+async def check_basics(cache):
+    assert await cache.get("missing") is None, "Missing key returned a value"
+
+    await cache.set("coupon", {"product": "V75", "legs": [1, 2, 3]})
+    hit = await cache.get("coupon")
+    assert hit is not None, "Stored value was not returned"
+    value, age = hit
+    assert value == {"product": "V75", "legs": [1, 2, 3]}, f"Stored value changed: {value!r}"
+    assert 0 <= age < TTL_SECONDS, f"Fresh entry reported age {age}"
+
+    await cache.set("coupon", "replaced")
+    assert (await cache.get("coupon"))[0] == "replaced", "Overwrite was not stored"
+
+    await cache.delete("coupon")
+    assert await cache.get("coupon") is None, "Deleted key still returned"
+
+    await cache.set("a", 1)
+    await cache.set("b", 2)
+    await cache.clear()
+    assert await cache.get("a") is None and await cache.get("b") is None, "Clear left entries behind"
+
+    await cache.set("short-lived", "value")
+    await asyncio.sleep(TTL_SECONDS + 0.1)
+    assert await cache.get("short-lived") is None, "Entry outlived its TTL"
+
+    stats = await cache.stats()
+    assert stats["hits"] == 2, f"Expected 2 hits, got {stats['hits']}"
+    assert stats["errors"] == 0, f"Backend reported {stats['errors']} errors"
+
+
+async def check_eviction(cache):
+    """Cache must be built with max_entries=2."""
+    await cache.set("first", 1)
+    await cache.set("second", 2)
+    await cache.get("first")  # "second" is now least recently used
+    await cache.set("third", 3)
+    assert await cache.get("second") is None, "Least recently used entry was not evicted"
+    assert (await cache.get("first"))[0] == 1, "Recently used entry was evicted"
+    assert (await cache.get("third"))[0] == 3, "Newest entry was evicted"
+
+
+async def check_corrupt(cache, write_raw, entries):
+    """``write_raw(key, text)`` stores each of ``entries`` (key, text), bypassing the cache."""
+    for key, raw in entries:
+        await write_raw(key, raw)
+        assert await cache.get(key) is None, f"Unreadable {key} entry was returned"
+    stats = await cache.stats()
+    assert stats["errors"] == 2, f"Expected 2 decode errors, got {stats['errors']}"
+    assert stats["misses"] == 2, f"Unreadable entries were not counted as misses: {stats['misses']}"
+
+
+def test_memory_cache():
+    """LRUTTLCache: basics, TTL and LRU eviction"""
+    asyncio.run(check_basics(LRUTTLCache("test", ttl_seconds=TTL_SECONDS)))
+    asyncio.run(check_eviction(LRUTTLCache("test", max_entries=2, ttl_seconds=60)))
+    print("✅ memory backend")
+
+
+def test_sqlite_cache():
+    """SQLiteCache: basics, TTL and LRU eviction on a temporary file"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "cache.sqlite3")
+
+        async def run():
+            cache = SQLiteCache(path, "basics", ttl_seconds=TTL_SECONDS)
+            try:
+                await check_basics(cache)
+            finally:
+                await cache.close()
+            cache = SQLiteCache(path, "eviction", max_entries=2, ttl_seconds=60)
+            try:
+                await check_eviction(cache)
+            finally:
+                await cache.close()
+            cache = SQLiteCache(path, "corrupt", ttl_seconds=60)
+
+            async def write_raw(key, raw):
+                cache._db.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?, ?)",
+                                  ("corrupt", key, raw, len(raw), time.time(), time.time()))
+
+            try:
+                await check_corrupt(cache, write_raw, [("garbage", "not json {"), ("truncated", '{"value": ')])
+                assert (await cache.stats())["entries"] == 0, "Unreadable SQLite rows were not deleted"
+            finally:
+                await cache.close()
+
+        asyncio.run(run())
+    print("✅ sqlite backend")
+
+
+def test_redis_cache():
+    """RedisCache: basics and TTL against the local Redis stand-in"""
+    if not REDIS_AVAILABLE:
+        print("⏭️  redis backend skipped (pip install redis)")
+        return
+
+    async def run():
+        stub = await start_redis_stub()
+        cache = RedisCache.from_url(stub.url, "test", ttl_seconds=TTL_SECONDS)
+        corrupt = RedisCache.from_url(stub.url, "corrupt", ttl_seconds=60)
+
+        async def write_raw(key, raw):
+            stub.execute([b"SET", f"rikstoto:corrupt:{key}".encode(), raw.encode()])
+
+        try:
+            await check_basics(cache)
+            await check_corrupt(corrupt, write_raw, [("garbage", "not json {"), ("foreign", '{"unexpected": 1}')])
+            assert stub.execute([b"DBSIZE"]) == b":0\r\n", "Unreadable Redis values were not deleted"
+        finally:
+            await cache.close()
+            await corrupt.close()
+            stub.server.close()
+            await stub.server.wait_closed()
+
+    asyncio.run(run())
+    print("✅ redis backend (stub)")
+
+
+if __name__ == "__main__":
+    print("🗄️  Cache backend test\n")
+    try:
+        test_memory_cache()
+        test_sqlite_cache()
+        test_redis_cache()
+    except AssertionError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
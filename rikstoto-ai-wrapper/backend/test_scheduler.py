@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Check that the generation scheduler never leaks slots to cancelled waiters
+
+Holds the only slot, queues a second call, then releases the slot and
+cancels the queued call in the same tick - the window in which the
+cancelled waiter is still queued. The releasing call must finish cleanly
+and the slot must come back. Needs no API keys or running server.
+
+Usage: python test_scheduler.py
+"""
+
+import asyncio
+import sys
+
+from scheduler import GenerationScheduler
+
+
+async def cancel_while_releasing():
+    scheduler = GenerationScheduler(max_concurrency=1)
+    release = asyncio.Event()
+
+    async def hold():
+        await release.wait()
+        return "done"
+
+    holder = asyncio.create_task(scheduler.run("holder", "mistral", hold))
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(scheduler.run("waiter", "mistral", hold))
+    await asyncio.sleep(0)
+    assert scheduler.stats()["queue_depth"] == 1, "Second call was not queued"
+
+    release.set()
+    waiter.cancel()
+    results = await asyncio.gather(holder, waiter, return_exceptions=True)
+
+    assert results[0] == "done", f"Releasing call failed: {results[0]!r}"
+    assert isinstance(results[1], asyncio.CancelledError), f"Queued call was not cancelled: {results[1]!r}"
+    stats = scheduler.stats()
+    assert stats["running"] == 0, f"Slot leaked: {stats['running']} running with nothing in flight"
+    assert stats["queue_depth"] == 0, f"{stats['queue_depth']} waiters left queued"
+
+    # The freed slot must still be usable
+    assert await asyncio.wait_for(scheduler.run("next", "mistral", lambda: asyncio.sleep(0, "ok")), 1) == "ok"
+
+
+def test_cancel_while_releasing():
+    """Cancel a queued call in the same tick its slot is released"""
+    asyncio.run(cancel_while_releasing())
+    print("✅ Cancelled waiter skipped, slot returned")
+
+
+if __name__ == "__main__":
+    print("🚦 Scheduler cancellation test\n")
+    try:
+        test_cancel_while_releasing()
+    except AssertionError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Check that seeded test coupon generation is deterministic under concurrency
+
+Runs /api/generate-json's generator for many seeds at once (interleaved on
+the event loop and on worker threads) and compares every coupon with one
+generated alone. Also checks that generation leaves the global ``random``
+state alone, and that the bulk generator gives the same coupons however
+they are split across threads. Needs no API keys or running server.
+
+Usage: python test_seed_determinism.py
+"""
+
+import asyncio
+import random
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+from main import JsonGeneratorRequest, build_test_json, generate_test_json
+from coupons import generate_coupons
+
+SEEDS = list(range(1, 41))
+PRODUCTS = ["V75", "V64", "V5", "DD", "Stalltips"]
+SCENARIOS = ["favorites", "upsets", "mixed", "custom"]
+
+
+def make_request(seed):
+    return JsonGeneratorRequest(seed=seed, product=PRODUCTS[seed % len(PRODUCTS)],
+                                scenario=SCENARIOS[seed % len(SCENARIOS)], desired_correct=seed % 5)
+
+
+def comparable(coupon):
+    """The coupon without its only non-seeded field, the bet timestamp."""
+    coupon["betDetails"].pop("timestamp", None)
+    return coupon
+
+
+def check(name, expected, actual):
+    mismatches = [seed for seed, coupon in zip(SEEDS * 5, actual) if coupon != expected[seed]]
+    assert not mismatches, \
+        f"{name}: {len(mismatches)} of {len(actual)} coupons differ (seeds {sorted(set(mismatches))[:10]})"
+    print(f"✅ {name}: {len(actual)} coupons identical")
+
+
+async def generate_concurrently():
+    requests = [make_request(seed) for seed in SEEDS * 5]
+    return [comparable(c) for c in await asyncio.gather(*(generate_test_json(r) for r in requests))]
+
+
+def test_seed_determinism():
+    """Generate every seed alone, then concurrently, and compare"""
+    expected = {seed: comparable(build_test_json(make_request(seed))) for seed in SEEDS}
+
+    assert len({str(c) for c in expected.values()}) == len(SEEDS), "Different seeds gave identical coupons"
+
+    check("asyncio.gather", expected, asyncio.run(generate_concurrently()))
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        threaded = list(pool.map(lambda seed: comparable(build_test_json(make_request(seed))), SEEDS * 5))
+    check("8 worker threads", expected, threaded)
+
+    state = random.getstate()
+    build_test_json(JsonGeneratorRequest(seed=123))
+    build_test_json(JsonGeneratorRequest())
+    assert random.getstate() == state, "Generation changed the global random state"
+    print("✅ Global random state untouched")
+
+    base_date = date(2026, 1, 1)
+    whole = generate_coupons(1000, 42, base_date=base_date)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        parts = pool.map(lambda start: generate_coupons(100, 42, start=start, base_date=base_date),
+                         range(0, 1000, 100))
+    split = [coupon for part in parts for coupon in part]
+    assert split == whole, "Bulk generator: coupons differ when split across threads"
+    print("✅ Bulk generator: 1000 coupons identical when split across threads")
+
+
+if __name__ == "__main__":
+    print("🎲 Seeded generation determinism test\n")
+    try:
+        test_seed_determinism()
+    except AssertionError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
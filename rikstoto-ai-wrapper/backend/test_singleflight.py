@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Check that coalesced generations give their scheduler slot back
+
+Runs hanging upstream calls through SingleFlight and the scheduler, the
+way /generate does, and times the callers out. Once nobody waits on a
+call any more it must be cancelled and its slot freed; a call that still
+has a waiter must keep running. Needs no API keys or running server.
+
+Usage: python test_singleflight.py
+"""
+
+import asyncio
+import sys
+
+from scheduler import GenerationScheduler
+from singleflight import SingleFlight
+
+
+async def timed_out_calls_release_slots():
+    scheduler = GenerationScheduler(max_concurrency=2)
+    flights = SingleFlight()
+    hang = asyncio.Event()
+
+    def generate(key):
+        return flights.do(key, lambda: scheduler.run(key, "azure_openai", hang.wait))
+
+    # Three distinct calls against two slots: two run, one queues
+    results = await asyncio.gather(*(asyncio.wait_for(generate(f"key-{i}"), 0.1) for i in range(3)),
+                                   return_exceptions=True)
+    assert all(isinstance(r, asyncio.TimeoutError) for r in results), f"Calls did not time out: {results!r}"
+    await asyncio.sleep(0)
+
+    assert flights.stats()["in_flight"] == 0, f"{flights.stats()['in_flight']} abandoned flights still running"
+    stats = scheduler.stats()
+    assert stats["running"] == 0, f"{stats['running']} slots still held by timed-out calls"
+    assert stats["queue_depth"] == 0, f"{stats['queue_depth']} timed-out calls still queued"
+
+    # A fresh call gets a slot straight away
+    hang.set()
+    result, _ = await asyncio.wait_for(generate("fresh"), 1)
+    assert result is True, f"Fresh call returned {result!r}"
+
+
+async def remaining_waiter_keeps_call():
+    flights = SingleFlight()
+    release = asyncio.Event()
+
+    async def call():
+        await release.wait()
+        return "shared result"
+
+    first = asyncio.create_task(flights.do("key", call))
+    second = asyncio.create_task(flights.do("key", call))
+    await asyncio.sleep(0)
+    first.cancel()
+    await asyncio.sleep(0)
+    release.set()
+
+    result, shared = await second
+    assert result == "shared result" and shared, f"Remaining waiter got {result!r}, shared={shared}"
+    assert flights.stats()["in_flight"] == 0, "Finished flight was not removed"
+
+
+def test_timed_out_calls_release_slots():
+    """Time out every caller; their calls must be cancelled and slots freed"""
+    asyncio.run(timed_out_calls_release_slots())
+    print("✅ Abandoned flights cancelled, slots returned")
+
+
+def test_remaining_waiter_keeps_call():
+    """Cancel one of two waiters; the call must finish for the other"""
+    asyncio.run(remaining_waiter_keeps_call())
+    print("✅ Shared call kept for the remaining waiter")
+
+
+if __name__ == "__main__":
+    print("🛬 Single-flight cancellation test\n")
+    try:
+        test_timed_out_calls_release_slots()
+        test_remaining_waiter_keeps_call()
+    except AssertionError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
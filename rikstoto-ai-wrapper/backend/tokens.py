@@ -0,0 +1,191 @@
+"""
+Offline token counting and pre-flight estimates for the Rikstoto AI backend.
+
+Each model is mapped to a local tokenizer: OpenAI models use their own
+tiktoken encoding (o200k_base); Mistral, Claude and Gemini have no public
+offline tokenizer and are approximated with cl100k_base. Counts are cached
+by prompt digest, so the same prompt is only tokenized once per encoding.
+
+If tiktoken or its encoding files are not available (the files are
+downloaded on first use unless TIKTOKEN_CACHE_DIR points at a pre-filled
+cache, as in the Dockerfiles), counts fall back to a characters-per-token
+heuristic and are reported with ``tokenizer: "heuristic"``.
+
+Pre-flight estimates combine the token counts with list prices, context
+windows and typical latency per model. They never call an upstream API.
+
+Configuration via environment variables:
+    TOKEN_COUNT_CACHE_SIZE: Max cached token counts (default: 4096)
+    EXPECTED_OUTPUT_TOKENS: Typical answer length used for estimates (default: 600)
+"""
+
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    tiktoken = None
+    TIKTOKEN_AVAILABLE = False
+
+DEFAULT_ENCODING = "o200k_base"
+
+# Tokenizer per model; non-OpenAI models are approximated
+MODEL_ENCODINGS = {
+    "gpt-4o": "o200k_base",
+    "gpt-4o-mini": "o200k_base",
+    "o3-mini": "o200k_base",
+    "mistral-large": "cl100k_base",
+    "claude-3-5-sonnet": "cl100k_base",
+    "gemini-1-5-flash": "cl100k_base",
+}
+
+# Every encoding a model may be counted with
+ENCODINGS = tuple(sorted(set(MODEL_ENCODINGS.values()) | {DEFAULT_ENCODING}))
+
+# Characters per token when no tokenizer is available (Norwegian text + JSON)
+HEURISTIC_CHARS_PER_TOKEN = 3.6
+
+# Per-model cost and speed profile:
+#   input/output: list price in USD per 1M tokens
+#   context: context window in tokens
+#   ttft: typical seconds to first token
+#   tps: typical output tokens per second
+#   reasoning: hidden reasoning tokens (o3 models), billed as output and
+#              counted against max_tokens
+MODEL_PROFILES: Dict[str, Dict[str, float]] = {
+    "gpt-4o": {"input": 2.50, "output": 10.00, "context": 128000, "ttft": 0.6, "tps": 80},
+    "gpt-4o-mini": {"input": 0.15, "output": 0.60, "context": 128000, "ttft": 0.5, "tps": 110},
+    "o3-mini": {"input": 1.10, "output": 4.40, "context": 200000, "ttft": 4.0, "tps": 150, "reasoning": 1500},
+    "mistral-large": {"input": 2.00, "output": 6.00, "context": 128000, "ttft": 0.8, "tps": 45},
+    "claude-3-5-sonnet": {"input": 3.00, "output": 15.00, "context": 200000, "ttft": 1.0, "tps": 60},
+    "gemini-1-5-flash": {"input": 0.075, "output": 0.30, "context": 1000000, "ttft": 0.5, "tps": 150},
+}
+DEFAULT_PROFILE = {"input": 0.0, "output": 0.0, "context": 4096, "ttft": 2.0, "tps": 30}
+
+
+def encoding_for(model_name: Optional[str]) -> str:
+    """Name of the tiktoken encoding a model is counted with."""
+    return MODEL_ENCODINGS.get(model_name or "", DEFAULT_ENCODING)
+
+
+class TokenCounter:
+    """Count tokens with a local tokenizer per model, cached by prompt digest."""
+
+    def __init__(self, cache_size: int = 4096):
+        self.cache_size = cache_size
+        self._encodings: Dict[str, Any] = {}
+        self._failed: set = set()
+        self._cache: "OrderedDict[Tuple[str, str], int]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls) -> "TokenCounter":
+        return cls(cache_size=int(os.getenv("TOKEN_COUNT_CACHE_SIZE", "4096")))
+
+    def _encoding(self, name: str) -> Optional[Any]:
+        """Load a tiktoken encoding once; None if it can't be loaded offline."""
+        if name in self._encodings:
+            return self._encodings[name]
+        if not TIKTOKEN_AVAILABLE or name in self._failed:
+            return None
+        try:
+            encoding = tiktoken.get_encoding(name)
+        except Exception as e:
+            self._failed.add(name)
+            print(f"⚠️ Tokenizer {name} unavailable, using heuristic token counts: {e}")
+            return None
+        self._encodings[name] = encoding
+        return encoding
+
+    def warm(self) -> None:
+        """Load every encoding now (blocking: may download the files on first use)."""
+        for name in ENCODINGS:
+            self._encoding(name)
+
+    def tokenizer_for(self, model_name: Optional[str]) -> str:
+        """Name of the tokenizer used for a model ("heuristic" if none can be loaded)."""
+        name = encoding_for(model_name)
+        return name if self._encoding(name) is not None else "heuristic"
+
+    def count(self, text: str, model_name: Optional[str] = None, encoding: Optional[str] = None) -> int:
+        """Number of tokens ``text`` takes for ``model_name`` (default tokenizer if None).
+
+        ``encoding`` names the tokenizer directly, overriding ``model_name``.
+        """
+        if not text:
+            return 0
+        name = encoding or encoding_for(model_name)
+        key = (name, hashlib.sha256(text.encode()).hexdigest())
+        tokens = self._cache.get(key)
+        if tokens is not None:
+            self.hits += 1
+            self._cache.move_to_end(key)
+            return tokens
+        self.misses += 1
+        encoding = self._encoding(name)
+        if encoding is not None:
+            tokens = len(encoding.encode(text, disallowed_special=()))
+        else:
+            tokens = int(len(text) / HEURISTIC_CHARS_PER_TOKEN) + 1
+        self._cache[key] = tokens
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return tokens
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache usage and which tokenizers are loaded."""
+        return {
+            "cached_counts": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "tokenizers_loaded": sorted(self._encodings),
+            "tokenizers_unavailable": sorted(self._failed)
+        }
+
+
+token_counter = TokenCounter.from_env()
+
+
+def count_tokens(text: str, model_name: Optional[str] = None, encoding: Optional[str] = None) -> int:
+    """Count tokens with the shared counter."""
+    return token_counter.count(text, model_name, encoding)
+
+
+def estimate_generation(model_name: str, prompt: str, max_tokens: int) -> Dict[str, Any]:
+    """Pre-flight estimate for one generation, without calling the model.
+
+    Args:
+        model_name: Model to estimate for
+        prompt: Fully rendered prompt
+        max_tokens: Output token cap that will be sent
+
+    Returns:
+        Dictionary with input/output tokens, cost in USD, expected latency in
+        seconds, and flags for output truncation and context overflow
+    """
+    profile = MODEL_PROFILES.get(model_name, DEFAULT_PROFILE)
+    input_tokens = count_tokens(prompt, model_name)
+    expected_output = int(os.getenv("EXPECTED_OUTPUT_TOKENS", "600"))
+    output_tokens = min(expected_output, max_tokens)
+    reasoning_tokens = int(profile.get("reasoning", 0))
+    completion_tokens = expected_output + reasoning_tokens
+    billed_output = min(completion_tokens, max_tokens)
+    cost = (input_tokens * profile["input"] + billed_output * profile["output"]) / 1_000_000
+    latency = profile["ttft"] + billed_output / profile["tps"]
+    return {
+        "model_name": model_name,
+        "tokenizer": token_counter.tokenizer_for(model_name),
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "reasoning_tokens": reasoning_tokens,
+        "max_tokens": max_tokens,
+        "estimated_cost_usd": round(cost, 6),
+        "expected_latency_seconds": round(latency, 2),
+        "may_truncate": completion_tokens > max_tokens,
+        "exceeds_context": input_tokens + max_tokens > profile["context"]
+    }
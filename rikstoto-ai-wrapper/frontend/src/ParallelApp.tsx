@@ -192,28 +192,60 @@ function ParallelApp() {
       // Prepare JSON and get session ID
       const sid = await handlePrepareJSON();
       
+      // Skip models whose provider is failing fast (circuit breaker open)
+      const health = await axios.get(`${API_URL}/health`).catch(() => null);
+      const modelsAvailable: Record<string, boolean> = health?.data?.models_available || {};
+
       // Prepare model configurations for API
       const modelConfigsList = Object.values(modelConfigs).map(config => ({
         name: config.name,
-        enabled: config.enabled,
+        enabled: config.enabled && modelsAvailable[config.name] !== false,
         system_prompt: config.system_prompt,
         temperature: config.temperature,
         max_length: config.max_length,
         top_p: config.top_p
       }));
       
-      // Call parallel generation endpoint
-      const response = await axios.post(`${API_URL}/generate-all`, {
-        models: modelConfigsList,
-        json_data: jsonInput,
-        session_id: sid,
-        use_cache: true
+      // Call streaming parallel generation endpoint - results arrive as each model finishes
+      const response = await fetch(`${API_URL}/generate-all/stream?format=ndjson`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+          models: modelConfigsList,
+          json_data: jsonInput,
+          session_id: sid,
+          use_cache: true
+        })
       });
-      
-      setResults(response.data.results);
-      setTotalTime(response.data.total_time);
+
+      if (!response.ok || !response.body) {
+        const body = await response.json().catch(() => ({}));
+        setError(body.detail || 'Generation failed');
+        return;
+      }
+
+      // Read NDJSON frames: one "result" per model, then a final "summary"
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop() || '';
+        for (const line of lines) {
+          if (!line.trim()) continue;
+          const frame = JSON.parse(line);
+          if (frame.type === 'result') {
+            setResults(prev => [...prev, frame.result as ModelResult]);
+          } else if (frame.type === 'summary') {
+            setTotalTime(frame.total_time);
+          }
+        }
+      }
     } catch (err: any) {
-      setError(err.response?.data?.detail || 'Generation failed');
+      setError(err.response?.data?.detail || err.message || 'Generation failed');
     } finally {
       setLoading(false);
     }
@@ -592,7 +624,7 @@ function ParallelApp() {
               <Box sx={{ mt: 4 }}>
                 <LinearProgress />
                 <Typography align="center" sx={{ mt: 2 }}>
-                  Running {enabledCount} models in parallel...
+                  Running {enabledCount} models in parallel... ({results.length}/{enabledCount} done)
                 </Typography>
               </Box>
             )}
@@ -13,7 +13,6 @@ import {
   Casino,
   AutoAwesome
 } from '@mui/icons-material';
-import axios from 'axios';
 
 interface RikstotoInnsiktCardProps {
   raceData?: any;
@@ -93,48 +92,72 @@ Vær positiv og konstruktiv. Bruk spillerens faktiske resultater fra dataene.`;
       // Increase timeout for O3 models which have longer reasoning time
       const timeoutMs = modelName.includes('o3') ? 120000 : 30000; // 2 min for O3, 30s for others
       
-      const response = await axios.post(`${API_URL}/generate`, {
-        model_name: modelName,
-        system_prompt: fullPrompt,
-        user_prompt: "Analyser V75-resultatene",
-        temperature: 0.7,
-        max_length: 1000,  // Increased to allow for 200-350 word responses
-        use_cache: !skipCache // Disable cache when regenerating
-      }, {
-        timeout: timeoutMs // Add timeout configuration
+      const controller = new AbortController();
+      const timeout = setTimeout(() => controller.abort(), timeoutMs);
+      
+      // Stream the analysis so text appears as the model writes it
+      const response = await fetch(`${API_URL}/generate/stream?format=ndjson`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+          model_name: modelName,
+          system_prompt: fullPrompt,
+          user_prompt: "Analyser V75-resultatene",
+          temperature: 0.7,
+          max_length: 1000,  // Increased to allow for 200-350 word responses
+          use_cache: !skipCache // Disable cache when regenerating
+        }),
+        signal: controller.signal
       });
-
-      console.log('AI Response:', response.data); // Debug log
-      console.log('Response text length:', response.data.generated_text?.length); // Check actual length
-      console.log('Full response text:', response.data.generated_text); // Log full text to check for truncation
       
-      // Ensure minimum loading time for better UX
-      const startTime = Date.now();
+      if (!response.ok || !response.body) {
+        clearTimeout(timeout);
+        const body = await response.json().catch(() => ({}));
+        setAiAnalysis(`Feil: ${body.detail || response.statusText}\n\nPrøv igjen eller velg en annen modell.`);
+        return;
+      }
       
-      if (response.data.generated_text) {
-        setAiAnalysis(response.data.generated_text);
-        
-        // Wait remaining time if response was too quick (minimum 1 second)
-        const elapsedTime = Date.now() - startTime;
-        const minLoadingTime = 1000;
-        if (elapsedTime < minLoadingTime) {
-          await new Promise(resolve => setTimeout(resolve, minLoadingTime - elapsedTime));
+      // Read NDJSON frames: "delta" text chunks, then "done" (or "error")
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let text = '';
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop() || '';
+        for (const line of lines) {
+          if (!line.trim()) continue;
+          const frame = JSON.parse(line);
+          if (frame.type === 'delta') {
+            text += frame.text;
+            setAiAnalysis(text);
+            setLoading(false); // Show text as soon as the first tokens arrive
+          } else if (frame.type === 'done') {
+            console.log('AI Response metadata:', frame); // Debug log
+            console.log('Response text length:', frame.response_length); // Check actual length
+          } else if (frame.type === 'error') {
+            console.error('API error:', frame.detail);
+            // Show error message instead of default analysis
+            setAiAnalysis(`Feil ved analyse: ${frame.detail}\n\nPrøv igjen eller velg en annen modell.`);
+          }
         }
-      } else if (response.data.error) {
-        console.error('API error:', response.data.error);
-        // Show error message instead of default analysis
-        setAiAnalysis(`Feil ved analyse: ${response.data.error}\n\nPrøv igjen eller velg en annen modell.`);
-      } else {
+      }
+      clearTimeout(timeout);
+      
+      if (!text) {
         // Fallback text if AI is not available
-        console.log('No generated_text in response, using default');
-        setAiAnalysis(getDefaultAnalysis());
+        console.log('No generated text in response, using default');
+        setAiAnalysis(prev => prev || getDefaultAnalysis());
       }
     } catch (error: any) {
       console.error('AI analysis error:', error);
       
       // More informative error handling
-      if (error.response?.data?.detail) {
-        setAiAnalysis(`Feil: ${error.response.data.detail}\n\nPrøv igjen eller velg en annen modell.`);
+      if (error.name === 'AbortError') {
+        setAiAnalysis(`Tidsavbrudd: modellen brukte for lang tid.\n\nPrøv igjen eller velg en annen modell.`);
       } else if (error.message) {
         setAiAnalysis(`Nettverksfeil: ${error.message}\n\nSjekk at backend kjører og prøv igjen.`);
       } else {